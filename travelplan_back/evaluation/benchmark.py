@@ -0,0 +1,248 @@
+# evaluation/benchmark.py
+
+import asyncio
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+from pathlib import Path
+import django
+django.setup()
+
+import numpy as np
+from evaluation.benchmark_routing import DAY_SIZES, build_day, build_route
+from evaluation.benchmark_startup import benchmark_startup
+from evaluation.test_data import TestDataGenerator
+from travelplan.services.clustering import preprocess_places, hierarchical_clustering
+from travelplan.services.routing import optimize_day_route, generate_day_schedule
+from travelplan.services.schedule_service import ScheduleService
+from travelplan.services.utils import calculate_distance_matrix, haversine_distance
+
+# 整体流程的测试规模：(景点数, 餐厅数, 天数)，每天约3-4个地点
+PIPELINE_SIZES = {
+    'small': (6, 3, 2),
+    'medium': (12, 5, 4),
+    'large': (20, 8, 7)
+}
+
+DEFAULT_OUTPUT_DIR = Path("evaluation/benchmark_results")
+DEFAULT_BASELINE = Path("evaluation/benchmark_baseline.json")
+DEFAULT_THRESHOLD = 0.2  # 比基准慢20%以上视为性能回退
+
+def build_scenario(num_attractions: int, num_restaurants: int, city: str = 'Paris', seed: int = 42):
+    """生成固定随机种子的原始地点数据"""
+    random.seed(seed)
+    return TestDataGenerator().generate_test_scenario(city, num_attractions, num_restaurants)
+
+def time_call(func, repeat: int, number: int) -> dict:
+    """多次计时，返回每次调用的耗时统计（毫秒）"""
+    func()  # 预热，避免首次调用的缓存和导入开销计入结果
+    timings = [t / number * 1000 for t in timeit.Timer(func).repeat(repeat=repeat, number=number)]
+    return {
+        'best_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'repeat': repeat,
+        'number': number
+    }
+
+def benchmark_pipeline_stages(repeat: int = 5, number: int = 10) -> dict:
+    """对预处理、距离矩阵、聚类和完整行程生成进行计时"""
+    results = {}
+    service = ScheduleService()
+    loop = asyncio.new_event_loop()
+    try:
+        for name, (num_attractions, num_restaurants, num_days) in PIPELINE_SIZES.items():
+            raw_places = build_scenario(num_attractions, num_restaurants)
+            places, hotel = preprocess_places(raw_places)
+            all_places = [hotel] + places
+            start_date = '2024-01-01'
+            end_date = f'2024-01-{num_days:02d}'
+
+            result = loop.run_until_complete(
+                service.generate_schedule(raw_places, start_date, end_date, 'walking')
+            )
+            if not result['success']:
+                print(f"Warning: generate_schedule failed for {name}: {result.get('error')}")
+
+            stages = {
+                'preprocess_places': lambda: preprocess_places(raw_places),
+                'calculate_distance_matrix': lambda: calculate_distance_matrix(all_places, 'walking'),
+                'hierarchical_clustering': lambda: hierarchical_clustering(places, num_days, 'walking'),
+                'generate_schedule': lambda: loop.run_until_complete(
+                    service.generate_schedule(raw_places, start_date, end_date, 'walking')
+                )
+            }
+            for stage, func in stages.items():
+                key = f"{stage}[{name}]"
+                results[key] = time_call(func, repeat, number)
+                print(f"{key:<42} {results[key]['best_ms']:9.3f} ms")
+    finally:
+        loop.close()
+    return results
+
+def benchmark_day_stages(sizes=DAY_SIZES, repeat: int = 5, number: int = 10) -> dict:
+    """对单日路线优化和日程生成进行计时"""
+    results = {}
+    for size in sizes:
+        places, hotel, distance_matrix = build_day(size)
+        route, route_matrix, route_time_matrix = build_route(size)
+        stages = {
+            'optimize_day_route': lambda: optimize_day_route(places, hotel, distance_matrix, 'walking'),
+            'generate_day_schedule': lambda: generate_day_schedule(
+                route, route_matrix, route_time_matrix, 'walking', 0
+            )
+        }
+        for stage, func in stages.items():
+            key = f"{stage}[{size}]"
+            results[key] = time_call(func, repeat, number)
+            print(f"{key:<42} {results[key]['best_ms']:9.3f} ms")
+    return results
+
+def route_distance_km(clusters: list, hotel: dict) -> float:
+    """按schedule_service的流程优化每天的路线，返回各天相邻地点间的总距离（公里，不含往返酒店）"""
+    total = 0.0
+    for cluster in clusters:
+        if not cluster:
+            continue
+        distance_matrix, _ = calculate_distance_matrix(cluster, 'walking')
+        route, _ = optimize_day_route(cluster, hotel, distance_matrix, 'walking')
+        stops = [event['place'] for event in route if not event['place'].get('is_hotel', False)]
+        for current, following in zip(stops, stops[1:]):
+            total += haversine_distance(
+                current['location']['lat'], current['location']['lng'],
+                following['location']['lat'], following['location']['lng']
+            )
+    return total / 1000
+
+def benchmark_restaurant_assignment() -> dict:
+    """比较原有的餐厅交替分配和按距离指派时每天路线的总距离"""
+    results = {}
+    for name, (num_attractions, num_restaurants, num_days) in PIPELINE_SIZES.items():
+        places, hotel = preprocess_places(build_scenario(num_attractions, num_restaurants))
+        distances = {
+            strategy: route_distance_km(
+                hierarchical_clustering(places, num_days, 'walking', restaurant_assignment=strategy),
+                hotel
+            )
+            for strategy in ('alternating', 'proximity')
+        }
+        results[name] = distances
+        key = f"route_distance[{name}]"
+        print(f"{key:<42} {distances['alternating']:9.2f} -> {distances['proximity']:9.2f} km "
+              f"(alternating -> proximity)")
+    return results
+
+def machine_metadata() -> dict:
+    """记录运行环境，便于比较不同机器上的结果"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': commit,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'django': django.get_version()
+    }
+
+def run_benchmarks(repeat: int = 5, number: int = 10) -> dict:
+    """运行全部基准测试"""
+    results = {}
+    results.update(benchmark_pipeline_stages(repeat=repeat, number=number))
+    results.update(benchmark_day_stages(repeat=repeat, number=number))
+    results['worker_startup'], _ = benchmark_startup(runs=repeat)
+    print(f"{'worker_startup':<42} {results['worker_startup']['best_ms']:9.3f} ms")
+    return {
+        'metadata': machine_metadata(),
+        'results': results,
+        # 距离不是耗时，不参与与基准的比较
+        'route_distance_km': benchmark_restaurant_assignment()
+    }
+
+def compare_with_baseline(report: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """与基准结果比较（按最佳耗时），返回超过阈值的回退项"""
+    regressions = []
+    print(f"\nComparison with baseline from {baseline['metadata'].get('timestamp')} "
+          f"({baseline['metadata'].get('git_commit')}):")
+    for key, current in report['results'].items():
+        reference = baseline['results'].get(key)
+        if reference is None:
+            print(f"  {key:<42} (no baseline)")
+            continue
+
+        ratio = current['best_ms'] / reference['best_ms'] if reference['best_ms'] else float('inf')
+        flag = ''
+        if ratio > 1 + threshold:
+            flag = '  REGRESSION'
+            regressions.append({
+                'benchmark': key,
+                'baseline_ms': reference['best_ms'],
+                'current_ms': current['best_ms'],
+                'ratio': ratio
+            })
+        print(f"  {key:<42} {reference['best_ms']:9.3f} -> {current['best_ms']:9.3f} ms "
+              f"({ratio:5.2f}x){flag}")
+
+    if baseline['metadata'].get('machine') != report['metadata'].get('machine'):
+        print("Warning: baseline was recorded on a different machine type")
+    return regressions
+
+def save_report(report: dict, path: Path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults saved to {path}")
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Benchmark suite for the scheduling pipeline")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Number of timing repeats")
+    parser.add_argument("-n", "--number", type=int, default=10,
+                        help="Calls per timing repeat")
+    parser.add_argument("-o", "--output", type=Path,
+                        help="Path of the JSON results file (default: timestamped file in "
+                             f"{DEFAULT_OUTPUT_DIR})")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE,
+                        help="Baseline results to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown relative to the baseline before flagging a regression")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Store these results as the new baseline")
+    args = parser.parse_args()
+
+    # 日志输出会主导计时结果
+    logging.disable(logging.CRITICAL)
+
+    report = run_benchmarks(repeat=args.repeat, number=args.number)
+    output = args.output or DEFAULT_OUTPUT_DIR / f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json"
+    save_report(report, output)
+
+    if args.save_baseline:
+        save_report(report, args.baseline)
+    elif args.baseline.exists():
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+    else:
+        print(f"No baseline found at {args.baseline}; run with --save-baseline to create one")
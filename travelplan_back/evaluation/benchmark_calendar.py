@@ -0,0 +1,103 @@
+# evaluation/benchmark_calendar.py
+
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from evaluation.benchmark import time_call
+from evaluation.benchmark_serialization import build_response
+from travelplan.services.calendar_export import iter_calendar, normalize_trips
+
+NUM_EVENTS = 10000
+
+def build_events(num_events: int = NUM_EVENTS) -> list:
+    """将8天行程的地点事件按天数平移复制，直到达到num_events个可导出事件"""
+    template = [
+        event for event in build_response()['events']
+        if event.get('type') == 'place' and event.get('startTime')
+    ]
+    num_days = max(event['day'] for event in template) + 1
+    events = []
+    copy_index = 0
+    while len(events) < num_events:
+        for event in template[:num_events - len(events)]:
+            events.append({
+                **event,
+                'id': f"{event['id']}-{copy_index}",
+                'day': event['day'] + copy_index * num_days
+            })
+        copy_index += 1
+    return events
+
+def legacy_export(events: list) -> bytes:
+    """原export_calendar的实现：构建icalendar对象后一次性输出"""
+    from icalendar import Calendar, Event
+
+    cal = Calendar()
+    cal.add('prodid', '-//Trip Planner//TripSchedule//EN')
+    cal.add('version', '2.0')
+    for event in events:
+        if event.get('type') != 'place':
+            continue
+        cal_event = Event()
+        cal_event.add('summary', event['title'])
+        day_number = int(event['day'])
+        if event.get('startTime') and event.get('endTime'):
+            start_time = datetime.strptime(event['startTime'], '%I:%M %p')
+            end_time = datetime.strptime(event['endTime'], '%I:%M %p')
+            base_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            event_date = base_date + timedelta(days=day_number)
+            cal_event.add('dtstart', event_date.replace(hour=start_time.hour, minute=start_time.minute))
+            cal_event.add('dtend', event_date.replace(hour=end_time.hour, minute=end_time.minute))
+            if event.get('place'):
+                cal_event.add('location', event['place'].get('vicinity', ''))
+                cal_event.add('description', f"Rating: {event['place'].get('rating', 'N/A')}")
+            cal.add_component(cal_event)
+    return cal.to_ical()
+
+def streaming_export(events: list) -> bytes:
+    return b''.join(iter_calendar(normalize_trips({'events': events, 'startDate': '2024-01-01'})))
+
+def first_chunk_ms(events: list) -> float:
+    start = time.perf_counter()
+    next(iter_calendar(normalize_trips({'events': events, 'startDate': '2024-01-01'})))
+    return (time.perf_counter() - start) * 1000
+
+def peak_memory_kb(func, events: list) -> float:
+    """导出过程中的内存峰值（KB）；流式导出逐块丢弃，不保留整个文档"""
+    tracemalloc.start()
+    if func is streaming_export:
+        for _ in iter_calendar(normalize_trips({'events': events, 'startDate': '2024-01-01'})):
+            pass
+    else:
+        func(events)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+def benchmark_calendar(num_events: int = NUM_EVENTS, repeat: int = 3, number: int = 1) -> dict:
+    events = build_events(num_events)
+    results = {}
+    for name, func in [('icalendar', legacy_export), ('streaming', streaming_export)]:
+        key = f"export_calendar_{name}[{num_events}]"
+        results[key] = time_call(lambda: func(events), repeat, number)
+        results[key]['bytes'] = len(func(events))
+        results[key]['peak_memory_kb'] = peak_memory_kb(func, events)
+        print(f"{key:<40} {results[key]['best_ms']:9.1f} ms "
+              f"{results[key]['bytes']:>10} bytes  peak {results[key]['peak_memory_kb']:9.0f} KB")
+    print(f"Streaming time to first chunk: {first_chunk_ms(events):.2f} ms")
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Benchmark ICS calendar export")
+    parser.add_argument("-e", "--events", type=int, default=NUM_EVENTS,
+                        help="Number of exported events")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Number of timing repeats")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    benchmark_calendar(num_events=args.events, repeat=args.repeat)
@@ -0,0 +1,101 @@
+# evaluation/benchmark_routing.py
+
+import cProfile
+import pstats
+import random
+import timeit
+import django
+django.setup()
+
+from evaluation.test_data import TestDataGenerator
+from travelplan.services.clustering import preprocess_places
+from travelplan.services.routing import optimize_day_route, generate_day_schedule
+from travelplan.services.utils import calculate_distance_matrix
+
+DAY_SIZES = [8, 15, 30]
+
+def build_day(num_places: int, city: str = 'Paris', seed: int = 42):
+    """生成单日的测试数据（约三分之一为餐厅）"""
+    random.seed(seed)
+    generator = TestDataGenerator()
+    num_restaurants = max(2, num_places // 3)
+    raw_places = generator.generate_test_scenario(
+        city,
+        num_places - num_restaurants,
+        num_restaurants
+    )
+    places, hotel = preprocess_places(raw_places)
+    distance_matrix, _ = calculate_distance_matrix(places, 'walking', use_api=False)
+    return places, hotel, distance_matrix
+
+def benchmark_optimize_day_route(sizes=DAY_SIZES, repeat: int = 5, number: int = 20):
+    """对optimize_day_route进行微基准测试，返回每次调用的最佳耗时（毫秒）"""
+    results = {}
+    for size in sizes:
+        places, hotel, distance_matrix = build_day(size)
+        timer = timeit.Timer(
+            lambda: optimize_day_route(places, hotel, distance_matrix, 'walking')
+        )
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[size] = best * 1000
+        print(f"{size:>3} places/day: {results[size]:.3f} ms per optimize_day_route call")
+    return results
+
+def build_route(num_places: int):
+    """生成单日路线及对应的距离矩阵"""
+    places, hotel, distance_matrix = build_day(num_places)
+    route, _ = optimize_day_route(places, hotel, distance_matrix, 'walking')
+    route_matrix, route_time_matrix = calculate_distance_matrix(
+        [event['place'] for event in route],
+        'walking',
+        use_api=False
+    )
+    return route, route_matrix, route_time_matrix
+
+def benchmark_generate_day_schedule(sizes=DAY_SIZES, repeat: int = 5, number: int = 20):
+    """对generate_day_schedule进行微基准测试，返回每次调用的最佳耗时（毫秒）"""
+    results = {}
+    for size in sizes:
+        route, route_matrix, route_time_matrix = build_route(size)
+        timer = timeit.Timer(
+            lambda: generate_day_schedule(route, route_matrix, route_time_matrix, 'walking', 0)
+        )
+        best = min(timer.repeat(repeat=repeat, number=number)) / number
+        results[size] = best * 1000
+        print(f"{size:>3} places/day: {results[size]:.3f} ms per generate_day_schedule call")
+    return results
+
+def profile_scheduling(num_places: int = 30, calls: int = 200, limit: int = 15):
+    """用cProfile分析路线优化和日程生成的热点"""
+    places, hotel, distance_matrix = build_day(num_places)
+    route, route_matrix, route_time_matrix = build_route(num_places)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    for _ in range(calls):
+        optimize_day_route(places, hotel, distance_matrix, 'walking')
+        generate_day_schedule(route, route_matrix, route_time_matrix, 'walking', 0)
+    profiler.disable()
+
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(limit)
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Microbenchmark for optimize_day_route")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Number of timing repeats")
+    parser.add_argument("-n", "--number", type=int, default=20,
+                        help="Calls per timing repeat")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print a cProfile report for a 30-place day instead of timings")
+    args = parser.parse_args()
+
+    # 路由中的日志会主导计时结果
+    logging.disable(logging.CRITICAL)
+    if args.profile:
+        profile_scheduling()
+    else:
+        benchmark_optimize_day_route(repeat=args.repeat, number=args.number)
+        benchmark_generate_day_schedule(repeat=args.repeat, number=args.number)
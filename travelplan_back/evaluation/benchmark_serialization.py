@@ -0,0 +1,73 @@
+# evaluation/benchmark_serialization.py
+
+import asyncio
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from evaluation.benchmark import build_scenario, time_call
+from travelplan import responses
+from travelplan.services.schedule_service import ScheduleService
+
+# 8天、40个地点（24个景点、16家餐厅）的行程响应
+NUM_ATTRACTIONS = 24
+NUM_RESTAURANTS = 16
+START_DATE = '2024-01-01'
+END_DATE = '2024-01-08'
+
+def build_response() -> dict:
+    raw_places = build_scenario(NUM_ATTRACTIONS, NUM_RESTAURANTS, seed=0)
+    result = asyncio.run(ScheduleService().generate_schedule(raw_places, START_DATE, END_DATE, 'walking'))
+    if not result['success']:
+        raise RuntimeError(f"generate_schedule failed: {result.get('error')}")
+    return result
+
+def stdlib_dumps(data) -> bytes:
+    """JsonResponse的序列化方式"""
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+def table_format(result: dict) -> dict:
+    events, places = responses.dedupe_places(result['events'])
+    return {**result, 'events': events, 'places': places}
+
+def benchmark_serialization(repeat: int = 5, number: int = 50) -> dict:
+    """比较各序列化方式的编码耗时（含去重和压缩）和响应字节数"""
+    result = build_response()
+    encoders = {'stdlib': stdlib_dumps}
+    if responses.orjson is not None:
+        encoders['orjson'] = responses.dumps
+    encodings = [None, 'gzip'] + (['br'] if responses.brotli is not None else [])
+
+    print(f"Response: {len(result['events'])} events, "
+          f"{len({e['place'].get('place_id') for e in result['events'] if 'place' in e})} distinct places")
+    print(f"{'variant':<32} {'bytes':>9} {'encode ms':>10}")
+
+    results = {}
+    for encoder_name, encoder in encoders.items():
+        for places_format in responses.PLACES_FORMATS:
+            for encoding in encodings:
+                def encode():
+                    data = table_format(result) if places_format == 'table' else result
+                    content = encoder(data)
+                    return responses.compress(content, encoding) if encoding else content
+
+                key = f"{encoder_name}/{places_format}/{encoding or 'identity'}"
+                results[key] = time_call(encode, repeat, number)
+                results[key]['bytes'] = len(encode())
+                print(f"{key:<32} {results[key]['bytes']:>9} {results[key]['best_ms']:>10.3f}")
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Benchmark schedule response serialization")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="Number of timing repeats")
+    parser.add_argument("-n", "--number", type=int, default=50,
+                        help="Encodes per timing repeat")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    benchmark_serialization(repeat=args.repeat, number=args.number)
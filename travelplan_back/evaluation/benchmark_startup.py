@@ -0,0 +1,86 @@
+# evaluation/benchmark_startup.py
+
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# 模拟worker冷启动：初始化Django并加载URL配置（即所有视图和服务）
+STARTUP_CODE = "import django; django.setup(); import travelplan_back.urls"
+
+# 不应出现在启动路径上的重量级依赖
+LAZY_MODULES = ('scipy', 'sklearn', 'icalendar')
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """解析-X importtime的输出，返回 {模块名: (自身耗时us, 累计耗时us)}"""
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # 保留缩进（表示导入层级），顶层模块没有前导空格
+        modules[name[1:].rstrip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def measure_startup(code: str = STARTUP_CODE) -> Dict:
+    """在新的解释器中运行启动代码，返回总导入耗时（毫秒）和各模块耗时"""
+    env = dict(os.environ)
+    env.setdefault('DJANGO_SETTINGS_MODULE', 'travelplan_back.settings')
+    # 后台预热会有意导入scipy等模块，只测量导入本身的耗时（启动代码导入wsgi时也不预热）
+    env.setdefault('TRAVELPLAN_WARMUP', 'off')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        capture_output=True, text=True, env=env, check=True
+    )
+    modules = parse_importtime(result.stderr)
+    # 顶层导入的累计耗时之和即为全部导入耗时
+    total_us = sum(
+        cumulative for name, (_, cumulative) in modules.items()
+        if not name.startswith(' ')
+    )
+    return {'total_ms': total_us / 1000, 'modules': modules}
+
+def benchmark_startup(runs: int = 5) -> dict:
+    """多次测量冷启动的导入耗时，格式与benchmark.time_call一致"""
+    measurements = [measure_startup() for _ in range(runs)]
+    timings = [m['total_ms'] for m in measurements]
+    return {
+        'best_ms': min(timings),
+        'median_ms': statistics.median(timings),
+        'repeat': runs,
+        'number': 1
+    }, measurements[timings.index(min(timings))]['modules']
+
+def heaviest_imports(modules: Dict[str, Tuple[int, int]], limit: int = 15) -> List[Tuple[str, float]]:
+    """按自身耗时排序，返回最慢的模块（毫秒）"""
+    ranked = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)
+    return [(name.strip(), self_us / 1000) for name, (self_us, _) in ranked[:limit]]
+
+def eager_heavy_modules(modules: Dict[str, Tuple[int, int]]) -> List[str]:
+    """返回启动时被导入的重量级依赖（应延迟导入）"""
+    names = {name.strip().split('.')[0] for name in modules}
+    return [module for module in LAZY_MODULES if module in names]
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure worker cold-start import time")
+    parser.add_argument("-r", "--runs", type=int, default=5,
+                        help="Number of fresh interpreters to measure")
+    parser.add_argument("-l", "--limit", type=int, default=15,
+                        help="Number of slowest modules to list")
+    args = parser.parse_args()
+
+    result, modules = benchmark_startup(args.runs)
+    print(f"Worker startup imports: best {result['best_ms']:.1f} ms, "
+          f"median {result['median_ms']:.1f} ms over {args.runs} runs")
+
+    print("\nSlowest modules (self time):")
+    for name, ms in heaviest_imports(modules, args.limit):
+        print(f"  {name:<50} {ms:8.2f} ms")
+
+    eager = eager_heavy_modules(modules)
+    if eager:
+        print(f"\nWarning: heavy modules imported at startup: {', '.join(eager)}")
+        sys.exit(1)
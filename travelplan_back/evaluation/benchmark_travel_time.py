@@ -0,0 +1,121 @@
+# evaluation/benchmark_travel_time.py
+
+import tempfile
+import time
+from pathlib import Path
+import django
+django.setup()
+
+import numpy as np
+from evaluation.benchmark import build_scenario, time_call
+from travelplan.services.clustering import preprocess_places
+from travelplan.services.travel_time import HaversineProvider, RoadGraph, RoadGraphProvider
+from travelplan.services.utils import haversine_distance
+
+GRID_SIZE = 300  # 合成道路图为GRID_SIZE × GRID_SIZE的网格
+PLACE_COUNTS = [10, 30]
+PER_PAIR_MAX_PLACES = 10  # 逐对查询很慢，只在较小的规模上对照
+
+def build_grid_graph(center=(48.8566, 2.3522), size: int = GRID_SIZE, spacing: float = 0.0005,
+                     seed: int = 0) -> RoadGraph:
+    """生成覆盖城市中心的网格道路图，边长为直线距离乘以1.0-1.5的随机绕路系数"""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.meshgrid(np.arange(size), np.arange(size), indexing='ij')
+    offset = (size - 1) / 2
+    nodes = np.column_stack([
+        center[0] + (rows.ravel() - offset) * spacing,
+        center[1] + (cols.ravel() - offset) * spacing * 1.5
+    ])
+    ids = np.arange(size * size).reshape(size, size)
+    sources = np.concatenate([ids[:, :-1].ravel(), ids[:-1, :].ravel()])
+    targets = np.concatenate([ids[:, 1:].ravel(), ids[1:, :].ravel()])
+    lengths = haversine_distance(
+        nodes[sources, 0], nodes[sources, 1], nodes[targets, 0], nodes[targets, 1]
+    ) * rng.uniform(1.0, 1.5, len(sources))
+    return RoadGraph.from_edges(nodes, sources, targets, lengths, name='grid')
+
+def build_places(num_places: int) -> list:
+    """测试城市（巴黎）的酒店和地点"""
+    places, hotel = preprocess_places(build_scenario(num_places, 0))
+    return [hotel] + places[:num_places - 1]
+
+def per_pair_matrix(graph: RoadGraph, places: list):
+    """对照组：每对地点单独运行一次Dijkstra（相当于逐对调用路线API，不使用缓存）"""
+    from scipy.sparse.csgraph import dijkstra
+
+    node_ids, _ = graph.snap(
+        [p['location']['lat'] for p in places],
+        [p['location']['lng'] for p in places]
+    )
+    return [
+        [dijkstra(graph._csgraph, directed=True, indices=source)[target] for target in node_ids]
+        for source in node_ids
+    ]
+
+def uncached_matrix(provider: RoadGraphProvider, graph: RoadGraph, places: list):
+    graph.clear_cache()
+    return provider.matrix(places, 'walking')
+
+def unlimited_shortest_paths(graph: RoadGraph, places: list):
+    """对照组：不设limit，从每个源节点搜索整个道路图（matrix()按max_leg_distance限制搜索范围）"""
+    graph.clear_cache()
+    node_ids, _ = graph.snap(
+        [p['location']['lat'] for p in places],
+        [p['location']['lng'] for p in places]
+    )
+    return graph.shortest_paths(node_ids, node_ids)
+
+def benchmark_travel_time(place_counts=PLACE_COUNTS, repeat: int = 3, number: int = 1) -> dict:
+    results = {}
+    with tempfile.TemporaryDirectory() as graph_dir:
+        start = time.perf_counter()
+        graph = build_grid_graph()
+        graph.save(Path(graph_dir) / 'grid')
+        print(f"Built {len(graph)}-node grid graph in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        start = time.perf_counter()
+        provider = RoadGraphProvider(graph_dir)
+        loaded = provider.graph('grid')
+        print(f"Memory-mapped load:        {(time.perf_counter() - start) * 1000:9.2f} ms")
+        start = time.perf_counter()
+        loaded._ensure_indexes()
+        print(f"Index build (first query): {(time.perf_counter() - start) * 1000:9.2f} ms")
+
+        haversine = HaversineProvider()
+        for count in place_counts:
+            places = build_places(count)
+            # 网格覆盖约15 x 16公里，测试数据中的地点都在范围内
+            if provider.find_graph(places) is None:
+                print(f"Warning: places not covered by the grid graph ({count})")
+            stages = {
+                'haversine': lambda: haversine.matrix(places, 'walking'),
+                'road_graph_batched': lambda: uncached_matrix(provider, loaded, places),
+                # 约9万个节点的网格上，步行的limit（9公里）使30个地点的矩阵从约600 ms降到约300 ms
+                'road_graph_unlimited': lambda: unlimited_shortest_paths(loaded, places),
+                # 每天的矩阵是整个行程矩阵的子集，命中节点对缓存
+                'road_graph_cached': lambda: provider.matrix(places[:len(places) // 2], 'walking')
+            }
+            if count <= PER_PAIR_MAX_PLACES:
+                stages['road_graph_per_pair'] = lambda: per_pair_matrix(loaded, places)
+            for name, func in stages.items():
+                key = f"travel_time_{name}[{count}]"
+                results[key] = time_call(func, repeat, number)
+                print(f"{key:<42} {results[key]['best_ms']:9.2f} ms")
+
+            road, _ = provider.matrix(places, 'walking')
+            straight, _ = haversine.matrix(places, 'walking')
+            mask = straight > 0
+            print(f"  road / straight-line distance: median {np.median(road[mask] / straight[mask]):.2f}")
+    return results
+
+if __name__ == "__main__":
+    import argparse
+    import logging
+
+    parser = argparse.ArgumentParser(description="Benchmark travel time providers")
+    parser.add_argument("-r", "--repeat", type=int, default=3,
+                        help="Number of timing repeats")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    benchmark_travel_time(repeat=args.repeat)
@@ -1,7 +1,9 @@
 # evaluation/comprehensive_test.py
 
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple
 import asyncio
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from datetime import datetime, timedelta
 from evaluation.evaluate import EvaluationPipeline
 from evaluation.test_data import TestDataGenerator
@@ -10,68 +12,178 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 
+NUM_RANDOM_SOLUTIONS = 50
+
+async def evaluate_scenario(scenario: Dict) -> Dict:
+    """评估单个场景，返回完整的评估结果"""
+    pipeline = EvaluationPipeline(
+        places=scenario['places'],
+        start_date=scenario['start_date'],
+        end_date=scenario['end_date'],
+        transport_mode=scenario['transport_mode']
+    )
+    return await pipeline.evaluate(num_random_solutions=NUM_RANDOM_SOLUTIONS)
+
+def init_worker():
+    """进程池初始化：每个工作进程只做一次Django初始化"""
+    import django
+    django.setup()
+    # fork出的进程会继承父进程的随机数状态，重新播种避免各进程生成相同的随机方案
+    random.seed()
+
+def _evaluate_scenario_in_worker(scenario: Dict) -> Dict:
+    """在工作进程中评估单个场景"""
+    return asyncio.run(evaluate_scenario(scenario))
+
 class ComprehensiveTest:
-    def __init__(self, data_generator: TestDataGenerator, output_dir: str = "evaluation/test_results"):
-        """初始化综合测试器"""
+    # 每完成一个场景追加一行，用于中断后继续运行
+    CHECKPOINT_FILE = "checkpoint.jsonl"
+
+    def __init__(self, data_generator: TestDataGenerator, output_dir: str = "evaluation/test_results",
+                 workers: int = 1, resume: bool = False):
+        """
+        初始化综合测试器
+        
+        Args:
+            workers: 大于1时使用进程池并行运行场景
+            resume: 跳过output_dir中检查点已记录的场景
+        """
         self.data_generator = data_generator
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.resume = resume
+        self.checkpoint_path = self.output_dir / self.CHECKPOINT_FILE
         
-    async def run_comprehensive_tests(self):
-        """运行所有测试场景"""
+    async def run_comprehensive_tests(self) -> Optional[Dict]:
+        """运行所有测试场景，返回汇总报告"""
         scenarios = self.data_generator.generate_test_suite()
-        results = []
         
         total_scenarios = len(scenarios)
         print(f"\nTotal test scenarios: {total_scenarios}")
         
-        for i, scenario in enumerate(scenarios, 1):
-            print(f"\nRunning test scenario {i}/{total_scenarios}: {scenario['name']}")
-            print(f"Configuration: {len(scenario['places'])} places, "
-                  f"{scenario['duration_days']} days, {scenario['transport_mode']} mode")
+        completed = self._load_checkpoint()
+        if completed:
+            print(f"Resuming: {len(completed)} scenarios already completed")
+        pending = [
+            (index, scenario) for index, scenario in enumerate(scenarios)
+            if scenario['name'] not in completed
+        ]
+        
+        if self.workers > 1:
+            completed.update(self._run_parallel(pending, total_scenarios))
+        else:
+            completed.update(await self._run_sequential(pending, total_scenarios))
+        
+        # 按场景原始顺序汇总，保证报告与顺序运行时一致
+        results = [completed[s['name']] for s in scenarios if completed.get(s['name'])]
+        
+        # 生成汇总报告
+        if results:
+            return self.generate_summary_report(results)
+        print("No successful test results to analyze")
+        return None
+
+    async def _run_sequential(self, pending: List[Tuple[int, Dict]], total_scenarios: int) -> Dict[str, Optional[Dict]]:
+        """在当前进程中依次评估场景"""
+        outcomes = {}
+        for index, scenario in pending:
+            print(f"\nRunning test scenario {index + 1}/{total_scenarios}: {scenario['name']}")
+            self._print_configuration(scenario)
             
             try:
-                pipeline = EvaluationPipeline(
-                    places=scenario['places'],
-                    start_date=scenario['start_date'],
-                    end_date=scenario['end_date'],
-                    transport_mode=scenario['transport_mode']
-                )
-                
-                evaluation_result = await pipeline.evaluate(num_random_solutions=50)
-                
-                if evaluation_result['success']:
-                    result = {
-                        'scenario': scenario['name'],
-                        'type': scenario['type'],
-                        'num_places': len(scenario['places']),
-                        'duration_days': scenario['duration_days'],
-                        'transport_mode': scenario['transport_mode'],
-                        'algorithm_scores': evaluation_result['algorithm_solution']['scores'],
-                        'random_stats': evaluation_result['random_solutions']['statistics'],
-                        'percentiles': evaluation_result['comparative_analysis']['ranking_percentile']
-                    }
-                    results.append(result)
-                    
-                    # 保存详细结果（注意处理JSON序列化）
-                    try:
-                        self._save_scenario_result(scenario['name'], 
-                                                self._make_json_serializable(evaluation_result))
-                        print(f"Scenario completed successfully")
-                    except Exception as e:
-                        print(f"Error saving scenario result: {str(e)}")
-                else:
-                    print(f"Scenario failed: {evaluation_result.get('error', 'Unknown error')}")
-            
+                evaluation_result = await evaluate_scenario(scenario)
             except Exception as e:
                 print(f"Error in scenario {scenario['name']}: {str(e)}")
                 continue
+            
+            outcomes[scenario['name']] = self._handle_scenario_result(scenario, evaluation_result)
+        return outcomes
+
+    def _run_parallel(self, pending: List[Tuple[int, Dict]], total_scenarios: int) -> Dict[str, Optional[Dict]]:
+        """用进程池并行评估场景，每个场景完成后立即保存结果"""
+        print(f"Running with {self.workers} worker processes")
+        
+        outcomes = {}
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker) as executor:
+            futures = {
+                executor.submit(_evaluate_scenario_in_worker, scenario): scenario
+                for _, scenario in pending
+            }
+            for completed, future in enumerate(as_completed(futures), 1):
+                scenario = futures[future]
+                print(f"\nFinished test scenario {completed}/{len(pending)}: {scenario['name']}")
+                self._print_configuration(scenario)
+                
+                try:
+                    evaluation_result = future.result()
+                except Exception as e:
+                    print(f"Error in scenario {scenario['name']}: {str(e)}")
+                    continue
+                
+                outcomes[scenario['name']] = self._handle_scenario_result(scenario, evaluation_result)
+        return outcomes
+
+    def _load_checkpoint(self) -> Dict[str, Optional[Dict]]:
+        """读取已完成的场景（失败的场景值为None）；不续跑时清空检查点"""
+        if not self.resume:
+            self.checkpoint_path.unlink(missing_ok=True)
+            return {}
+        if not self.checkpoint_path.exists():
+            return {}
+        
+        content = self.checkpoint_path.read_text()
+        lines = content.split("\n")
+        if not content.endswith("\n"):
+            # 中断时可能留下不完整的最后一行，去掉它以免与之后追加的记录连在一起
+            lines.pop()
+            self.checkpoint_path.write_text("".join(line + "\n" for line in lines if line))
+        
+        completed = {}
+        for line in lines:
+            if not line:
+                continue
+            entry = json.loads(line)
+            completed[entry['scenario']] = entry['result']
+        return completed
+
+    def _record_checkpoint(self, scenario_name: str, result: Optional[Dict]):
+        """记录一个已完成的场景"""
+        entry = {'scenario': scenario_name, 'result': self._make_json_serializable(result)}
+        with open(self.checkpoint_path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def _print_configuration(self, scenario: Dict):
+        print(f"Configuration: {len(scenario['places'])} places, "
+              f"{scenario['duration_days']} days, {scenario['transport_mode']} mode")
+
+    def _handle_scenario_result(self, scenario: Dict, evaluation_result: Dict) -> Optional[Dict]:
+        """保存场景的详细结果并返回汇总用的数据，失败时返回None"""
+        if not evaluation_result['success']:
+            print(f"Scenario failed: {evaluation_result.get('error', 'Unknown error')}")
+            self._record_checkpoint(scenario['name'], None)
+            return None
         
-        # 生成汇总报告
-        if results:
-            self.generate_summary_report(results)
-        else:
-            print("No successful test results to analyze")
+        result = {
+            'scenario': scenario['name'],
+            'type': scenario['type'],
+            'num_places': len(scenario['places']),
+            'duration_days': scenario['duration_days'],
+            'transport_mode': scenario['transport_mode'],
+            'algorithm_scores': evaluation_result['algorithm_solution']['scores'],
+            'random_stats': evaluation_result['random_solutions']['statistics'],
+            'percentiles': evaluation_result['comparative_analysis']['ranking_percentile']
+        }
+        
+        # 保存详细结果（注意处理JSON序列化）
+        try:
+            self._save_scenario_result(scenario['name'], 
+                                    self._make_json_serializable(evaluation_result))
+            print(f"Scenario completed successfully")
+        except Exception as e:
+            print(f"Error saving scenario result: {str(e)}")
+        self._record_checkpoint(scenario['name'], result)
+        return result
 
     def _make_json_serializable(self, obj):
         """使对象可JSON序列化"""
@@ -83,8 +195,8 @@ class ComprehensiveTest:
             return {k: self._make_json_serializable(v) for k, v in obj.items()}
         elif isinstance(obj, list):
             return [self._make_json_serializable(item) for item in obj]
-        elif isinstance(obj, bool):
-            return str(obj)
+        elif isinstance(obj, (bool, np.bool_)):
+            return str(bool(obj))
         elif isinstance(obj, (datetime, np.datetime64)):
             return obj.isoformat()
         return obj
@@ -95,7 +207,7 @@ class ComprehensiveTest:
         with open(file_path, 'w') as f:
             json.dump(result, f, indent=2)
     
-    def generate_summary_report(self, results: List[Dict]):
+    def generate_summary_report(self, results: List[Dict]) -> Dict:
         """生成测试汇总报告"""
         df = pd.DataFrame(results)
         
@@ -270,4 +382,6 @@ class ComprehensiveTest:
 
         summary_path = self.output_dir / "summary_report.json"
         with open(summary_path, 'w') as f:
-            json.dump(summary, f, indent=2)
\ No newline at end of file
+            json.dump(summary, f, indent=2)
+
+        return summary
@@ -5,13 +5,14 @@ from datetime import datetime
 import numpy as np
 from typing import Dict, List
 import asyncio
-from statistics import mean, stdev
 from travelplan.services.schedule_service import ScheduleService
+from travelplan.services.clustering import get_constraint_profile
 from evaluation.random_generator import RandomScheduleGenerator
-from evaluation.metrics import ScheduleMetrics
+from evaluation.metrics import ScheduleMetrics, DEFAULT_SCORE_WEIGHTS, schedule_hash
 
 class EvaluationPipeline:
-    def __init__(self, places: List[Dict], start_date: str, end_date: str, transport_mode: str = 'walking'):
+    def __init__(self, places: List[Dict], start_date: str, end_date: str, transport_mode: str = 'walking',
+                 constraint_profile: str = None, score_weights: Dict[str, float] = None):
         """
         Initialize evaluation pipeline
         """
@@ -19,20 +20,30 @@ class EvaluationPipeline:
         self.start_date = start_date
         self.end_date = end_date
         self.transport_mode = transport_mode
+        self.constraint_profile = constraint_profile
+        self.constraints = get_constraint_profile(constraint_profile)
+        self.score_weights = score_weights or DEFAULT_SCORE_WEIGHTS
+        # Scores keyed by schedule hash; places, constraints and weights are fixed per pipeline
+        self._score_cache = {}
         self.schedule_service = ScheduleService()
         self.random_generator = RandomScheduleGenerator(
             places=places,
             start_date=start_date,
             end_date=end_date,
-            transport_mode=transport_mode
+            transport_mode=transport_mode,
+            constraints=self.constraints
         )
 
-    async def evaluate(self, num_random_solutions: int = 100) -> Dict:
+    async def evaluate(self, num_random_solutions: int = 100, batched: bool = True,
+                       seed: int = None) -> Dict:
         """
         Run complete evaluation process
         
         Args:
             num_random_solutions: Number of random solutions to generate
+            batched: Sample and score random solutions as numpy arrays instead of
+                building one schedule at a time
+            seed: Random seed for the batched generator
             
         Returns:
             Dictionary containing evaluation results
@@ -42,7 +53,8 @@ class EvaluationPipeline:
             places=self.places,
             start_date=self.start_date,
             end_date=self.end_date,
-            transport_mode=self.transport_mode
+            transport_mode=self.transport_mode,
+            constraint_profile=self.constraint_profile
         )
         
         if not algo_result['success']:
@@ -52,17 +64,23 @@ class EvaluationPipeline:
             }
             
         algo_schedule = algo_result['events']
-        algo_metrics = ScheduleMetrics(algo_schedule, self.places)
-        algo_scores = self._calculate_scores(algo_metrics)
+        algo_scores = self._score_schedule(algo_schedule)
         
         # 2. Generate random solutions
-        random_scores = []
-        for i in range(num_random_solutions):
-            random_result = self.random_generator.generate_random_schedule()
-            if random_result['success']:
-                metrics = ScheduleMetrics(random_result['events'], self.places)
-                scores = self._calculate_scores(metrics)
-                random_scores.append(scores)
+        if batched:
+            random_scores = self.random_generator.generate_random_scores(
+                num_random_solutions, self.score_weights, seed
+            )
+        else:
+            random_results = []
+            for i in range(num_random_solutions):
+                random_result = self.random_generator.generate_random_schedule()
+                if random_result['success']:
+                    random_results.append(self._score_schedule(random_result['events']))
+            random_scores = {
+                metric: np.array([scores[metric] for scores in random_results])
+                for metric in algo_scores
+            }
         
         # 3. Calculate statistics
         stats = self._calculate_statistics(algo_scores, random_scores)
@@ -76,6 +94,8 @@ class EvaluationPipeline:
                 'start_date': self.start_date,
                 'end_date': self.end_date,
                 'transport_mode': self.transport_mode,
+                'constraint_profile': self.constraints.PROFILE_ID,
+                'score_weights': self.score_weights,
                 'num_random_solutions': num_random_solutions
             },
             'algorithm_solution': {
@@ -92,45 +112,39 @@ class EvaluationPipeline:
             }
         }
     
+    def _score_schedule(self, schedule: List[Dict]) -> Dict[str, float]:
+        """Score a schedule, reusing cached scores for identical schedules"""
+        key = schedule_hash(schedule)
+        scores = self._score_cache.get(key)
+        if scores is None:
+            scores = self._calculate_scores(ScheduleMetrics(schedule, self.places, self.constraints))
+            self._score_cache[key] = scores
+        return dict(scores)
+    
     def _calculate_scores(self, metrics: ScheduleMetrics) -> Dict[str, float]:
         """Calculate all metrics scores"""
-        return {
-            'distance': metrics.calculate_distance_score(),
-            'time_window': metrics.calculate_time_window_score(),
-            'distribution': metrics.calculate_distribution_score(),
-            'clustering': metrics.calculate_clustering_score(),
-            'total': self._calculate_total_score(metrics)
-        }
-    
-    def _calculate_total_score(self, metrics: ScheduleMetrics) -> float:
-        """Calculate weighted total score"""
-        return (
-            metrics.calculate_distance_score() * 0.3 +
-            metrics.calculate_time_window_score() * 0.3 +
-            metrics.calculate_distribution_score() * 0.2 +
-            metrics.calculate_clustering_score() * 0.2
-        )
+        return metrics.calculate_scores(self.score_weights)
     
     def _calculate_statistics(self, algo_scores: Dict[str, float], 
-                            random_scores: List[Dict[str, float]]) -> Dict:
-        """Calculate comprehensive statistics"""
+                            random_scores: Dict[str, np.ndarray]) -> Dict:
+        """Calculate comprehensive statistics from arrays of random solution scores"""
         metrics = ['distance', 'time_window', 'distribution', 'clustering', 'total']
         stats = {'random_stats': {}, 'percentiles': {}, 'ranking_percentile': {}}
         
         for metric in metrics:
-            random_values = [scores[metric] for scores in random_scores]
+            random_values = random_scores[metric]
             algo_value = algo_scores[metric]
             
             # Calculate basic statistics
             stats['random_stats'][metric] = {
-                'mean': mean(random_values),
-                'std_dev': stdev(random_values) if len(random_values) > 1 else 0,
-                'min': min(random_values),
-                'max': max(random_values)
+                'mean': float(np.mean(random_values)),
+                'std_dev': float(np.std(random_values, ddof=1)) if len(random_values) > 1 else 0,
+                'min': float(np.min(random_values)),
+                'max': float(np.max(random_values))
             }
             
             # Calculate percentile of algorithm solution
-            percentile = sum(1 for x in random_values if x < algo_value) / len(random_values) * 100
+            percentile = float(np.count_nonzero(random_values < algo_value) / len(random_values) * 100)
             stats['ranking_percentile'][metric] = percentile
             
             # Calculate percentile distribution
@@ -144,16 +158,15 @@ class EvaluationPipeline:
         # Calculate statistical significance
         stats['statistical_significance'] = {}
         for metric in metrics:
-            random_values = [scores[metric] for scores in random_scores]
             algo_value = algo_scores[metric]
-            mean_val = mean(random_values)
-            std_val = stdev(random_values) if len(random_values) > 1 else 0
+            mean_val = stats['random_stats'][metric]['mean']
+            std_val = stats['random_stats'][metric]['std_dev']
             
             if std_val > 0:
                 z_score = (algo_value - mean_val) / std_val
                 stats['statistical_significance'][metric] = {
-                    'z_score': z_score,
-                    'is_significant': abs(z_score) > 1.96  # 95% confidence level
+                    'z_score': float(z_score),
+                    'is_significant': bool(abs(z_score) > 1.96)  # 95% confidence level
                 }
         
         return stats
@@ -1,23 +1,64 @@
 # evaluation/metrics.py
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import hashlib
+import json
 import numpy as np
 from datetime import datetime, time
-from travelplan.services.utils import haversine_distance, calculate_travel_time
+from travelplan.services.utils import haversine_distance, calculate_travel_time, MINUTES_PER_DAY
 from travelplan.services.clustering import PlaceConstraints
 
+# 虚拟餐厅没有真实位置，使用行程中其他地点的平均位置
+VIRTUAL_RESTAURANT_NAMES = ('Lunch Break', 'Dinner Break')
+
+# 总分中各项指标的默认权重（按此顺序累加）
+DEFAULT_SCORE_WEIGHTS = {
+    'distance': 0.3,
+    'time_window': 0.3,
+    'distribution': 0.2,
+    'clustering': 0.2
+}
+
+def schedule_hash(schedule: List[Dict]) -> str:
+    """计算行程中影响评分的字段的哈希，用于缓存评分"""
+    rows = []
+    for event in schedule:
+        place = event.get('place') or {}
+        rows.append((
+            event.get('day', 0),
+            event.get('type'),
+            event.get('startTime'),
+            event.get('endTime'),
+            place.get('name'),
+            place.get('types'),
+            place.get('geometry'),
+            place.get('location')
+        ))
+    payload = json.dumps(rows, sort_keys=True, default=str)
+    return hashlib.blake2b(payload.encode(), digest_size=16).hexdigest()
+
 class ScheduleMetrics:
-    def __init__(self, schedule: List[Dict], places: List[Dict]):
+    def __init__(self, schedule: List[Dict], places: List[Dict], constraints=None):
         """
         初始化评估指标计算器
         
         Args:
             schedule: 需要评估的行程安排
             places: 原始地点列表
+            constraints: 时间约束配置（默认使用PlaceConstraints）
         """
         self.schedule = schedule
         self.places = places
+        self.constraints = constraints or PlaceConstraints
+        self._component_scores = None
         self.events_by_day = self._group_events_by_day()
+        self._virtual_location = None
+        # 一次性提取每天地点事件的坐标及相邻地点间的距离
+        self.coordinates_by_day = self._extract_coordinates()
+        self.leg_distances_by_day = {
+            day: haversine_distance(lats[:-1], lngs[:-1], lats[1:], lngs[1:])
+            for day, (lats, lngs) in self.coordinates_by_day.items()
+        }
         
     def _group_events_by_day(self) -> Dict[int, List[Dict]]:
         """将事件按天分组"""
@@ -28,6 +69,37 @@ class ScheduleMetrics:
                 events_by_day[day] = []
             events_by_day[day].append(event)
         return events_by_day
+
+    @staticmethod
+    def _place_location(place: Dict) -> Optional[tuple]:
+        """从地点数据中提取经纬度，找不到时返回None"""
+        if 'geometry' in place:
+            loc = place['geometry']['location']
+        elif 'location' in place:
+            loc = place['location']
+        else:
+            return None
+        if not loc:
+            return None
+        return (float(loc['lat']), float(loc['lng']))
+
+    def _virtual_restaurant_location(self) -> tuple:
+        """虚拟餐厅使用其他地点的平均位置，每个行程只计算一次"""
+        if self._virtual_location is None:
+            avg_lat = 0
+            avg_lng = 0
+            count = 0
+            for event in self.schedule:
+                if event.get('type') == 'place' and event['place'].get('name') not in VIRTUAL_RESTAURANT_NAMES:
+                    loc = self._place_location(event['place'])
+                    if loc:
+                        avg_lat += loc[0]
+                        avg_lng += loc[1]
+                        count += 1
+            
+            # 如果没有其他地点，使用默认位置
+            self._virtual_location = (avg_lat / count, avg_lng / count) if count > 0 else (0.0, 0.0)
+        return self._virtual_location
     
     def _get_location(self, place: Dict) -> tuple:
         """
@@ -36,47 +108,58 @@ class ScheduleMetrics:
         """
         try:
             # 处理虚拟餐厅
-            if place.get('name') in ['Lunch Break', 'Dinner Break']:
-                # 使用其他地点的平均位置
-                avg_lat = 0
-                avg_lng = 0
-                count = 0
-                for event in self.schedule:
-                    if event.get('type') == 'place' and event['place'].get('name') not in ['Lunch Break', 'Dinner Break']:
-                        loc = None
-                        if 'geometry' in event['place']:
-                            loc = event['place']['geometry']['location']
-                        elif 'location' in event['place']:
-                            loc = event['place']['location']
-                        
-                        if loc:
-                            avg_lat += float(loc['lat'])
-                            avg_lng += float(loc['lng'])
-                            count += 1
-                
-                if count > 0:
-                    return (avg_lat / count, avg_lng / count)
-                else:
-                    # 如果没有其他地点，使用默认位置
-                    return (0.0, 0.0)
+            if place.get('name') in VIRTUAL_RESTAURANT_NAMES:
+                return self._virtual_restaurant_location()
             
             # 处理正常地点
-            if 'geometry' in place:
-                return (
-                    float(place['geometry']['location']['lat']),
-                    float(place['geometry']['location']['lng'])
-                )
-            elif 'location' in place:
-                return (
-                    float(place['location']['lat']),
-                    float(place['location']['lng'])
-                )
-            else:
+            location = self._place_location(place)
+            if location is None:
                 raise ValueError(f"Cannot find location in place data: {place}")
+            return location
         except Exception as e:
             print(f"Error getting location from place: {place}")
             raise
+
+    def _extract_coordinates(self) -> Dict[int, Tuple[np.ndarray, np.ndarray]]:
+        """提取每天地点事件（排除交通事件）的纬度和经度数组"""
+        coordinates = {}
+        for day, events in self.events_by_day.items():
+            locations = [
+                self._get_location(e['place'])
+                for e in events if e.get('type') == 'place'
+            ]
+            coordinates[day] = (
+                np.array([lat for lat, _ in locations], dtype=float),
+                np.array([lng for _, lng in locations], dtype=float)
+            )
+        return coordinates
     
+    def calculate_component_scores(self) -> Dict[str, float]:
+        """计算各项指标得分，只计算一次并缓存"""
+        if self._component_scores is None:
+            self._component_scores = {
+                'distance': self.calculate_distance_score(),
+                'time_window': self.calculate_time_window_score(),
+                'distribution': self.calculate_distribution_score(),
+                'clustering': self.calculate_clustering_score()
+            }
+        return self._component_scores
+
+    def calculate_total_score(self, weights: Optional[Dict[str, float]] = None) -> float:
+        """根据缓存的各项得分计算加权总分"""
+        weights = weights or DEFAULT_SCORE_WEIGHTS
+        components = self.calculate_component_scores()
+        total = 0
+        for name, weight in weights.items():
+            total += components[name] * weight
+        return total
+
+    def calculate_scores(self, weights: Optional[Dict[str, float]] = None) -> Dict[str, float]:
+        """返回各项得分及加权总分"""
+        scores = dict(self.calculate_component_scores())
+        scores['total'] = self.calculate_total_score(weights)
+        return scores
+
     def calculate_distance_score(self) -> float:
         """
         计算路程优化得分
@@ -89,34 +172,12 @@ class ScheduleMetrics:
         total_distance = 0
         max_possible_distance = 0
         
-        for day, events in self.events_by_day.items():
-            # 过滤出地点事件（排除交通事件）
-            place_events = [e for e in events if e.get('type') == 'place']
-            
-            # 计算当天实际距离
-            day_distance = 0
-            for i in range(len(place_events) - 1):
-                curr_place = place_events[i]['place']
-                next_place = place_events[i + 1]['place']
-                
-                curr_lat, curr_lng = self._get_location(curr_place)
-                next_lat, next_lng = self._get_location(next_place)
-                
-                distance = haversine_distance(
-                    curr_lat, curr_lng,
-                    next_lat, next_lng
-                )
-                day_distance += distance
-            
-            total_distance += day_distance
+        for day, (lats, lngs) in self.coordinates_by_day.items():
+            # 按顺序累加当天实际距离（与逐段相加的结果一致）
+            total_distance += sum(self.leg_distances_by_day[day].tolist())
             
             # 计算最差情况的距离（作为基准）
-            locations = []
-            for event in place_events:
-                lat, lng = self._get_location(event['place'])
-                locations.append({'lat': lat, 'lng': lng})
-            
-            max_day_distance = self._calculate_max_possible_distance(locations)
+            max_day_distance = self._calculate_max_possible_distance(lats, lngs)
             max_possible_distance += max_day_distance
         
         # 返回得分（0-100），距离越短得分越高
@@ -147,13 +208,13 @@ class ScheduleMetrics:
                 
                 if place_type == 'restaurant':
                     if (self._is_time_in_window(start_time, end_time, 
-                                              PlaceConstraints.DINING_WINDOWS['lunch']) or
+                                              self.constraints.DINING_WINDOWS['lunch']) or
                         self._is_time_in_window(start_time, end_time, 
-                                              PlaceConstraints.DINING_WINDOWS['dinner'])):
+                                              self.constraints.DINING_WINDOWS['dinner'])):
                         satisfied_events += 1
                 else:
-                    if (PlaceConstraints.DAY_CONSTRAINTS['start'] <= start_time and
-                        end_time <= PlaceConstraints.DAY_CONSTRAINTS['end']):
+                    if (self.constraints.DAY_CONSTRAINTS['start'] <= start_time and
+                        end_time <= self.constraints.DAY_CONSTRAINTS['end']):
                         satisfied_events += 1
         
         return 100 * (satisfied_events / total_events if total_events > 0 else 1)
@@ -162,14 +223,10 @@ class ScheduleMetrics:
         """
         计算地点分布均匀性得分
         """
-        daily_counts = []
-        for day, events in self.events_by_day.items():
-            place_count = len([e for e in events if e.get('type') == 'place'])
-            daily_counts.append(place_count)
-            
-        if not daily_counts:
+        if not self.coordinates_by_day:
             return 100
             
+        daily_counts = np.array([len(lats) for lats, _ in self.coordinates_by_day.values()])
         mean_count = np.mean(daily_counts)
         if mean_count == 0:
             return 100
@@ -187,51 +244,29 @@ class ScheduleMetrics:
         if not self.events_by_day:
             return 100
             
+        max_reasonable_distance = 5000  # 5公里作为合理距离
         daily_scores = []
-        for day, events in self.events_by_day.items():
-            place_events = [e for e in events if e.get('type') == 'place']
-            if len(place_events) < 2:
+        for day, distances in self.leg_distances_by_day.items():
+            if len(distances) < 1:
                 continue
-                
-            distances = []
-            for i in range(len(place_events) - 1):
-                curr_place = place_events[i]['place']
-                next_place = place_events[i + 1]['place']
-                
-                curr_lat, curr_lng = self._get_location(curr_place)
-                next_lat, next_lng = self._get_location(next_place)
-                
-                distance = haversine_distance(
-                    curr_lat, curr_lng,
-                    next_lat, next_lng
-                )
-                distances.append(distance)
             
             avg_distance = np.mean(distances)
-            max_reasonable_distance = 5000  # 5公里作为合理距离
-            
             day_score = 100 * (1 - min(avg_distance / max_reasonable_distance, 1))
             daily_scores.append(day_score)
         
         return np.mean(daily_scores) if daily_scores else 100
     
-    def _calculate_max_possible_distance(self, locations: List[Dict]) -> float:
-        """计算给定地点集合可能的最大距离"""
-        if len(locations) < 2:
+    def _calculate_max_possible_distance(self, lats: np.ndarray, lngs: np.ndarray) -> float:
+        """计算给定地点集合可能的最大距离（最远两点距离乘以路段数）"""
+        if len(lats) < 2:
             return 0
             
-        max_distance = 0
-        for i in range(len(locations)):
-            for j in range(i + 1, len(locations)):
-                distance = haversine_distance(
-                    locations[i]['lat'],
-                    locations[i]['lng'],
-                    locations[j]['lat'],
-                    locations[j]['lng']
-                )
-                max_distance = max(max_distance, distance)
+        # 一次性计算所有i < j地点对的距离
+        i, j = np.triu_indices(len(lats), k=1)
+        distances = haversine_distance(lats[i], lngs[i], lats[j], lngs[j])
+        max_distance = max(0, distances.max())
         
-        return max_distance * (len(locations) - 1)
+        return max_distance * (len(lats) - 1)
     
     def _is_time_in_window(self, 
                           start: time, 
@@ -239,4 +274,107 @@ class ScheduleMetrics:
                           window: Dict[str, time]) -> bool:
         """检查时间是否在指定窗口内"""
         return (window['start'] <= start <= window['end'] and
-                window['start'] <= end <= window['end'])
\ No newline at end of file
+                window['start'] <= end <= window['end'])
+
+def batch_schedule_scores(
+    lats: np.ndarray,
+    lngs: np.ndarray,
+    days: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    is_restaurant: np.ndarray,
+    is_timed: np.ndarray,
+    num_days: int,
+    constraints=None,
+    weights: Optional[Dict[str, float]] = None
+) -> Dict[str, np.ndarray]:
+    """
+    按数组批量计算多个行程的评分，与ScheduleMetrics的各项指标含义相同。
+
+    每个参数是形状为(行程数, 地点事件数)的数组，每一行是一个行程的地点事件
+    （不含交通事件），按天的顺序排列，且每天至少有一个事件：
+        lats, lngs: 坐标（虚拟餐厅应已替换为行程的平均位置）
+        days: 事件所在的天（0到num_days-1）
+        starts, ends: 开始/结束时间（从第一天午夜开始的分钟数）
+        is_restaurant: 地点类型中包含restaurant
+        is_timed: 事件有开始和结束时间（酒店为False）
+    返回各项得分及加权总分，每项为长度为行程数的数组。
+    """
+    constraints = constraints or PlaceConstraints
+    weights = weights or DEFAULT_SCORE_WEIGHTS
+    num_schedules, num_events = lats.shape
+
+    # 相邻事件间的距离，只保留同一天内的路段
+    same_day = days[:, :-1] == days[:, 1:]
+    legs = np.where(
+        same_day,
+        haversine_distance(lats[:, :-1], lngs[:, :-1], lats[:, 1:], lngs[:, 1:]),
+        0.0
+    )
+
+    # 同一天内所有地点对的距离，用于最差情况的路程
+    pair_distances = haversine_distance(
+        lats[:, :, None], lngs[:, :, None],
+        lats[:, None, :], lngs[:, None, :]
+    )
+    same_day_pairs = days[:, :, None] == days[:, None, :]
+    farthest = np.where(same_day_pairs, pair_distances, 0.0).max(axis=2)
+
+    counts = np.zeros((num_schedules, num_days))
+    day_legs = np.zeros((num_schedules, num_days))
+    day_farthest = np.zeros((num_schedules, num_days))
+    for day in range(num_days):
+        in_day = days == day
+        counts[:, day] = in_day.sum(axis=1)
+        day_legs[:, day] = np.where(same_day & in_day[:, 1:], legs, 0.0).sum(axis=1)
+        day_farthest[:, day] = np.where(in_day, farthest, 0.0).max(axis=1)
+
+    # 路程得分
+    total_distance = legs.sum(axis=1)
+    max_possible = (day_farthest * np.maximum(counts - 1, 0)).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        distance = np.where(max_possible == 0, 100.0, 100 * (1 - total_distance / max_possible))
+
+    # 时间窗口得分：餐厅需在午餐或晚餐窗口内，其他地点需在每日时间范围内
+    start_minutes = starts % MINUTES_PER_DAY
+    end_minutes = ends % MINUTES_PER_DAY
+
+    def in_window(window):
+        return (
+            (window['start'] <= start_minutes) & (start_minutes <= window['end']) &
+            (window['start'] <= end_minutes) & (end_minutes <= window['end'])
+        )
+
+    in_dining_window = (
+        in_window(constraints.WINDOW_MINUTES['lunch']) |
+        in_window(constraints.WINDOW_MINUTES['dinner'])
+    )
+    in_day_window = (constraints.DAY_START <= start_minutes) & (end_minutes <= constraints.DAY_END)
+    satisfied = is_timed & np.where(is_restaurant, in_dining_window, in_day_window)
+    time_window = 100 * satisfied.sum(axis=1) / num_events
+
+    # 分布均匀性得分
+    mean_count = counts.mean(axis=1)
+    cv = counts.std(axis=1) / mean_count
+    distribution = 100 * (1 - np.minimum(cv, 1))
+
+    # 聚类紧凑度得分，只统计至少有两个地点的天
+    clustered = counts >= 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_legs = day_legs / (counts - 1)
+    day_scores = np.where(clustered, 100 * (1 - np.minimum(average_legs / 5000, 1)), 0.0)
+    clustered_days = clustered.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        clustering = np.where(clustered_days > 0, day_scores.sum(axis=1) / clustered_days, 100.0)
+
+    scores = {
+        'distance': distance,
+        'time_window': time_window,
+        'distribution': distribution,
+        'clustering': clustering
+    }
+    total = 0
+    for name, weight in weights.items():
+        total = total + scores[name] * weight
+    scores['total'] = total
+    return scores
@@ -5,62 +5,75 @@ import django
 django.setup()
 
 import numpy as np
-from evaluation.comprehensive_test import ComprehensiveTest
+from evaluation.comprehensive_test import ComprehensiveTest, init_worker
 from evaluation.test_data import TestDataGenerator
 import time
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import json
 
-async def run_single_test(run_id, output_dir):
-    """运行单次测试并返回结果"""
+def run_single_test(run_id, output_dir):
+    """运行单次测试并返回结果（在工作进程中执行，已完成的场景从检查点恢复）"""
     print(f"Starting test run #{run_id}")
     
     # 创建测试实例
     test_data_generator = TestDataGenerator()
-    tester = ComprehensiveTest(test_data_generator, output_dir=str(output_dir / f"run_{run_id}"))
-    
-    # 运行测试
-    await tester.run_comprehensive_tests()
-    
-    # 读取结果
-    summary_path = output_dir / f"run_{run_id}" / "summary_report.json"
-    if summary_path.exists():
-        with open(summary_path, 'r') as f:
-            summary = json.load(f)
-            
-        total_scenarios = summary['overview']['total_scenarios']
-        better_than_random = summary['overview']['better_than_random']
-        significantly_better = summary['overview']['significantly_better']
-        
-        success_rate = better_than_random / total_scenarios * 100
-        significant_rate = significantly_better / total_scenarios * 100
-        
-        return {
-            'run_id': run_id,
-            'total_scenarios': total_scenarios,
-            'success_rate': success_rate,
-            'significant_rate': significant_rate
-        }
-    else:
-        print(f"Warning: No summary report found for run #{run_id}")
+    tester = ComprehensiveTest(
+        test_data_generator,
+        output_dir=str(output_dir / f"run_{run_id}"),
+        resume=True
+    )
+    
+    # 运行测试，汇总结果直接在内存中返回
+    summary = asyncio.run(tester.run_comprehensive_tests())
+    if not summary:
+        print(f"Warning: No summary report produced for run #{run_id}")
         return None
+        
+    total_scenarios = summary['overview']['total_scenarios']
+    better_than_random = summary['overview']['better_than_random']
+    significantly_better = summary['overview']['significantly_better']
+    
+    success_rate = better_than_random / total_scenarios * 100
+    significant_rate = significantly_better / total_scenarios * 100
+    
+    return {
+        'run_id': run_id,
+        'total_scenarios': total_scenarios,
+        'success_rate': success_rate,
+        'significant_rate': significant_rate
+    }
 
-async def run_multiple_tests(num_runs=10):
-    """运行多次测试并汇总结果"""
-    print(f"Starting {num_runs} test runs")
+async def run_multiple_tests(num_runs=10, workers=1, output_dir=None):
+    """
+    运行多次测试并汇总结果
+    
+    各次运行分配到workers个进程中并行执行；传入已有的output_dir时，
+    从各次运行的检查点继续，之前完成的场景不会重新评估。
+    """
+    print(f"Starting {num_runs} test runs with {workers} worker processes")
     
     # 创建结果目录
-    timestamp = int(time.time())
-    output_dir = Path(f"evaluation/multi_test_results_{timestamp}")
+    if output_dir is None:
+        timestamp = int(time.time())
+        output_dir = f"evaluation/multi_test_results_{timestamp}"
+    output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    results = []
-    
     # 运行多次测试
-    for i in range(1, num_runs + 1):
-        result = await run_single_test(i, output_dir)
-        if result:
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        run_results = await asyncio.gather(*[
+            loop.run_in_executor(executor, run_single_test, i, output_dir)
+            for i in range(1, num_runs + 1)
+        ], return_exceptions=True)
+    
+    results = []
+    for run_id, result in enumerate(run_results, 1):
+        if isinstance(result, Exception):
+            print(f"Test run #{run_id} failed: {result}")
+        elif result:
             results.append(result)
     
     if not results:
@@ -122,6 +135,10 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Run multiple evaluation tests")
     parser.add_argument("-n", "--num-runs", type=int, default=3, 
                         help="Number of test runs to perform")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Number of test runs to execute concurrently")
+    parser.add_argument("--resume", metavar="DIR",
+                        help="Resume an interrupted study from its results directory")
     args = parser.parse_args()
     
-    asyncio.run(run_multiple_tests(args.num_runs))
\ No newline at end of file
+    asyncio.run(run_multiple_tests(args.num_runs, args.workers, args.resume))
\ No newline at end of file
@@ -6,9 +6,11 @@ from typing import List, Dict, Tuple
 import numpy as np
 from travelplan.services.clustering import PlaceConstraints, preprocess_places
 from travelplan.services.utils import calculate_distance_matrix
+from evaluation.metrics import batch_schedule_scores
 
 class RandomScheduleGenerator:
-    def __init__(self, places: List[Dict], start_date: str, end_date: str, transport_mode: str = 'walking'):
+    def __init__(self, places: List[Dict], start_date: str, end_date: str, transport_mode: str = 'walking',
+                 constraints=None):
         """
         初始化随机行程生成器
         
@@ -17,15 +19,17 @@ class RandomScheduleGenerator:
             start_date: 开始日期
             end_date: 结束日期
             transport_mode: 交通方式
+            constraints: 时间约束配置（默认使用PlaceConstraints）
         """
         self.original_places = places
         self.start_date = datetime.strptime(start_date, '%Y-%m-%d')
         self.end_date = datetime.strptime(end_date, '%Y-%m-%d')
         self.num_days = (self.end_date - self.start_date).days + 1
         self.transport_mode = transport_mode
+        self.constraints = constraints or PlaceConstraints
         
         # 预处理地点数据
-        self.processed_places, self.hotel = preprocess_places(places)
+        self.processed_places, self.hotel = preprocess_places(places, self.constraints)
         if not self.hotel:
             raise ValueError("No hotel found in places list")
         
@@ -63,6 +67,136 @@ class RandomScheduleGenerator:
                 'error': str(e)
             }
 
+    def _build_node_tables(self):
+        """
+        为批量生成准备按编号索引的地点数据：
+        0为酒店，之后依次为景点、真实餐厅，最后一个为虚拟餐厅
+        """
+        attractions = [p for p in self.processed_places if not p.get('is_restaurant', False)]
+        restaurants = [p for p in self.processed_places if p.get('is_restaurant', False)]
+        nodes = [self.hotel] + attractions + restaurants
+        
+        self._num_attractions = len(attractions)
+        self._num_restaurants = len(restaurants)
+        self._virtual_node = len(nodes)
+        self._node_lat = np.array([float(p['location']['lat']) for p in nodes] + [0.0])
+        self._node_lng = np.array([float(p['location']['lng']) for p in nodes] + [0.0])
+        # 与_generate_day_schedule一致：每个地点之后加30分钟交通时间，酒店不计时间
+        self._node_step = np.array(
+            [0] + [p.get('visit_duration', 90) + 30 for p in attractions + restaurants] + [75 + 30]
+        )
+
+    def sample_random_batch(self, num_solutions: int, rng: np.random.Generator) -> Dict[str, np.ndarray]:
+        """
+        一次抽取num_solutions个随机行程，用整数数组表示，抽样方式与generate_random_schedule相同：
+        景点随机分配到各天并随机排序，餐厅按随机顺序每天取两家，不足时用虚拟餐厅补充。
+        
+        Returns:
+            nodes: (行程数, 事件数) 每个地点事件对应的地点编号
+            days: (行程数, 事件数) 事件所在的天
+            virtual_lat, virtual_lng: (行程数,) 虚拟餐厅使用的平均位置
+        """
+        if not hasattr(self, '_node_lat'):
+            self._build_node_tables()
+        num_days = self.num_days
+        num_attractions = self._num_attractions
+        num_restaurants = self._num_restaurants
+        
+        # 排序键：天 * 8 + 事件类别（0起点酒店，1景点，2、3餐厅，4终点酒店），景点在类别内随机排序
+        attraction_days = rng.integers(0, num_days, size=(num_solutions, num_attractions))
+        attraction_keys = attraction_days * 8 + 1 + rng.random((num_solutions, num_attractions)) * 0.9
+        attraction_nodes = np.broadcast_to(
+            np.arange(1, num_attractions + 1), (num_solutions, num_attractions)
+        )
+        
+        # 餐厅的随机顺序，第d天使用第2d和2d+1家
+        restaurant_order = np.argsort(rng.random((num_solutions, num_restaurants)), axis=1)
+        padded_order = np.full((num_solutions, 2 * num_days), -1)
+        used = min(num_restaurants, 2 * num_days)
+        padded_order[:, :used] = restaurant_order[:, :used]
+        restaurant_nodes = np.where(
+            padded_order >= 0,
+            num_attractions + 1 + padded_order,
+            self._virtual_node
+        ).reshape(num_solutions, num_days, 2)
+        
+        day_keys = np.arange(num_days) * 8
+        fixed_nodes = np.concatenate([
+            np.zeros((num_solutions, num_days, 1), dtype=int),
+            restaurant_nodes,
+            np.zeros((num_solutions, num_days, 1), dtype=int)
+        ], axis=2).reshape(num_solutions, -1)
+        fixed_keys = np.broadcast_to(
+            (day_keys[:, None] + np.array([0, 2, 3, 4])).reshape(-1),
+            fixed_nodes.shape
+        )
+        
+        keys = np.concatenate([attraction_keys, fixed_keys], axis=1)
+        order = np.argsort(keys, axis=1)
+        nodes = np.take_along_axis(np.concatenate([attraction_nodes, fixed_nodes], axis=1), order, axis=1)
+        days = np.take_along_axis(keys, order, axis=1).astype(int) // 8
+        
+        # 虚拟餐厅的位置为行程中所有真实地点事件（含每天两次酒店）的平均位置
+        restaurant_lat = self._node_lat[num_attractions + 1:self._virtual_node]
+        restaurant_lng = self._node_lng[num_attractions + 1:self._virtual_node]
+        count = 2 * num_days + num_attractions + used
+        fixed_lat = 2 * num_days * self._node_lat[0] + self._node_lat[1:num_attractions + 1].sum()
+        fixed_lng = 2 * num_days * self._node_lng[0] + self._node_lng[1:num_attractions + 1].sum()
+        
+        return {
+            'nodes': nodes,
+            'days': days,
+            'virtual_lat': (fixed_lat + restaurant_lat[restaurant_order[:, :used]].sum(axis=1)) / count,
+            'virtual_lng': (fixed_lng + restaurant_lng[restaurant_order[:, :used]].sum(axis=1)) / count
+        }
+
+    def score_random_batch(self, batch: Dict[str, np.ndarray],
+                           weights: Dict[str, float] = None) -> Dict[str, np.ndarray]:
+        """直接根据数组表示的随机行程计算评分，不生成事件字典"""
+        nodes = batch['nodes']
+        days = batch['days']
+        is_virtual = nodes == self._virtual_node
+        is_timed = nodes != 0
+        
+        lats = np.where(is_virtual, batch['virtual_lat'][:, None], self._node_lat[nodes])
+        lngs = np.where(is_virtual, batch['virtual_lng'][:, None], self._node_lng[nodes])
+        
+        # 每天从开始时间起依次安排，每个地点后加交通时间
+        steps = self._node_step[nodes]
+        elapsed = np.cumsum(steps, axis=1) - steps
+        day_begins = np.ones(days.shape, dtype=bool)
+        day_begins[:, 1:] = days[:, 1:] != days[:, :-1]
+        day_offsets = np.maximum.accumulate(np.where(day_begins, elapsed, -1), axis=1)
+        starts = self.constraints.DAY_START + elapsed - day_offsets
+        ends = starts + steps - 30
+        
+        # 只有虚拟餐厅带有restaurant类型（预处理后的地点没有types字段）
+        return batch_schedule_scores(
+            lats, lngs, days, starts, ends,
+            is_virtual, is_timed, self.num_days,
+            self.constraints, weights
+        )
+
+    def generate_random_scores(self, num_solutions: int, weights: Dict[str, float] = None,
+                               seed: int = None, chunk_size: int = 1000) -> Dict[str, np.ndarray]:
+        """
+        批量生成随机行程并计算评分，返回各项得分数组（长度为num_solutions）
+        
+        Args:
+            num_solutions: 随机行程数量
+            weights: 总分权重
+            seed: 随机种子，None时每次结果不同
+            chunk_size: 每批处理的行程数量，限制内存占用
+        """
+        rng = np.random.default_rng(seed)
+        chunks = []
+        for start in range(0, num_solutions, chunk_size):
+            batch = self.sample_random_batch(min(chunk_size, num_solutions - start), rng)
+            chunks.append(self.score_random_batch(batch, weights))
+        if not chunks:
+            return {}
+        return {name: np.concatenate([chunk[name] for chunk in chunks]) for name in chunks[0]}
+
     def _randomly_assign_days(self) -> Dict[int, List[Dict]]:
         """将地点随机分配到不同的天数"""
         places_by_day = {i: [] for i in range(self.num_days)}
@@ -122,7 +256,7 @@ class RandomScheduleGenerator:
         schedule = []
         current_time = datetime.combine(
             self.start_date + timedelta(days=day),
-            PlaceConstraints.DAY_CONSTRAINTS['start']
+            self.constraints.DAY_CONSTRAINTS['start']
         )
         
         # 添加酒店作为起点
@@ -145,11 +279,11 @@ class RandomScheduleGenerator:
         # 确定午餐和晚餐时间
         lunch_time = datetime.combine(
             current_time.date(),
-            PlaceConstraints.DINING_WINDOWS['lunch']['optimal']
+            self.constraints.DINING_WINDOWS['lunch']['optimal']
         )
         dinner_time = datetime.combine(
             current_time.date(),
-            PlaceConstraints.DINING_WINDOWS['dinner']['optimal']
+            self.constraints.DINING_WINDOWS['dinner']['optimal']
         )
         
         # 将一天分成三个时间段：上午、下午和晚上
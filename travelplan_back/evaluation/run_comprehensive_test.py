@@ -7,12 +7,12 @@ django.setup()
 from evaluation.comprehensive_test import ComprehensiveTest
 from evaluation.test_data import TestDataGenerator
 
-async def main():
+async def main(workers: int = 1, resume: bool = False):
     print("=== Starting Comprehensive Travel Planner Evaluation ===")
     print("Initializing test environment...")
     
     test_data_generator = TestDataGenerator()
-    tester = ComprehensiveTest(test_data_generator)
+    tester = ComprehensiveTest(test_data_generator, workers=workers, resume=resume)
     
     print("Running comprehensive tests...")
     await tester.run_comprehensive_tests()
@@ -20,4 +20,13 @@ async def main():
     print("\nEvaluation completed. Results have been saved to the test_results directory.")
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Run the comprehensive evaluation suite")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Number of worker processes for running scenarios in parallel")
+    parser.add_argument("--resume", action="store_true",
+                        help="Skip scenarios already recorded in the results checkpoint")
+    args = parser.parse_args()
+    
+    asyncio.run(main(args.workers, args.resume))
\ No newline at end of file
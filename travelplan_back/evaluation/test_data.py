@@ -1,11 +1,13 @@
 # evaluation/test_data.py
 
 import random
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime, timedelta
 
 class TestDataGenerator:
-    def __init__(self):
+    def __init__(self, rng: Optional[random.Random] = None):
+        # 随机数来源，默认使用全局random；传入random.Random(seed)时不影响全局状态
+        self.random = rng or random
         # 基础城市数据
         self.city_centers = {
             'Paris': (48.8566, 2.3522),
@@ -27,18 +29,18 @@ class TestDataGenerator:
             "place_id": f"hotel_{lat}_{lng}",
             "name": f"Hotel in {lat}, {lng}",
             "types": ["lodging", "hotel"],
-            "rating": round(random.uniform(3.5, 5.0), 1),
-            "user_ratings_total": random.randint(100, 5000),
+            "rating": round(self.random.uniform(3.5, 5.0), 1),
+            "user_ratings_total": self.random.randint(100, 5000),
             "vicinity": "City Center",
             "formatted_address": "City Center",
             "opening_hours": {"open_now": True},
-            "price_level": random.randint(2, 4)
+            "price_level": self.random.randint(2, 4)
         }
 
     def generate_attraction(self, city_center: Tuple[float, float], radius: float = 0.02) -> Dict:
         """生成景点数据"""
         lat, lng = self._generate_location(city_center, radius)
-        types = random.choice([
+        types = self.random.choice([
             ["tourist_attraction", "point_of_interest"],
             ["museum", "tourist_attraction"],
             ["park", "point_of_interest"]
@@ -53,12 +55,12 @@ class TestDataGenerator:
             "place_id": f"attr_{lat}_{lng}",
             "name": f"Attraction at {lat}, {lng}",
             "types": types,
-            "rating": round(random.uniform(3.5, 5.0), 1),
-            "user_ratings_total": random.randint(1000, 50000),
+            "rating": round(self.random.uniform(3.5, 5.0), 1),
+            "user_ratings_total": self.random.randint(1000, 50000),
             "vicinity": "Tourist Area",
             "formatted_address": "Tourist Area",
             "opening_hours": {"open_now": True},
-            "price_level": random.randint(1, 3)
+            "price_level": self.random.randint(1, 3)
         }
 
     def generate_restaurant(self, city_center: Tuple[float, float], radius: float = 0.015) -> Dict:
@@ -74,12 +76,12 @@ class TestDataGenerator:
             "place_id": f"rest_{lat}_{lng}",
             "name": f"Restaurant at {lat}, {lng}",
             "types": ["restaurant", "food", "point_of_interest"],
-            "rating": round(random.uniform(3.5, 5.0), 1),
-            "user_ratings_total": random.randint(100, 3000),
+            "rating": round(self.random.uniform(3.5, 5.0), 1),
+            "user_ratings_total": self.random.randint(100, 3000),
             "vicinity": "Dining Area",
             "formatted_address": "Dining Area",
             "opening_hours": {"open_now": True},
-            "price_level": random.randint(1, 4)
+            "price_level": self.random.randint(1, 4)
         }
 
     def generate_test_scenario(self, 
@@ -109,8 +111,8 @@ class TestDataGenerator:
     def _generate_location(self, center: Tuple[float, float], radius: float) -> Tuple[float, float]:
         """在给定中心点周围生成随机位置"""
         lat, lng = center
-        dlat = random.uniform(-radius, radius)
-        dlng = random.uniform(-radius, radius)
+        dlat = self.random.uniform(-radius, radius)
+        dlng = self.random.uniform(-radius, radius)
         return (round(lat + dlat, 6), round(lng + dlng, 6))
 
     def generate_test_suite(self) -> List[Dict]:
@@ -137,7 +139,7 @@ class TestDataGenerator:
             for size, (num_attr, num_rest) in size_configs.items():
                 for duration_type, (min_days, max_days) in duration_configs.items():
                     for mode in transport_modes:
-                        days = random.randint(min_days, max_days)
+                        days = self.random.randint(min_days, max_days)
                         start_date = datetime.now().strftime('%Y-%m-%d')
                         end_date = (datetime.now() + timedelta(days=days-1)).strftime('%Y-%m-%d')
                         
@@ -0,0 +1,238 @@
+# travelplan/middleware.py
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'HTTP_X_TRAVELPLAN_PROFILE'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+
+class StackSampler:
+    """
+    采样分析器：后台线程定期读取所有线程的调用栈，按折叠栈（collapsed stack）格式计数。
+    同步服务器中异步视图运行在单独的事件循环线程里，因此采样所有线程，并以线程名作为栈底。
+    """
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                frames = []
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(names.get(thread_id, str(thread_id)))
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def collapsed(self) -> str:
+        """返回flamegraph.pl / speedscope可读取的折叠栈文本"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+class ProfileRateLimiter:
+    """限制分析频率：同一时间只分析一个请求，且两次分析之间至少间隔min_interval秒"""
+
+    def __init__(self, min_interval: float):
+        self.min_interval = min_interval
+        self._last = float('-inf')
+        self._active = False
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._active or now - self._last < self.min_interval:
+                return False
+            self._active = True
+            self._last = now
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active = False
+
+class ProfiledStream:
+    """
+    包装流式响应体，读取结束或close()时调用一次on_close。
+    Django在响应关闭时调用close()，因此未读取完（如客户端断开）时也会调用。
+    """
+
+    def __init__(self, content, on_close):
+        self.content = content
+        self._on_close = on_close
+
+    def __iter__(self):
+        try:
+            yield from self.content
+        finally:
+            self.close()
+
+    def close(self):
+        on_close, self._on_close = self._on_close, None
+        if on_close is not None:
+            on_close()
+
+class ProfiledAsyncStream(ProfiledStream):
+    """异步迭代的流式响应体，on_close在线程中运行，不阻塞事件循环"""
+
+    __iter__ = None
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self.content:
+                yield chunk
+        finally:
+            await sync_to_async(self.close, thread_sensitive=False)()
+
+class ProfilingMiddleware:
+    """
+    对带有X-Travelplan-Profile请求头的api/请求进行采样分析，
+    将折叠栈和请求内容保存到PROFILING_DIR。需设置PROFILING_ENABLED，
+    若配置了PROFILING_TOKEN，请求头的值必须与之相同。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', False)
+        self.token = getattr(settings, 'PROFILING_TOKEN', None)
+        self.directory = Path(getattr(settings, 'PROFILING_DIR', 'profiles'))
+        self.sample_interval = getattr(settings, 'PROFILING_SAMPLE_INTERVAL', 0.001)
+        self.keep = getattr(settings, 'PROFILING_KEEP', 100)
+        self.rate_limiter = ProfileRateLimiter(getattr(settings, 'PROFILING_MIN_INTERVAL', 60))
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._should_profile(request):
+            return self.get_response(request)
+
+        profile = self._start(request)
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._finish(request, None, *profile)
+            raise
+        if response.streaming:
+            self._finish_after_streaming(request, response, profile)
+        else:
+            self._finish(request, response, *profile)
+        return response
+
+    async def __acall__(self, request):
+        if not self._should_profile(request):
+            return await self.get_response(request)
+
+        profile = self._start(request)
+        # 保存分析结果的文件读写在线程中进行，不阻塞事件循环
+        finish = sync_to_async(self._finish, thread_sensitive=False)
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            await finish(request, None, *profile)
+            raise
+        if response.streaming:
+            self._finish_after_streaming(request, response, profile)
+        else:
+            await finish(request, response, *profile)
+        return response
+
+    def _should_profile(self, request) -> bool:
+        if not self.enabled or not request.path.startswith('/api/'):
+            return False
+        value = request.META.get(PROFILE_HEADER)
+        if not value or (self.token and value != self.token):
+            return False
+        if not self.rate_limiter.acquire():
+            logger.info(f"Skipping profile of {request.path}: rate limited")
+            return False
+        return True
+
+    def _start(self, request):
+        request.body  # 在视图之前读取请求体，便于保存
+        profile_id = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+        sampler = StackSampler(self.sample_interval)
+        sampler.start()
+        return profile_id, sampler, time.perf_counter()
+
+    def _finish(self, request, response, profile_id, sampler, start):
+        duration = time.perf_counter() - start
+        try:
+            sampler.stop()
+            self._save(profile_id, request, response, sampler, duration)
+            if response is not None and not response.streaming:
+                response[PROFILE_ID_HEADER] = profile_id
+            logger.info(f"Profiled {request.path} in {duration * 1000:.1f} ms as {profile_id}")
+        except Exception as e:
+            logger.error(f"Error saving profile: {str(e)}")
+        finally:
+            self.rate_limiter.release()
+
+    def _finish_after_streaming(self, request, response, profile):
+        """
+        流式响应（如ICS导出）的主要工作在读取响应体时进行，
+        因此在响应体读取结束或响应关闭后才停止采样并保存结果
+        """
+        response[PROFILE_ID_HEADER] = profile[0]
+        stream_class = ProfiledAsyncStream if response.is_async else ProfiledStream
+        response.streaming_content = stream_class(
+            response.streaming_content,
+            lambda: self._finish(request, response, *profile)
+        )
+
+    def _save(self, profile_id, request, response, sampler, duration):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        (self.directory / f"{profile_id}.collapsed").write_text(sampler.collapsed())
+        payload = {
+            'method': request.method,
+            'path': request.path,
+            'query': request.GET.urlencode(),
+            'content_type': request.content_type,
+            'body': request.body.decode('utf-8', errors='replace'),
+            'status': response.status_code if response is not None else None,
+            'duration_ms': duration * 1000,
+            'samples': sum(sampler.stacks.values()),
+            'sample_interval': self.sample_interval
+        }
+        with open(self.directory / f"{profile_id}.json", 'w') as f:
+            json.dump(payload, f, indent=2, ensure_ascii=False)
+        self._prune()
+
+    def _prune(self):
+        """只保留最近的keep份分析结果（keep为0时不清理）"""
+        if not self.keep:
+            return
+        profiles = sorted(self.directory.glob('*.collapsed'))
+        for path in profiles[:-self.keep]:
+            path.unlink(missing_ok=True)
+            path.with_suffix('.json').unlink(missing_ok=True)
@@ -0,0 +1,131 @@
+# travelplan/responses.py
+from typing import Dict, List, Optional, Tuple
+import gzip
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，没有时使用标准库
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 小于该字节数的响应不压缩
+MIN_COMPRESS_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+PLACES_FORMATS = ('inline', 'table')
+
+def _default(value):
+    """orjson无法直接序列化的类型（datetime、Decimal等）沿用Django的处理方式"""
+    return DjangoJSONEncoder().default(value)
+
+def dumps(data) -> bytes:
+    """序列化为JSON，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(
+            data,
+            default=_default,
+            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+    return json.dumps(data, cls=DjangoJSONEncoder).encode('utf-8')
+
+def _place_key(place: Dict, keys_by_object: Dict[int, str]) -> str:
+    if place.get('place_id'):
+        return place['place_id']
+    # 虚拟餐厅等没有place_id的地点按对象去重
+    key = keys_by_object.get(id(place))
+    if key is None:
+        key = f"place-{len(keys_by_object)}"
+        keys_by_object[id(place)] = key
+    return key
+
+def dedupe_places(events: List[Dict]) -> Tuple[List[Dict], Dict[str, Dict]]:
+    """
+    将事件中内嵌的地点数据提取到地点表中，事件改为通过placeId引用。
+    返回新的事件列表和 {placeId: 地点数据}，原事件不会被修改。
+    """
+    places = {}
+    keys_by_object = {}
+    deduped = []
+    for event in events:
+        place = event.get('place')
+        if not place:
+            deduped.append(event)
+            continue
+        key = _place_key(place, keys_by_object)
+        places.setdefault(key, place)
+        event = {name: value for name, value in event.items() if name != 'place'}
+        event['placeId'] = key
+        deduped.append(event)
+    return deduped, places
+
+def inline_places(events: List[Dict], places: Dict[str, Dict]) -> List[Dict]:
+    """dedupe_places的逆操作：按placeId把地点数据放回事件中"""
+    inlined = []
+    for event in events:
+        if 'placeId' in event:
+            place_id = event['placeId']
+            event = {name: value for name, value in event.items() if name != 'placeId'}
+            event['place'] = places[place_id]
+        inlined.append(event)
+    return inlined
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """根据Accept-Encoding选择压缩方式，优先br（需安装brotli），其次gzip"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            accepted[coding.strip().lower()] = quality
+
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    for coding in candidates:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(content, quality=BROTLI_QUALITY)
+    # mtime=0使相同内容得到相同的压缩结果
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+def json_response(request, data, status: int = 200) -> HttpResponse:
+    """使用快速序列化并按Accept-Encoding压缩的JSON响应"""
+    content = dumps(data)
+    response = HttpResponse(content_type='application/json', status=status)
+    response['Vary'] = 'Accept-Encoding'
+
+    encoding = None
+    if len(content) >= MIN_COMPRESS_SIZE:
+        encoding = negotiate_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    if encoding:
+        content = compress(content, encoding)
+        response['Content-Encoding'] = encoding
+    response.content = content
+    return response
+
+def schedule_response(request, result: Dict, places_format: str = 'inline', status: int = 200) -> HttpResponse:
+    """
+    行程结果的响应。places_format为'table'时地点数据去重到顶层places表，
+    事件通过placeId引用；默认'inline'保持原有格式。
+    """
+    if places_format == 'table' and 'events' in result:
+        events, places = dedupe_places(result['events'])
+        result = {**result, 'events': events, 'places': places}
+    return json_response(request, result, status=status)
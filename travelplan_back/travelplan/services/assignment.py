@@ -0,0 +1,123 @@
+# services/assignment.py
+from math import ceil
+from typing import Callable, Dict, List
+import numpy as np
+
+from .utils import haversine_distance
+
+DEFAULT_RESTAURANT_ASSIGNMENT = 'proximity'
+
+def _coordinates(places: List[Dict]) -> np.ndarray:
+    return np.array(
+        [[p['location']['lat'], p['location']['lng']] for p in places],
+        dtype=float
+    ).reshape(-1, 2)
+
+def day_centroids(place_clusters: List[List[Dict]], fallback_places: List[Dict]) -> np.ndarray:
+    """每天景点的中心（纬度, 经度）；没有景点的天使用fallback_places的中心"""
+    fallback = _coordinates(fallback_places).mean(axis=0)
+    return np.array([
+        _coordinates(cluster).mean(axis=0) if cluster else fallback
+        for cluster in place_clusters
+    ]).reshape(-1, 2)
+
+def restaurant_day_costs(restaurants: List[Dict], centroids: np.ndarray) -> np.ndarray:
+    """餐厅到每天中心的球面距离（公里），形状为(餐厅数, 天数)"""
+    coordinates = _coordinates(restaurants)
+    return haversine_distance(
+        coordinates[:, 0:1], coordinates[:, 1:2],
+        centroids[:, 0], centroids[:, 1]
+    ) / 1000
+
+def assign_restaurants_by_proximity(
+    restaurants: List[Dict],
+    place_clusters: List[List[Dict]],
+    num_days: int
+) -> List[List[Dict]]:
+    """
+    按餐厅到每天景点中心的距离做最小费用指派（匈牙利算法）。
+    每天依次有午餐、晚餐和备选名额，低一档的名额全部用完前不使用高一档的名额，
+    因此餐厅足够时每天都先有真实的午餐和晚餐餐厅，在此前提下总距离最短。
+    """
+    # scipy只在分配时使用，延迟导入以缩短worker启动时间
+    from scipy.optimize import linear_sum_assignment
+
+    assignment = [[] for _ in range(num_days)]
+    if not restaurants:
+        return assignment
+
+    fallback_places = [place for cluster in place_clusters for place in cluster] or restaurants
+    costs = restaurant_day_costs(restaurants, day_centroids(place_clusters[:num_days], fallback_places))
+
+    # 列按(档位, 天)排列：档位0为午餐，1为晚餐，之后为备选。
+    # 每档的惩罚大于所有距离之和，保证先填满低档名额
+    tiers = ceil(len(restaurants) / num_days)
+    penalty = costs.max() * len(restaurants) + 1
+    cost_matrix = np.hstack([costs + tier * penalty for tier in range(tiers)])
+    rows, cols = linear_sum_assignment(cost_matrix)
+
+    # 每天的餐厅保持输入顺序
+    for row, col in sorted(zip(rows, cols)):
+        assignment[col % num_days].append(restaurants[row])
+    return assignment
+
+def assign_restaurants_alternating(
+    restaurants: List[Dict],
+    place_clusters: List[List[Dict]],
+    num_days: int
+) -> List[List[Dict]]:
+    """原有的分配方式：餐厅聚成(num_days + 1) // 2组，每组平分给相邻的两天，与景点位置无关"""
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import pdist
+
+    assignment = [[] for _ in range(num_days)]
+    if not restaurants:
+        return assignment
+
+    # 计算合适的餐厅聚类数量
+    restaurant_cluster_count = max(1, (num_days + 1) // 2)
+
+    if len(restaurants) > 1:
+        restaurant_distances = pdist(_coordinates(restaurants), metric='euclidean')
+        restaurant_linkage = linkage(restaurant_distances, method='ward')
+        restaurant_labels = fcluster(restaurant_linkage,
+                                     restaurant_cluster_count,
+                                     criterion='maxclust')
+
+        # 将餐厅按聚类分组
+        restaurant_clusters = [[] for _ in range(restaurant_cluster_count)]
+        for restaurant, label in zip(restaurants, restaurant_labels):
+            restaurant_clusters[label - 1].append(restaurant)
+    else:
+        restaurant_clusters = [[restaurants[0]]]
+
+    restaurant_cluster_idx = 0
+    for i in range(0, num_days, 2):
+        if restaurant_cluster_idx < len(restaurant_clusters):
+            current_restaurants = restaurant_clusters[restaurant_cluster_idx]
+            # 如果这个餐厅集群有多个餐厅，尝试分到相邻的两天
+            if len(current_restaurants) > 1:
+                mid = len(current_restaurants) // 2
+                assignment[i].extend(current_restaurants[:mid])
+                if i + 1 < num_days:
+                    assignment[i + 1].extend(current_restaurants[mid:])
+            else:
+                assignment[i].extend(current_restaurants)
+            restaurant_cluster_idx += 1
+    return assignment
+
+RESTAURANT_ASSIGNMENT_STRATEGIES: Dict[str, Callable[[List[Dict], List[List[Dict]], int], List[List[Dict]]]] = {
+    'proximity': assign_restaurants_by_proximity,
+    'alternating': assign_restaurants_alternating
+}
+
+def assign_restaurants(
+    restaurants: List[Dict],
+    place_clusters: List[List[Dict]],
+    num_days: int,
+    strategy: str = DEFAULT_RESTAURANT_ASSIGNMENT
+) -> List[List[Dict]]:
+    """把餐厅分配到各天，返回每天的餐厅列表"""
+    if strategy not in RESTAURANT_ASSIGNMENT_STRATEGIES:
+        raise ValueError(f"Unknown restaurant assignment strategy: {strategy}")
+    return RESTAURANT_ASSIGNMENT_STRATEGIES[strategy](restaurants, place_clusters, num_days)
@@ -0,0 +1,276 @@
+# services/calendar_export.py
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+import hashlib
+import json
+import logging
+import threading
+
+from .metrics import record_cache
+from .utils import parse_time_minutes
+
+logger = logging.getLogger(__name__)
+
+PRODID = '-//Trip Planner//TripSchedule//EN'
+UID_DOMAIN = 'tripplanner'
+
+# 流式输出时每个数据块的大致大小（字节），避免每个VEVENT单独写出
+CHUNK_SIZE = 16 * 1024
+
+DEFAULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+def escape_text(value) -> str:
+    """按RFC 5545转义TEXT类型的值"""
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace(';', '\\;')
+        .replace(',', '\\,')
+        .replace('\r\n', '\\n')
+        .replace('\n', '\\n')
+    )
+
+def fold_line(line: str) -> bytes:
+    """按RFC 5545将内容行折叠为不超过75字节的行（不拆分UTF-8多字节字符）"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return encoded + b'\r\n'
+
+    parts = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # 不在UTF-8续字节处断开
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end])
+        start = end
+        limit = 74  # 续行以一个空格开头
+    return b'\r\n '.join(parts) + b'\r\n'
+
+def format_datetime(value: datetime) -> str:
+    return value.strftime('%Y%m%dT%H%M%S')
+
+def parse_start_date(value: Optional[str]) -> date:
+    """解析行程开始日期（YYYY-MM-DD），未提供时使用今天"""
+    if not value:
+        return date.today()
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def render_event(
+    event: Dict,
+    start_date: date,
+    uid: str,
+    dtstamp: str,
+    trip_name: Optional[str] = None
+) -> bytes:
+    """渲染单个地点事件的VEVENT，事件的day为相对开始日期的天数"""
+    event_date = datetime.combine(start_date, datetime.min.time()) + timedelta(days=int(event['day']))
+    start = event_date + timedelta(minutes=parse_time_minutes(event['startTime']))
+    end = event_date + timedelta(minutes=parse_time_minutes(event['endTime']))
+
+    lines = [
+        'BEGIN:VEVENT',
+        f"SUMMARY:{escape_text(event['title'])}",
+        f"DTSTART:{format_datetime(start)}",
+        f"DTEND:{format_datetime(end)}",
+        f"DTSTAMP:{dtstamp}",
+        f"UID:{uid}"
+    ]
+    if trip_name:
+        lines.append(f"CATEGORIES:{escape_text(trip_name)}")
+    place = event.get('place')
+    if place:
+        rating = place.get('rating', 'N/A')
+        lines.append(f"LOCATION:{escape_text(place.get('vicinity', ''))}")
+        lines.append(f"DESCRIPTION:{escape_text(f'Rating: {rating}')}")
+    lines.append('END:VEVENT')
+    return b''.join(fold_line(line) for line in lines)
+
+def normalize_trips(data: Dict) -> List[Dict]:
+    """
+    读取导出请求中的行程：支持多行程格式 {'trips': [{'events', 'startDate', 'name'}]}
+    和原有的单行程格式 {'events', 'startDate'}
+    """
+    if 'trips' in data:
+        trips = data['trips']
+    else:
+        trips = [{'events': data.get('events', []), 'startDate': data.get('startDate')}]
+    return [
+        {
+            'events': trip.get('events', []),
+            'start_date': parse_start_date(trip.get('startDate')),
+            'name': trip.get('name')
+        }
+        for trip in trips
+    ]
+
+def iter_calendar(trips: Iterable[Dict], dtstamp: Optional[datetime] = None) -> Iterator[bytes]:
+    """
+    逐个生成VEVENT并按CHUNK_SIZE分块输出完整的ICS文档。
+    只导出有开始和结束时间的地点事件（酒店和交通事件不导出），
+    响应头已发出后无法再返回错误，因此格式错误的事件记录日志后跳过。
+    """
+    stamp = format_datetime(dtstamp or datetime.now(timezone.utc)) + 'Z'
+    buffer = [fold_line('BEGIN:VCALENDAR'), fold_line('VERSION:2.0'), fold_line(f'PRODID:{PRODID}')]
+    size = 0
+
+    for trip_index, trip in enumerate(trips):
+        for event_index, event in enumerate(trip['events']):
+            if event.get('type') != 'place' or not (event.get('startTime') and event.get('endTime')):
+                continue
+            uid = f"{trip_index}-{event.get('id', event_index)}@{UID_DOMAIN}"
+            try:
+                chunk = render_event(event, trip['start_date'], uid, stamp, trip['name'])
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Skipping calendar event {uid}: {str(e)}")
+                continue
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+
+    buffer.append(fold_line('END:VCALENDAR'))
+    yield b''.join(buffer)
+
+def calendar_hash(trips: List[Dict]) -> str:
+    """
+    计算导出内容的哈希：只包含影响ICS内容的字段（开始日期、行程名和事件的时间、标题、地址、评分），
+    相同行程的导出得到相同的哈希
+    """
+    projection = [
+        {
+            'start_date': trip['start_date'].isoformat(),
+            'name': trip['name'],
+            'events': [
+                (
+                    event.get('id'), event.get('type'), event.get('day'), event.get('title'),
+                    event.get('startTime'), event.get('endTime'),
+                    (event.get('place') or {}).get('vicinity'),
+                    (event.get('place') or {}).get('rating')
+                )
+                for event in trip['events']
+            ]
+        }
+        for trip in trips
+    ]
+    payload = json.dumps(projection, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# 进程内缓存的Django缓存后端：各worker不共享，不能用于分享链接
+LOCAL_CACHE_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache'
+)
+
+class CalendarCache:
+    """
+    按内容哈希缓存渲染好的ICS，线程安全。进程内为LRU（按总字节数限制），
+    配置了CALENDAR_CACHE_ALIAS时同时写入该Django缓存（文件、Redis等），所有worker都能读取，
+    分享链接因此在任一worker上都有效。该缓存应专用于日历，clear()会清空它。
+    """
+
+    def __init__(self, max_bytes: Optional[int] = None):
+        self._max_bytes = max_bytes
+        self._entries: OrderedDict = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_bytes(self) -> int:
+        # 未指定时在第一次使用时读取配置，导入本模块不需要Django配置
+        if self._max_bytes is None:
+            self._max_bytes = _get_cache_max_bytes()
+        return self._max_bytes
+
+    @property
+    def max_entry_bytes(self) -> int:
+        return self.max_bytes // 4
+
+    @property
+    def shared_cache(self):
+        """配置的Django缓存（每次按别名获取，测试中修改CACHES配置后也能生效），未配置时为None"""
+        from django.conf import settings
+        from django.core.cache import caches
+
+        alias = getattr(settings, 'CALENDAR_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    @property
+    def shared(self) -> bool:
+        """缓存的日历能否被其他worker读取，即能否提供分享链接"""
+        from django.conf import settings
+
+        alias = getattr(settings, 'CALENDAR_CACHE_ALIAS', None)
+        return bool(alias) and settings.CACHES[alias]['BACKEND'] not in LOCAL_CACHE_BACKENDS
+
+    @staticmethod
+    def _key(digest: str) -> str:
+        return f'calendar:{digest}'
+
+    def get(self, digest: str) -> Optional[bytes]:
+        with self._lock:
+            content = self._entries.get(digest)
+            if content is not None:
+                self._entries.move_to_end(digest)
+        if content is None:
+            shared_cache = self.shared_cache
+            if shared_cache is not None:
+                content = shared_cache.get(self._key(digest))
+                if content is not None:
+                    self._store_local(digest, content)
+        record_cache('calendar', content is not None)
+        return content
+
+    def store(self, digest: str, content: bytes) -> None:
+        if len(content) > self.max_entry_bytes:
+            return
+        self._store_local(digest, content)
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.set(self._key(digest), content)
+
+    def _store_local(self, digest: str, content: bytes) -> None:
+        max_bytes = self.max_bytes
+        with self._lock:
+            previous = self._entries.pop(digest, None)
+            if previous is not None:
+                self._size -= len(previous)
+            self._entries[digest] = content
+            self._size += len(content)
+            while self._size > max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+        shared_cache = self.shared_cache
+        if shared_cache is not None:
+            shared_cache.clear()
+
+    def stream_and_store(self, digest: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """原样输出数据块，完整输出后存入缓存（超过单条上限或中途断开时不缓存）"""
+        parts = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size <= self.max_entry_bytes:
+                    parts.append(chunk)
+                else:
+                    parts = None
+            yield chunk
+        if parts is not None:
+            self.store(digest, b''.join(parts))
+
+def _get_cache_max_bytes() -> int:
+    from django.conf import settings
+    return getattr(settings, 'CALENDAR_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES)
+
+calendar_cache = CalendarCache()
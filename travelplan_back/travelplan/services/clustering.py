@@ -1,18 +1,29 @@
 # services/clustering.py
-from datetime import datetime, time, timedelta
+from datetime import time
 from math import ceil
-from typing import List, Dict, Any, Optional, Tuple
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Sequence, Tuple
+import hashlib
+import threading
 import numpy as np
-from scipy.cluster.hierarchy import linkage, fcluster
-from scipy.spatial.distance import pdist, squareform
 import logging
-from .utils import TRANSPORT_SPEEDS
+from .assignment import DEFAULT_RESTAURANT_ASSIGNMENT, assign_restaurants
+from .metrics import record_cache
+from .places import COMPACT_REQUIRED_FIELDS, is_compact_place
+from .utils import TRANSPORT_SPEEDS, MINUTES_PER_DAY, time_to_minutes
 
 logger = logging.getLogger(__name__)
 
-__all__ = ['preprocess_places', 'hierarchical_clustering', 'PlaceConstraints', 'create_empty_restaurant']
+__all__ = [
+    'preprocess_places', 'hierarchical_clustering', 'PlaceConstraints', 'create_empty_restaurant',
+    'ConstraintProfile', 'get_constraint_profile', 'register_constraint_profile',
+    'VisitDurationModel'
+]
 
 class PlaceConstraints:
+    # 默认约束配置的id，见get_constraint_profile
+    PROFILE_ID = 'default'
+
     # 新的时间配置
     DINING_WINDOWS = {
         'lunch': {
@@ -86,6 +97,146 @@ class PlaceConstraints:
         }
     }
 
+    # 按一天中每分钟预计算的查找表，由rebuild_tables()生成，下标为从午夜开始的分钟数
+    DAY_START = 0
+    DAY_END = 0
+    WINDOW_MINUTES = {}
+    IS_LUNCH = ()
+    IS_DINNER = ()
+    LUNCH_SCORE = ()
+    DINNER_SCORE = ()
+
+    @classmethod
+    def rebuild_tables(cls) -> None:
+        """根据当前的用餐窗口和每日约束重新生成查找表"""
+        for name, value in derive_constraint_tables(cls.DINING_WINDOWS, cls.DAY_CONSTRAINTS).items():
+            setattr(cls, name, value)
+
+    @classmethod
+    def update(
+        cls,
+        dining_windows: Optional[Dict[str, Dict[str, time]]] = None,
+        day_constraints: Optional[Dict[str, time]] = None
+    ) -> None:
+        """更新用餐窗口或每日约束（如按城市或用户定制）并重建查找表"""
+        if dining_windows is not None:
+            cls.DINING_WINDOWS = merge_nested(cls.DINING_WINDOWS, dining_windows)
+        if day_constraints is not None:
+            cls.DAY_CONSTRAINTS = {**cls.DAY_CONSTRAINTS, **day_constraints}
+        cls.rebuild_tables()
+
+class ConstraintProfile:
+    """
+    不可变的约束配置。
+
+    与PlaceConstraints提供相同的属性（包括预计算的查找表），可以按请求传给
+    聚类、路线优化、日程生成和评估指标，而无需修改全局的PlaceConstraints。
+    未覆盖的配置项取自创建时的PlaceConstraints。
+    """
+
+    def __init__(
+        self,
+        profile_id: str,
+        dining_windows: Optional[Dict[str, Dict[str, time]]] = None,
+        day_constraints: Optional[Dict[str, time]] = None,
+        place_duration: Optional[Dict[str, Dict[str, int]]] = None
+    ):
+        windows = merge_nested(PlaceConstraints.DINING_WINDOWS, dining_windows or {})
+        day = {**PlaceConstraints.DAY_CONSTRAINTS, **(day_constraints or {})}
+        durations = merge_nested(PlaceConstraints.PLACE_DURATION, place_duration or {})
+
+        values = {
+            'PROFILE_ID': profile_id,
+            'DINING_WINDOWS': _freeze(windows),
+            'DAY_CONSTRAINTS': _freeze(day),
+            'PLACE_DURATION': _freeze(durations),
+            'EMPTY_RESTAURANT_TEMPLATE': _freeze(PlaceConstraints.EMPTY_RESTAURANT_TEMPLATE),
+        }
+        values.update(derive_constraint_tables(windows, day))
+        values['WINDOW_MINUTES'] = _freeze(values['WINDOW_MINUTES'])
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"ConstraintProfile '{self.PROFILE_ID}' is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"ConstraintProfile '{self.PROFILE_ID}' is immutable")
+
+    def __repr__(self) -> str:
+        return f"ConstraintProfile({self.PROFILE_ID!r})"
+
+# 内置的约束配置，只列出与默认配置不同的部分
+DEFAULT_PROFILE_ID = PlaceConstraints.PROFILE_ID
+CONSTRAINT_PROFILES = {
+    'late_riser': {
+        'day_constraints': {'start': time(10, 30), 'end': time(22, 0)},
+        'dining_windows': {
+            'lunch': {'start': time(12, 0), 'end': time(15, 0), 'optimal': time(13, 30)},
+            'dinner': {'start': time(18, 0), 'end': time(21, 0), 'optimal': time(19, 30)}
+        }
+    },
+    'spanish_dinner': {
+        'day_constraints': {'end': time(23, 30)},
+        'dining_windows': {
+            'lunch': {'start': time(13, 0), 'end': time(16, 0), 'optimal': time(14, 30)},
+            'dinner': {'start': time(20, 0), 'end': time(23, 0), 'optimal': time(21, 30)}
+        }
+    }
+}
+
+_profile_cache: Dict[str, ConstraintProfile] = {}
+_profile_lock = threading.Lock()
+
+def get_constraint_profile(profile_id: Optional[str] = None):
+    """
+    按id获取约束配置，构建后缓存，之后的请求直接复用。
+    默认配置直接返回PlaceConstraints本身。
+    """
+    if not profile_id or profile_id == DEFAULT_PROFILE_ID:
+        return PlaceConstraints
+
+    profile = _profile_cache.get(profile_id)
+    record_cache('constraint_profile', profile is not None)
+    if profile is not None:
+        return profile
+
+    if profile_id not in CONSTRAINT_PROFILES:
+        raise ValueError(f"Unknown constraint profile: {profile_id}")
+
+    with _profile_lock:
+        profile = _profile_cache.get(profile_id)
+        if profile is None:
+            profile = ConstraintProfile(profile_id, **CONSTRAINT_PROFILES[profile_id])
+            _profile_cache[profile_id] = profile
+    return profile
+
+def register_constraint_profile(profile_id: str, **overrides) -> ConstraintProfile:
+    """注册（或替换）一个约束配置，例如某个城市或用户的用餐时间"""
+    if profile_id == DEFAULT_PROFILE_ID:
+        raise ValueError("The default profile is PlaceConstraints and cannot be replaced")
+
+    profile = ConstraintProfile(profile_id, **overrides)
+    with _profile_lock:
+        CONSTRAINT_PROFILES[profile_id] = overrides
+        _profile_cache[profile_id] = profile
+    return profile
+
+def merge_nested(base: Dict[str, Dict], overrides: Dict[str, Dict]) -> Dict[str, Dict]:
+    """合并两层字典配置（如用餐窗口、访问时间），返回新的字典"""
+    merged = {key: dict(value) for key, value in base.items()}
+    for key, value in overrides.items():
+        merged.setdefault(key, {}).update(value)
+    return merged
+
+def _freeze(value):
+    """将嵌套字典转换为只读映射"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(value)
+    return value
+
 def create_empty_restaurant(meal_type: str, location: Dict[str, float]) -> Dict:
     """创建空白餐厅"""
     template = {
@@ -149,16 +300,144 @@ def calculate_time_score(t: time, window: Dict[str, time]) -> float:
     diff = abs(current_minutes - optimal_minutes)
     return 1 - (diff / max_diff)
 
-def preprocess_places(places: List[Dict[Any, Any]]) -> Tuple[List[Dict], Optional[Dict]]:
-    """预处理地点数据，返回(普通地点列表, 酒店地点)"""
+def build_window_tables(window: Dict[str, time]) -> Tuple[Tuple[bool, ...], Tuple[float, ...]]:
+    """为一个时间窗口生成按分钟索引的(是否在窗口内, 时间评分)查找表"""
+    in_window = []
+    scores = []
+    for minute in range(MINUTES_PER_DAY):
+        t = time(minute // 60, minute % 60)
+        in_window.append(is_time_within_window(t, window))
+        scores.append(calculate_time_score(t, window))
+    return tuple(in_window), tuple(scores)
+
+def derive_constraint_tables(
+    dining_windows: Dict[str, Dict[str, time]],
+    day_constraints: Dict[str, time]
+) -> Dict[str, Any]:
+    """根据用餐窗口和每日约束计算按分钟表示的派生值和查找表"""
+    is_lunch, lunch_score = build_window_tables(dining_windows['lunch'])
+    is_dinner, dinner_score = build_window_tables(dining_windows['dinner'])
+    return {
+        'DAY_START': time_to_minutes(day_constraints['start']),
+        'DAY_END': time_to_minutes(day_constraints['end']),
+        'WINDOW_MINUTES': {
+            meal: {key: time_to_minutes(value) for key, value in window.items()}
+            for meal, window in dining_windows.items()
+        },
+        'IS_LUNCH': is_lunch,
+        'LUNCH_SCORE': lunch_score,
+        'IS_DINNER': is_dinner,
+        'DINNER_SCORE': dinner_score
+    }
+
+PlaceConstraints.rebuild_tables()
+
+class VisitDurationModel:
+    """
+    确定性的访问时长模型。
+
+    每个地点的时长只由(place_id, seed)决定，同一请求总是得到相同的行程，
+    便于缓存和性能对比。可选的history按地点类型提供历史访问时长（分钟），
+    有历史数据的类型按经验分布取值，其余类型在[min, max]内均匀取值。
+    """
+
+    def __init__(self, seed: int = 0, history: Optional[Dict[str, Sequence[float]]] = None):
+        self.seed = seed
+        self.history = {
+            place_type: np.sort(np.asarray(samples, dtype=float))
+            for place_type, samples in (history or {}).items()
+            if len(samples)
+        }
+
+    def uniforms(self, place_ids: Sequence[str]) -> np.ndarray:
+        """由(place_id, seed)的哈希得到[0, 1)内的确定性均匀值"""
+        keys = np.fromiter(
+            (
+                int.from_bytes(
+                    hashlib.blake2b(f"{self.seed}:{place_id}".encode(), digest_size=8).digest(),
+                    'little'
+                )
+                for place_id in place_ids
+            ),
+            dtype=np.uint64,
+            count=len(place_ids)
+        )
+        # 取高53位，保证结果严格小于1
+        return (keys >> np.uint64(11)).astype(float) / float(1 << 53)
+
+    def durations(
+        self,
+        place_ids: Sequence[str],
+        place_types: Sequence[str],
+        constraints=None
+    ) -> np.ndarray:
+        """批量计算访问时长（分钟），结果限制在对应类型的[min, max]内"""
+        constraints = constraints or PlaceConstraints
+        if not len(place_ids):
+            return np.zeros(0, dtype=int)
+
+        configs = [
+            constraints.PLACE_DURATION.get(place_type, constraints.PLACE_DURATION['default'])
+            for place_type in place_types
+        ]
+        lows = np.array([config['min'] for config in configs])
+        highs = np.array([config['max'] for config in configs])
+        u = self.uniforms(place_ids)
+
+        # 默认在[min, max]内均匀取整数
+        result = lows + np.floor(u * (highs - lows + 1)).astype(int)
+
+        types = np.asarray(place_types)
+        for place_type, samples in self.history.items():
+            mask = types == place_type
+            if mask.any():
+                index = np.floor(u[mask] * len(samples)).astype(int)
+                result[mask] = np.rint(samples[index]).astype(int)
+
+        return np.clip(result, lows, highs)
+
+    def duration(self, place_id: str, place_type: str, constraints=None) -> int:
+        """计算单个地点的访问时长（分钟）"""
+        return int(self.durations([place_id], [place_type], constraints)[0])
+
+DEFAULT_DURATION_MODEL = VisitDurationModel()
+
+def preprocess_places(
+    places: List[Dict[Any, Any]],
+    constraints=None,
+    duration_model: Optional[VisitDurationModel] = None
+) -> Tuple[List[Dict], Optional[Dict]]:
+    """
+    预处理地点数据，返回(普通地点列表, 酒店地点)。
+    地点可以是完整的Google数据，也可以是精简格式（见services/places.py），
+    精简格式中的duration会覆盖访问时长模型的结果。
+    """
     try:
+        constraints = constraints or PlaceConstraints
+        duration_model = duration_model or DEFAULT_DURATION_MODEL
         processed_places = []
+        duration_keys = []
+        duration_overrides = {}
         hotel = None
         
         for place in places:
-            if not all(key in place for key in ['geometry', 'types', 'name']):
-                logger.warning(f"Skipping place {place.get('name', 'Unknown')}: Missing required fields")
-                continue
+            if is_compact_place(place):
+                if not all(key in place for key in COMPACT_REQUIRED_FIELDS):
+                    logger.warning(f"Skipping place {place.get('id', 'Unknown')}: Missing required fields")
+                    continue
+                place_id = place['id']
+                name = place.get('name') or place_id
+                location = {'lat': place['lat'], 'lng': place['lng']}
+            else:
+                if not all(key in place for key in ['geometry', 'types', 'name']):
+                    logger.warning(f"Skipping place {place.get('name', 'Unknown')}: Missing required fields")
+                    continue
+                place_id = place.get('place_id')
+                name = place['name']
+                location = {
+                    'lat': place['geometry']['location']['lat'],
+                    'lng': place['geometry']['location']['lng']
+                }
             
             types = place.get('types', [])
             
@@ -166,13 +445,10 @@ def preprocess_places(places: List[Dict[Any, Any]]) -> Tuple[List[Dict], Optiona
             if 'lodging' in types or 'hotel' in types:
                 if hotel is None:  # 只处理第一个酒店
                     hotel = {
-                        'place_id': place.get('place_id', 'hotel'),
-                        'id': place.get('place_id', 'hotel'),
-                        'name': place['name'],
-                        'location': {
-                            'lat': place['geometry']['location']['lat'],
-                            'lng': place['geometry']['location']['lng']
-                        },
+                        'place_id': place_id or 'hotel',
+                        'id': place_id or 'hotel',
+                        'name': name,
+                        'location': location,
                         'type': 'hotel',
                         'visit_duration': 0,  # 酒店作为起终点不计时间
                         'is_hotel': True,
@@ -190,29 +466,19 @@ def preprocess_places(places: List[Dict[Any, Any]]) -> Tuple[List[Dict], Optiona
                 else 'default'
             )
             
-            # 获取该类型地点的时间配置
-            duration_config = PlaceConstraints.PLACE_DURATION.get(
-                place_type, 
-                PlaceConstraints.PLACE_DURATION['default']
-            )
-            
-            # 生成访问时间
-            from random import randint
-            visit_duration = randint(
-                duration_config['min'],
-                duration_config['max']
-            )
+            # 访问时长在循环结束后按(place_id, seed)批量生成
+            duration_keys.append(place_id or name)
+            if place.get('duration') is not None and is_compact_place(place):
+                duration_overrides[len(processed_places)] = int(place['duration'])
             
+            place_id = place_id or str(len(processed_places))
             processed_place = {
-                'place_id': place.get('place_id', str(len(processed_places))),
-                'id': place.get('place_id', str(len(processed_places))),  # 确保同时有 place_id 和 id
-                'name': place['name'],
-                'location': {
-                    'lat': place['geometry']['location']['lat'],
-                    'lng': place['geometry']['location']['lng']
-                },
+                'place_id': place_id,
+                'id': place_id,  # 确保同时有 place_id 和 id
+                'name': name,
+                'location': location,
                 'type': place_type,
-                'visit_duration': visit_duration,
+                'visit_duration': 0,
                 'rating': place.get('rating', 0),
                 'user_ratings_total': place.get('user_ratings_total', 0),
                 'price_level': place.get('price_level', 2),
@@ -225,6 +491,16 @@ def preprocess_places(places: List[Dict[Any, Any]]) -> Tuple[List[Dict], Optiona
         if not processed_places:
             raise ValueError("No valid places after preprocessing")
         
+        durations = duration_model.durations(
+            duration_keys,
+            [p['type'] for p in processed_places],
+            constraints
+        )
+        for processed_place, visit_duration in zip(processed_places, durations.tolist()):
+            processed_place['visit_duration'] = visit_duration
+        for index, visit_duration in duration_overrides.items():
+            processed_places[index]['visit_duration'] = visit_duration
+        
         return processed_places, hotel
         
     except Exception as e:
@@ -234,9 +510,16 @@ def preprocess_places(places: List[Dict[Any, Any]]) -> Tuple[List[Dict], Optiona
 def hierarchical_clustering(
     places: List[Dict],
     num_days: int,
-    transport_mode: str
+    transport_mode: str,
+    constraints=None,
+    restaurant_assignment: str = DEFAULT_RESTAURANT_ASSIGNMENT
 ) -> List[List[Dict]]:
+    # scipy只在聚类时使用，延迟导入以缩短worker启动时间
+    from scipy.cluster.hierarchy import linkage, fcluster
+    from scipy.spatial.distance import pdist
+
     try:
+        constraints = constraints or PlaceConstraints
         if not places:
             return [[] for _ in range(num_days)]
         
@@ -281,10 +564,7 @@ def hierarchical_clustering(
         # [新增] 计算每天可用时间
         LUNCH_DURATION = 75  # 分钟
         DINNER_DURATION = 75  # 分钟
-        day_start = PlaceConstraints.DAY_CONSTRAINTS['start']
-        day_end = PlaceConstraints.DAY_CONSTRAINTS['end']
-        total_minutes = (datetime.combine(datetime.today(), day_end) - 
-                        datetime.combine(datetime.today(), day_start)).total_seconds() / 60
+        total_minutes = constraints.DAY_END - constraints.DAY_START
         available_minutes = total_minutes - LUNCH_DURATION - DINNER_DURATION
         
         # [新增] 计算平均访问时间
@@ -354,32 +634,6 @@ def hierarchical_clustering(
                 # 只有一个地点的情况
                 place_clusters[0].append(other_places[0])
         
-        # [保持原有] 餐厅聚类逻辑
-        if restaurants:
-            restaurant_coordinates = np.array([
-                [p['location']['lat'], p['location']['lng']]
-                for p in restaurants
-            ])
-            
-            # 计算合适的餐厅聚类数量
-            restaurant_cluster_count = max(1, (num_days + 1) // 2)
-            
-            if len(restaurants) > 1:
-                restaurant_distances = pdist(restaurant_coordinates, metric='euclidean')
-                restaurant_linkage = linkage(restaurant_distances, method='ward')
-                restaurant_labels = fcluster(restaurant_linkage, 
-                                          restaurant_cluster_count, 
-                                          criterion='maxclust')
-                
-                # 将餐厅按聚类分组
-                restaurant_clusters = [[] for _ in range(restaurant_cluster_count)]
-                for restaurant, label in zip(restaurants, restaurant_labels):
-                    restaurant_clusters[label - 1].append(restaurant)
-            else:
-                restaurant_clusters = [[restaurants[0]]]
-        else:
-            restaurant_clusters = []
-        
         # [新增] 合并餐厅和地点聚类
         final_clusters = [[] for _ in range(num_days)]
         
@@ -388,21 +642,10 @@ def hierarchical_clustering(
             if i < num_days:
                 final_clusters[i].extend(cluster)
         
-        # 然后分配餐厅
-        restaurant_cluster_idx = 0
-        for i in range(0, num_days, 2):
-            if restaurant_cluster_idx < len(restaurant_clusters):
-                current_restaurants = restaurant_clusters[restaurant_cluster_idx]
-                # 如果这个餐厅集群有多个餐厅，尝试分到相邻的两天
-                if len(current_restaurants) > 1:
-                    mid = len(current_restaurants) // 2
-                    if i < num_days:
-                        final_clusters[i].extend(current_restaurants[:mid])
-                    if i + 1 < num_days:
-                        final_clusters[i + 1].extend(current_restaurants[mid:])
-                else:
-                    final_clusters[i].extend(current_restaurants)
-                restaurant_cluster_idx += 1
+        # 然后按每天景点的位置分配餐厅
+        day_restaurants = assign_restaurants(restaurants, place_clusters, num_days, restaurant_assignment)
+        for i, assigned in enumerate(day_restaurants):
+            final_clusters[i].extend(assigned)
         
         # [保持原有] 为没有餐厅的天数添加虚拟餐厅
         cluster_center = {
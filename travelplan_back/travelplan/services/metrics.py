@@ -0,0 +1,219 @@
+# services/metrics.py
+from functools import wraps
+from typing import Dict, Iterable, Optional, Tuple
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+
+from .timing import Histogram, stage_histograms
+
+# 请求及上游调用耗时直方图的桶上界（秒）
+LATENCY_BUCKETS_SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _format_number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class Counter:
+    """带标签的计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def render(self) -> str:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labelvalues, value in values:
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}{labels} {_format_number(value)}')
+        return '\n'.join(lines)
+
+class LabeledHistogram:
+    """带标签的直方图，每组标签对应一个timing.Histogram"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS_SECONDS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._histograms: Dict[Tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues) -> None:
+        histogram = self._histograms.get(labelvalues)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(labelvalues, Histogram(self.buckets))
+        histogram.observe(value)
+
+    def snapshots(self) -> Dict[Tuple, Dict]:
+        with self._lock:
+            histograms = dict(self._histograms)
+        return {labelvalues: histogram.snapshot() for labelvalues, histogram in histograms.items()}
+
+    def render(self) -> str:
+        return render_histogram(
+            self.name, self.documentation, self.labelnames, self.snapshots()
+        )
+
+def render_histogram(
+    name: str,
+    documentation: str,
+    labelnames: Tuple[str, ...],
+    snapshots: Dict[Tuple, Dict],
+    scale: float = 1
+) -> str:
+    """将直方图快照渲染为Prometheus文本格式，scale用于单位换算（如毫秒转秒）"""
+    lines = [f'# HELP {name} {documentation}', f'# TYPE {name} histogram']
+    for labelvalues, snapshot in sorted(snapshots.items()):
+        for bound, count in snapshot['buckets']:
+            le = f'le="{_format_number(bound * scale)}"'
+            lines.append(f'{name}_bucket{_format_labels(labelnames, labelvalues, le)} {count}')
+        labels = _format_labels(labelnames, labelvalues)
+        lines.append(f'{name}_sum{labels} {_format_number(snapshot["sum"] * scale)}')
+        lines.append(f'{name}_count{labels} {snapshot["count"]}')
+    return '\n'.join(lines)
+
+class MetricsRegistry:
+    """
+    进程内的指标注册表，所有操作加锁，WSGI多线程和ASGI下均可使用。
+    多进程部署时每个worker各自独立统计。
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric already registered: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        sections = [metric.render() for metric in metrics]
+        sections.append(render_histogram(
+            'travelplan_schedule_stage_duration_seconds',
+            'Duration of ScheduleService.generate_schedule stages.',
+            ('stage',),
+            {(stage,): snapshot for stage, snapshot in stage_histograms().items()},
+            scale=0.001
+        ))
+        return '\n'.join(sections) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'travelplan_http_requests_total',
+    'HTTP requests handled by the API views.',
+    ('endpoint', 'method', 'status')
+))
+REQUEST_DURATION = REGISTRY.register(LabeledHistogram(
+    'travelplan_http_request_duration_seconds',
+    'Latency of the API views.',
+    ('endpoint',)
+))
+UPSTREAM_DURATION = REGISTRY.register(LabeledHistogram(
+    'travelplan_upstream_request_duration_seconds',
+    'Latency of RapidAPI calls.',
+    ('api',)
+))
+UPSTREAM_FAILURES = REGISTRY.register(Counter(
+    'travelplan_upstream_failures_total',
+    'RapidAPI calls that raised or returned an error status.',
+    ('api',)
+))
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'travelplan_cache_requests_total',
+    'Cache lookups by cache and result (hit/miss).',
+    ('cache', 'result')
+))
+
+def record_cache(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache, 'hit' if hit else 'miss')
+
+def record_upstream(api: str, seconds: float, status: Optional[int] = None) -> None:
+    """记录一次上游调用，status为None（请求异常）或>=400时计为失败"""
+    UPSTREAM_DURATION.observe(seconds, api)
+    if status is None or status >= 400:
+        UPSTREAM_FAILURES.inc(api)
+
+# method标签只使用标准的HTTP方法，其余（客户端可任意构造）统一记为other，避免标签取值无限增长
+HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS', 'CONNECT', 'TRACE'))
+
+def _method_label(method: Optional[str]) -> str:
+    return method if method in HTTP_METHODS else 'other'
+
+def _response_status(response) -> int:
+    # 视图返回None等非响应对象时Django会报错，这里记为500，不在指标中抛出异常
+    return getattr(response, 'status_code', 500)
+
+def _record_request(endpoint: str, method: Optional[str], status: int, start: float) -> None:
+    REQUEST_DURATION.observe(time.perf_counter() - start, endpoint)
+    REQUESTS_TOTAL.inc(endpoint, _method_label(method), str(status))
+
+def instrument_view(endpoint: str):
+    """记录视图的请求数和耗时，支持同步和异步视图；视图抛出异常时记为500"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                start = time.perf_counter()
+                status = 500
+                try:
+                    response = await view(request, *args, **kwargs)
+                    status = _response_status(response)
+                    return response
+                finally:
+                    _record_request(endpoint, request.method, status, start)
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = _response_status(response)
+                return response
+            finally:
+                _record_request(endpoint, request.method, status, start)
+        return wrapper
+    return decorator
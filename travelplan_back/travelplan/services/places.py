@@ -0,0 +1,116 @@
+# services/places.py
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+import threading
+
+from .metrics import record_cache
+
+# 精简格式：{'id', 'lat', 'lng', 'types', 'rating'(可选), 'duration'(可选，分钟), 'name'(可选)}
+COMPACT_REQUIRED_FIELDS = ('id', 'lat', 'lng', 'types')
+
+DEFAULT_PLACE_CACHE_SIZE = 10000
+
+def is_compact_place(place: Dict) -> bool:
+    """判断地点是否为精简格式（顶层直接给出坐标，没有Google的geometry）"""
+    return 'geometry' not in place and 'lat' in place and 'lng' in place
+
+def to_compact_place(place: Dict) -> Dict:
+    """将完整的Google地点数据转换为精简格式"""
+    compact = {
+        'id': place['place_id'],
+        'name': place.get('name'),
+        'lat': place['geometry']['location']['lat'],
+        'lng': place['geometry']['location']['lng'],
+        'types': place.get('types', [])
+    }
+    if 'rating' in place:
+        compact['rating'] = place['rating']
+    return compact
+
+class PlaceCache:
+    """按place_id缓存完整的地点数据（LRU），用于为精简格式的请求还原响应中的地点"""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        self._maxsize = maxsize
+        self._places: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def maxsize(self) -> int:
+        # 未指定时在第一次使用时读取PLACE_CACHE_SIZE配置，导入本模块不需要Django配置
+        if self._maxsize is None:
+            self._maxsize = _get_cache_size()
+        return self._maxsize
+
+    def __len__(self) -> int:
+        return len(self._places)
+
+    def get(self, place_id: str) -> Optional[Dict]:
+        with self._lock:
+            place = self._places.get(place_id)
+            if place is not None:
+                self._places.move_to_end(place_id)
+        record_cache('place', place is not None)
+        return place
+
+    def store(self, place: Dict) -> None:
+        """只应存入上游（Google）返回的数据：缓存在所有请求间共享，不能存入客户端提交的地点"""
+        place_id = place.get('place_id')
+        if not place_id or is_compact_place(place):
+            return
+        with self._lock:
+            self._places[place_id] = place
+            self._places.move_to_end(place_id)
+            maxsize = self.maxsize
+            while len(self._places) > maxsize:
+                self._places.popitem(last=False)
+
+    def store_many(self, places: Iterable[Dict]) -> None:
+        for place in places:
+            self.store(place)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._places.clear()
+
+def _get_cache_size() -> int:
+    from django.conf import settings
+    return getattr(settings, 'PLACE_CACHE_SIZE', DEFAULT_PLACE_CACHE_SIZE)
+
+place_cache = PlaceCache()
+
+def rehydrate_place(place: Dict, cache: PlaceCache = place_cache) -> Dict:
+    """
+    将精简格式的地点还原为完整数据：缓存命中时返回缓存的Google数据，
+    否则构造与旧格式兼容的最小数据（place_id、name、geometry、types、rating）。
+    """
+    if not is_compact_place(place):
+        return place
+
+    cached = cache.get(place['id'])
+    if cached is not None:
+        return cached
+
+    rehydrated = {
+        name: value for name, value in place.items()
+        if name not in ('id', 'lat', 'lng', 'duration')
+    }
+    rehydrated.update({
+        'place_id': place['id'],
+        'name': place.get('name') or place['id'],
+        'geometry': {'location': {'lat': place['lat'], 'lng': place['lng']}},
+        'types': place.get('types', [])
+    })
+    return rehydrated
+
+def rehydrate_events(events: List[Dict], cache: PlaceCache = place_cache) -> List[Dict]:
+    """还原事件中的精简格式地点，同一地点只查找一次"""
+    rehydrated = {}
+    for event in events:
+        place = event.get('place')
+        if not place or not is_compact_place(place):
+            continue
+        if id(place) not in rehydrated:
+            rehydrated[id(place)] = rehydrate_place(place, cache)
+        event['place'] = rehydrated[id(place)]
+    return events
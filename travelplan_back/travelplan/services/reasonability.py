@@ -0,0 +1,151 @@
+# services/reasonability.py
+from typing import Callable, Dict, List, Optional
+import logging
+
+from .clustering import PlaceConstraints
+from .utils import parse_time_minutes
+
+logger = logging.getLogger(__name__)
+
+SEVERITY_ORDER = {'normal': 0, 'warning': 1, 'severe': 2}
+
+class ScheduleFacts:
+    """
+    一次遍历行程得到的统计信息，供所有规则使用：
+    scheduled_place_ids为已安排的地点id，last_end_by_day为每天最后一个地点事件的结束时间（分钟）。
+    规则自定义的统计保存在data中。
+    """
+
+    def __init__(self, processed_places: List[Dict], clusters: List[List[Dict]], constraints):
+        self.processed_places = processed_places
+        self.clusters = clusters
+        self.constraints = constraints
+        self.scheduled_place_ids = set()
+        self.last_end_by_day: Dict[int, int] = {}
+        self.data: Dict = {}
+
+    def visit(self, event: Dict) -> None:
+        if event.get('type') != 'place':
+            return
+        place = event.get('place', {})
+        if not place.get('is_empty', False) and place.get('place_id'):
+            self.scheduled_place_ids.add(place['place_id'])
+        if not place.get('is_hotel', False) and event.get('endTime'):
+            self.last_end_by_day[event.get('day')] = parse_time_minutes(event['endTime'])
+
+class ReasonabilityRule:
+    """
+    合理性规则：evaluate(facts)在遍历结束后返回警告（dict）或None；
+    visit(event, facts)可选，在同一次遍历中对每个事件调用，用于收集规则自己的统计。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        severity: str,
+        evaluate: Callable[[ScheduleFacts], Optional[Dict]],
+        visit: Optional[Callable[[Dict, ScheduleFacts], None]] = None
+    ):
+        if severity not in SEVERITY_ORDER:
+            raise ValueError(f"Unknown severity: {severity}")
+        self.name = name
+        self.severity = severity
+        self.evaluate = evaluate
+        self.visit = visit
+
+REASONABILITY_RULES: List[ReasonabilityRule] = []
+
+def register_reasonability_rule(
+    name: str,
+    severity: str,
+    evaluate: Callable[[ScheduleFacts], Optional[Dict]],
+    visit: Optional[Callable[[Dict, ScheduleFacts], None]] = None
+) -> ReasonabilityRule:
+    """注册（或替换同名的）合理性规则，规则按注册顺序输出警告"""
+    rule = ReasonabilityRule(name, severity, evaluate, visit)
+    for index, existing in enumerate(REASONABILITY_RULES):
+        if existing.name == name:
+            REASONABILITY_RULES[index] = rule
+            break
+    else:
+        REASONABILITY_RULES.append(rule)
+    return rule
+
+def _check_empty_days(facts: ScheduleFacts) -> Optional[Dict]:
+    """只有虚拟餐厅的天数"""
+    empty_days = sum(
+        1 for cluster in facts.clusters
+        if all(place.get('is_empty', False) for place in cluster)
+    )
+    if empty_days > 0:
+        return {
+            'type': 'empty_days',
+            'message': f'Found {empty_days} days with only virtual restaurants. Your schedule might be too sparse.',
+            'suggestion': 'Consider reducing the number of days or adding more places to visit.'
+        }
+    return None
+
+def _check_unscheduled_places(facts: ScheduleFacts) -> Optional[Dict]:
+    """未被安排的地点"""
+    original_place_ids = set(
+        place['place_id'] for place in facts.processed_places
+        if not place.get('is_empty', False)
+    )
+    unscheduled_count = len(original_place_ids - facts.scheduled_place_ids)
+    if unscheduled_count > 0:
+        return {
+            'type': 'unscheduled_places',
+            'message': f'{unscheduled_count} places could not be scheduled. Your schedule might be too packed.',
+            'suggestion': 'Consider increasing the number of days or reducing the number of places.'
+        }
+    return None
+
+def _check_overtime_days(facts: ScheduleFacts) -> Optional[Dict]:
+    """最后一个地点的结束时间晚于每日结束时间的天数"""
+    constraints = facts.constraints
+    days_over_time = sum(
+        1 for day in range(len(facts.clusters))
+        if facts.last_end_by_day.get(day, 0) > constraints.DAY_END
+    )
+    if days_over_time > 0:
+        return {
+            'type': 'overtime_days',
+            'message': f'{days_over_time} days exceed the recommended end time of {constraints.DAY_CONSTRAINTS["end"].strftime("%I:%M %p")}.',
+            'suggestion': 'Consider extending your trip duration or reducing the number of places per day.'
+        }
+    return None
+
+register_reasonability_rule('empty_days', 'warning', _check_empty_days)
+register_reasonability_rule('unscheduled_places', 'severe', _check_unscheduled_places)
+register_reasonability_rule('overtime_days', 'severe', _check_overtime_days)
+
+def check_schedule_reasonability(
+    processed_places: List[Dict],
+    clusters: List[List[Dict]],
+    combined_schedule: List[Dict],
+    constraints=None
+) -> Dict:
+    """遍历一次行程收集统计信息，然后依次运行所有注册的规则"""
+    constraints = constraints or PlaceConstraints
+    rules = list(REASONABILITY_RULES)
+    visitors = [rule.visit for rule in rules if rule.visit is not None]
+
+    facts = ScheduleFacts(processed_places, clusters, constraints)
+    for event in combined_schedule:
+        facts.visit(event)
+        for visit in visitors:
+            visit(event, facts)
+
+    schedule_status = {
+        'is_reasonable': True,
+        'warnings': [],
+        'severity': 'normal'  # normal/warning/severe
+    }
+    for rule in rules:
+        warning = rule.evaluate(facts)
+        if warning is None:
+            continue
+        schedule_status['warnings'].append(warning)
+        if SEVERITY_ORDER[rule.severity] > SEVERITY_ORDER[schedule_status['severity']]:
+            schedule_status['severity'] = rule.severity
+    return schedule_status
@@ -1,26 +1,33 @@
 # services/routing.py
 from typing import List, Dict, Tuple, Optional
-from datetime import datetime, time, timedelta
+from datetime import time
+import math
 import numpy as np
 import logging
-from .utils import haversine_distance, calculate_travel_time
+from .utils import (
+    haversine_distance,
+    calculate_travel_time,
+    format_minutes
+)
 from .clustering import (
     PlaceConstraints, 
-    create_empty_restaurant  # 新增这个导入
+    create_empty_restaurant,  # 新增这个导入
+    calculate_time_score
 )
-import copy
 
 logger = logging.getLogger(__name__)
 
 def calculate_place_score(
     place: Dict,
-    current_time: datetime,
+    current_minutes: float,
     prev_place: Optional[Dict],
-    next_fixed_time: Optional[datetime],
+    next_fixed_time: Optional[float],
     distance_matrix: np.ndarray,
-    place_indices: Dict[str, int]
+    place_indices: Dict[str, int],
+    constraints=None
 ) -> float:
     try:
+        constraints = constraints or PlaceConstraints
         score = 0.0
         
         # 1. 基础分数（评分权重降低）
@@ -37,18 +44,11 @@ def calculate_place_score(
         
         # 3. 时间窗口评分保持不变
         if place['is_restaurant']:
-            if PlaceConstraints.DINING_WINDOWS['lunch']['start'] <= current_time.time() <= PlaceConstraints.DINING_WINDOWS['lunch']['end']:
-                time_score = _calculate_time_score(
-                    current_time.time(),
-                    PlaceConstraints.DINING_WINDOWS['lunch']
-                )
-                score += time_score * 50
-            elif PlaceConstraints.DINING_WINDOWS['dinner']['start'] <= current_time.time() <= PlaceConstraints.DINING_WINDOWS['dinner']['end']:
-                time_score = _calculate_time_score(
-                    current_time.time(),
-                    PlaceConstraints.DINING_WINDOWS['dinner']
-                )
-                score += time_score * 50
+            minute = int(current_minutes)
+            if constraints.IS_LUNCH[minute]:
+                score += constraints.LUNCH_SCORE[minute] * 50
+            elif constraints.IS_DINNER[minute]:
+                score += constraints.DINNER_SCORE[minute] * 50
             else:
                 score -= 200  # 时间窗口外的惩罚
         
@@ -60,23 +60,48 @@ def calculate_place_score(
 
 def _calculate_time_score(t: time, window: Dict[str, time]) -> float:
     """计算时间评分（0到1之间）"""
-    if not (window['start'] <= t <= window['end']):
+    return calculate_time_score(t, window)
+
+def _route_travel_time(
+    prev_place: Optional[Dict],
+    next_place: Dict,
+    place_indices: Dict[str, int],
+    distance_matrix: np.ndarray,
+    time_matrix: Optional[np.ndarray],
+    transport_mode: str
+) -> float:
+    """
+    路线中从prev_place到next_place的交通时间。提供时间矩阵（出行时间提供者计算）时直接使用，
+    与generate_day_schedule中_leg_travel_time的时间一致；否则按距离估算。
+    酒店不在当天的矩阵中，酒店路段由日程安排在相邻事件之前或之后，这里不计时间。
+    """
+    if (prev_place is None or prev_place.get('is_hotel', False)
+            or prev_place.get('place_id') not in place_indices):
         return 0.0
-        
-    optimal = window['optimal']
-    optimal_minutes = optimal.hour * 60 + optimal.minute
-    current_minutes = t.hour * 60 + t.minute
-    max_diff = (window['end'].hour - window['start'].hour) * 60
-    
-    diff = abs(current_minutes - optimal_minutes)
-    return 1 - (diff / max_diff)
+    i = place_indices[prev_place['place_id']]
+    j = place_indices[next_place['place_id']]
+    if time_matrix is not None:
+        return float(time_matrix[i][j])
+    return calculate_travel_time(distance_matrix[i][j] / 1000, transport_mode)
 
 # services/routing.py
 
 # 在optimize_day_route函数的开始部分
 
-def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndarray, transport_mode: str) -> Tuple[List[Dict], float]:
+def optimize_day_route(
+    places: List[Dict],
+    hotel: Dict,
+    distance_matrix: np.ndarray,
+    transport_mode: str,
+    constraints=None,
+    time_matrix: Optional[np.ndarray] = None
+) -> Tuple[List[Dict], float]:
+    """
+    贪心安排一天的路线。
+    time_matrix为与distance_matrix对应的时间矩阵（分钟），用于计算地点间的交通时间。
+    """
     try:
+        constraints = constraints or PlaceConstraints
         if not places:
             return [], 0.0
         
@@ -96,27 +121,26 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
                 continue
             place_indices[place_id] = i
             
+        # 路线内部统一使用从午夜开始的分钟数，用餐时间判断直接查表
+        is_lunch = constraints.IS_LUNCH
+        is_dinner = constraints.IS_DINNER
+        lunch_start = constraints.WINDOW_MINUTES['lunch']['start']
+        lunch_optimal = constraints.WINDOW_MINUTES['lunch']['optimal']
+        dinner_start = constraints.WINDOW_MINUTES['dinner']['start']
+        dinner_optimal = constraints.WINDOW_MINUTES['dinner']['optimal']
+        
         # [保持不变] 分离餐厅和其他地点
-        available_restaurants = [p for p in places if p.get('is_restaurant', False)]
+        restaurants = [p for p in places if p.get('is_restaurant', False)]
         other_places = [p for p in places if not p.get('is_restaurant', False)]
         
         # [新增] 纯虚拟餐厅的特殊处理
-        if all(p.get('is_empty', False) for p in available_restaurants):
-            lunch_time = datetime.combine(
-                datetime.today(),
-                PlaceConstraints.DINING_WINDOWS['lunch']['optimal']
-            )
-            dinner_time = datetime.combine(
-                datetime.today(),
-                PlaceConstraints.DINING_WINDOWS['dinner']['optimal']
-            )
-            
+        if all(p.get('is_empty', False) for p in restaurants):
             lunch_restaurant = next(
-                (r for r in available_restaurants if r.get('is_lunch', False)),
+                (r for r in restaurants if r.get('is_lunch', False)),
                 None
             )
             dinner_restaurant = next(
-                (r for r in available_restaurants if r.get('is_dinner', False)),
+                (r for r in restaurants if r.get('is_dinner', False)),
                 None
             )
             
@@ -124,96 +148,98 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
                 arranged_places = [
                     {
                         'place': lunch_restaurant,
-                        'start_time': lunch_time.time(),
-                        'end_time': (lunch_time + timedelta(minutes=lunch_restaurant['visit_duration'])).time()
+                        'start_time': lunch_optimal,
+                        'end_time': lunch_optimal + lunch_restaurant['visit_duration']
                     },
                     {
                         'place': dinner_restaurant,
-                        'start_time': dinner_time.time(),
-                        'end_time': (dinner_time + timedelta(minutes=dinner_restaurant['visit_duration'])).time()
+                        'start_time': dinner_optimal,
+                        'end_time': dinner_optimal + dinner_restaurant['visit_duration']
                     }
                 ]
                 return arranged_places, 0.0
         
+        # 用布尔数组跟踪剩余地点和可用餐厅，避免复制地点数据和线性删除
+        remaining_mask = [True] * len(other_places)
+        remaining_count = len(other_places)
+        restaurant_mask = [True] * len(restaurants)
+        
+        # 真实餐厅按place_id分组，选中后同一place_id的餐厅一并标记为不可用
+        real_restaurant_indices = []
+        empty_restaurant_indices = []
+        restaurant_groups = {}
+        for i, r in enumerate(restaurants):
+            if r.get('is_empty', False):
+                empty_restaurant_indices.append(i)
+            else:
+                real_restaurant_indices.append(i)
+                restaurant_groups.setdefault(r.get('place_id'), []).append(i)
+        real_restaurant_count = len(real_restaurant_indices)
+        
         # [保持不变] 初始化变量
         arranged_places = []
-        remaining_places = copy.deepcopy(other_places)
         lunch_arranged = False
         dinner_arranged = False
         total_score = 0.0
 
-        current_time = datetime.combine(
-            datetime.today(),
-            PlaceConstraints.DAY_CONSTRAINTS['start']
-        )
-        
-        end_time = datetime.combine(
-            datetime.today(),
-            PlaceConstraints.DAY_CONSTRAINTS['end']
-        )
+        current_time = constraints.DAY_START
+        end_time = constraints.DAY_END
 
         arranged_places.append({
             'place': hotel,
-            'start_time': current_time.time(),
-            'end_time': current_time.time()  # 酒店不计时间
+            'start_time': current_time,
+            'end_time': current_time  # 酒店不计时间
         })
 
         # [修改] 主循环
         while current_time < end_time:
-            current_tod = current_time.time()
-            
             # 检查是否是用餐时间
-            is_lunch_time = (
-                PlaceConstraints.DINING_WINDOWS['lunch']['start'] <= current_tod <= 
-                PlaceConstraints.DINING_WINDOWS['lunch']['end']
-            )
-            is_dinner_time = (
-                PlaceConstraints.DINING_WINDOWS['dinner']['start'] <= current_tod <= 
-                PlaceConstraints.DINING_WINDOWS['dinner']['end']
-            )
+            minute = int(current_time)
+            is_lunch_time = is_lunch[minute]
+            is_dinner_time = is_dinner[minute]
             
             # 决定下一个要安排的地点
             next_place = None
+            next_index = None
             best_score = -1
             
             # 处理用餐时间
             if (is_lunch_time and not lunch_arranged) or (is_dinner_time and not dinner_arranged):
-                # 在用餐时间优先安排餐厅
-                # 在用餐时间优先安排餐厅
-                candidates = [r for r in available_restaurants if not r.get('is_empty', False)]
-                if not candidates and available_restaurants:
-                    candidates = [r for r in available_restaurants if r.get('is_empty', False)]
+                # 在用餐时间优先安排餐厅，没有真实餐厅时使用虚拟餐厅
+                candidate_indices = (
+                    real_restaurant_indices if real_restaurant_count > 0
+                    else empty_restaurant_indices
+                )
                 
                 # 确定目标用餐时间
                 target_time = None
                 if is_lunch_time:
-                    target_time = datetime.combine(
-                        datetime.today(),
-                        PlaceConstraints.DINING_WINDOWS['lunch']['optimal']
-                    )
+                    target_time = lunch_optimal
                 elif is_dinner_time:
-                    target_time = datetime.combine(
-                        datetime.today(),
-                        PlaceConstraints.DINING_WINDOWS['dinner']['optimal']
-                    )
+                    target_time = dinner_optimal
                 
                 # 如果是当天第一个活动且是用餐时间，直接跳到目标用餐时间
                 if len(arranged_places) == 1 and arranged_places[0]['place'].get('is_hotel', False):
-                    if target_time:
+                    if target_time is not None:
                         current_time = target_time
                 
-                for place in candidates:
+                for i in candidate_indices:
+                    if not restaurant_mask[i]:
+                        continue
+                    place = restaurants[i]
                     score = calculate_place_score(
                         place,
                         current_time,
                         arranged_places[-1].get('place') if arranged_places else None,
                         None,
                         distance_matrix,
-                        place_indices
+                        place_indices,
+                        constraints
                     )
                     if score > best_score:
                         best_score = score
                         next_place = place
+                        next_index = i
                 
                 if next_place:
                     if is_lunch_time:
@@ -222,16 +248,24 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
                         dinner_arranged = True
             
             # 在非用餐时间或无法安排餐厅时处理其他地点
-            if not next_place and remaining_places:
-                for place in remaining_places:
-                    # 检查是否有足够时间访问该地点
-                    visit_end_time = (current_time + 
-                                    timedelta(minutes=place.get('visit_duration', 120))).time()
+            if not next_place and remaining_count:
+                for i, place in enumerate(other_places):
+                    if not remaining_mask[i]:
+                        continue
+                    # 检查是否有足够时间访问该地点（含前往该地点的交通时间）
+                    visit_end_time = (
+                        current_time
+                        + _route_travel_time(
+                            arranged_places[-1]['place'], place, place_indices,
+                            distance_matrix, time_matrix, transport_mode
+                        )
+                        + place.get('visit_duration', 120)
+                    )
                     
                     # 确保不会与下一个用餐时间冲突
-                    if not lunch_arranged and visit_end_time > PlaceConstraints.DINING_WINDOWS['lunch']['start']:
+                    if not lunch_arranged and visit_end_time > lunch_start:
                         continue
-                    if not dinner_arranged and visit_end_time > PlaceConstraints.DINING_WINDOWS['dinner']['start']:
+                    if not dinner_arranged and visit_end_time > dinner_start:
                         continue
                     
                     score = calculate_place_score(
@@ -240,68 +274,65 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
                         arranged_places[-1].get('place') if arranged_places else None,
                         None,
                         distance_matrix,
-                        place_indices
+                        place_indices,
+                        constraints
                     )
                     if score > best_score:
                         best_score = score
                         next_place = place
+                        next_index = i
             
             # 安排选定的地点
             if next_place:
+                # 先加上从上一个地点前往的交通时间
+                current_time += _route_travel_time(
+                    arranged_places[-1]['place'], next_place, place_indices,
+                    distance_matrix, time_matrix, transport_mode
+                )
                 visit_duration = next_place.get('visit_duration', 90)
                 arranged_places.append({
                     'place': next_place,
-                    'start_time': current_time.time(),
-                    'end_time': (current_time + timedelta(minutes=visit_duration)).time()
+                    'start_time': current_time,
+                    'end_time': current_time + visit_duration
                 })
                 total_score += best_score
                 
-                # 更新剩余地点列表
+                # 更新剩余地点标记
                 if next_place.get('is_restaurant', False):
                     if not next_place.get('is_empty', False):
-                        available_restaurants = [
-                            r for r in available_restaurants 
-                            if r.get('place_id') != next_place.get('place_id')
-                        ]
+                        for i in restaurant_groups[next_place.get('place_id')]:
+                            if restaurant_mask[i]:
+                                restaurant_mask[i] = False
+                                real_restaurant_count -= 1
                 else:
-                    remaining_places.remove(next_place)
+                    remaining_mask[next_index] = False
+                    remaining_count -= 1
                 
                 # 更新时间
-                current_time += timedelta(minutes=visit_duration)
-                
-                # 添加交通时间
-                if arranged_places:
-                    travel_time = calculate_travel_time(
-                        distance_matrix[place_indices[next_place['place_id']]][
-                            place_indices[arranged_places[-1]['place']['place_id']]
-                        ] / 1000,
-                        transport_mode
-                    )
-                    current_time += timedelta(minutes=travel_time)
+                current_time += visit_duration
             else:
                 # 如果没有合适的地点，时间前进15分钟
-                current_time += timedelta(minutes=15)
+                current_time += 15
 
         arranged_places.append({
             'place': hotel,
-            'start_time': current_time.time(),
-            'end_time': current_time.time()
+            'start_time': current_time,
+            'end_time': current_time
         })
         
         # 确保安排了所有必要的餐食
+        available_restaurants = [
+            r for i, r in enumerate(restaurants) if restaurant_mask[i]
+        ]
         if not lunch_arranged and available_restaurants:
             lunch_restaurant = next(
                 (r for r in available_restaurants if r.get('is_lunch', False)),
                 available_restaurants[0]
             )
-            lunch_time = datetime.combine(
-                datetime.today(),
-                PlaceConstraints.DINING_WINDOWS['lunch']['optimal']
-            )
             arranged_places.append({
                 'place': lunch_restaurant,
-                'start_time': lunch_time.time(),
-                'end_time': (lunch_time + timedelta(minutes=lunch_restaurant['visit_duration'])).time()
+                'start_time': lunch_optimal,
+                'end_time': lunch_optimal + lunch_restaurant['visit_duration']
             })
         
         if not dinner_arranged and available_restaurants:
@@ -309,18 +340,14 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
                 (r for r in available_restaurants if r.get('is_dinner', False)),
                 available_restaurants[0]
             )
-            dinner_time = datetime.combine(
-                datetime.today(),
-                PlaceConstraints.DINING_WINDOWS['dinner']['optimal']
-            )
             arranged_places.append({
                 'place': dinner_restaurant,
-                'start_time': dinner_time.time(),
-                'end_time': (dinner_time + timedelta(minutes=dinner_restaurant['visit_duration'])).time()
+                'start_time': dinner_optimal,
+                'end_time': dinner_optimal + dinner_restaurant['visit_duration']
             })
         
         # 按时间排序最终行程
-        arranged_places.sort(key=lambda x: datetime.strptime(x['start_time'].strftime('%H:%M'), '%H:%M'))
+        arranged_places.sort(key=lambda x: int(x['start_time']))
         
         return arranged_places, total_score
         
@@ -329,32 +356,46 @@ def optimize_day_route(places: List[Dict], hotel: Dict, distance_matrix: np.ndar
         logger.exception("Full traceback:")
         raise
 
+def _leg_travel_time(
+    route: List[Dict],
+    i: int,
+    distance_matrix: np.ndarray,
+    time_matrix: np.ndarray,
+    transport_mode: str
+) -> float:
+    """
+    路线第i个地点到下一个地点的交通时间：使用时间矩阵（由出行时间提供者计算），
+    涉及酒店的路段时间矩阵中为0，仍按距离计算
+    """
+    if route[i]['place'].get('is_hotel', False) or route[i + 1]['place'].get('is_hotel', False):
+        return calculate_travel_time(distance_matrix[i][i + 1] / 1000, transport_mode)
+    return time_matrix[i][i + 1]
+
 def generate_day_schedule(
     route: List[Dict],
     distance_matrix: np.ndarray,
     time_matrix: np.ndarray,
     transport_mode: str,
-    day_index: int
+    day_index: int,
+    constraints=None
 ) -> List[Dict]:
     try:
+        constraints = constraints or PlaceConstraints
         schedule = []
         
         # 寻找第一个非酒店且有时间的事件
         first_event_time = None
         for event in route:
             if (not event['place'].get('is_hotel', False) and 
-                event.get('start_time') and event.get('end_time')):
+                event.get('start_time') is not None and event.get('end_time') is not None):
                 first_event_time = event['start_time']
                 break
 
         # 初始化当前时间为第一个事件的时间，如果没有则使用默认的9:00
         current_time = (
-            datetime.combine(datetime.today(), first_event_time)
-            if first_event_time
-            else datetime.combine(
-                datetime.today(),
-                PlaceConstraints.DAY_CONSTRAINTS['start']
-            )
+            first_event_time
+            if first_event_time is not None
+            else constraints.DAY_START
         )
 
         for i, event in enumerate(route):
@@ -376,22 +417,16 @@ def generate_day_schedule(
                     # 如果下一个事件有指定时间，使用该时间减去交通时间作为交通开始时间
                     next_event = route[i + 1]
                     if (not next_event['place'].get('is_hotel', False) and 
-                        next_event.get('start_time')):
-                        next_start = datetime.combine(
-                            datetime.today(),
-                            next_event['start_time']
-                        )
-                        travel_time = calculate_travel_time(
-                            distance_matrix[i][i + 1] / 1000,
-                            transport_mode
-                        )
-                        transit_start = next_start - timedelta(minutes=travel_time)
+                        next_event.get('start_time') is not None):
+                        next_start = next_event['start_time']
+                        travel_time = _leg_travel_time(route, i, distance_matrix, time_matrix, transport_mode)
+                        transit_start = next_start - travel_time
                         
                         transit_event = {
                             'id': f"day{day_index}-transit{i}",
                             'type': 'transit',
-                            'startTime': transit_start.strftime('%I:%M %p'),
-                            'endTime': next_start.strftime('%I:%M %p'),
+                            'startTime': format_minutes(transit_start),
+                            'endTime': format_minutes(next_start),
                             'duration': travel_time,
                             'mode': transport_mode,
                             'day': day_index
@@ -401,21 +436,21 @@ def generate_day_schedule(
                 continue
 
             # 其他地点的处理
-            if event.get('start_time') and event.get('end_time'):
+            if event.get('start_time') is not None and event.get('end_time') is not None:
                 # 使用事件中指定的时间
-                event_start = datetime.combine(datetime.today(), event['start_time'])
-                event_end = datetime.combine(datetime.today(), event['end_time'])
+                event_start = event['start_time']
+                event_end = event['end_time']
             else:
                 # 使用当前时间计算
                 event_start = current_time
                 duration = event['place'].get('visit_duration', 120)
-                event_end = event_start + timedelta(minutes=duration)
+                event_end = event_start + duration
 
             schedule_event = {
                 'id': f"day{day_index}-event{i}",
                 'title': event['place']['name'],
-                'startTime': event_start.strftime('%I:%M %p'),
-                'endTime': event_end.strftime('%I:%M %p'),
+                'startTime': format_minutes(event_start),
+                'endTime': format_minutes(event_end),
                 'day': day_index,
                 'place': event['place']['original_data'],
                 'type': 'place'
@@ -429,41 +464,30 @@ def generate_day_schedule(
                 next_event = route[i + 1]
                 # 如果下一个事件有指定时间，确保交通时间正确连接
                 if (not next_event['place'].get('is_hotel', False) and 
-                    next_event.get('start_time')):
-                    next_start = datetime.combine(
-                        datetime.today(),
-                        next_event['start_time']
-                    )
-                    travel_time = calculate_travel_time(
-                        distance_matrix[i][i + 1] / 1000,
-                        transport_mode
-                    )
+                    next_event.get('start_time') is not None):
+                    next_start = next_event['start_time']
+                    travel_time = _leg_travel_time(route, i, distance_matrix, time_matrix, transport_mode)
                     # 确保交通时间不会超出下一个事件的开始时间
                     transit_start = min(
                         current_time,
-                        next_start - timedelta(minutes=travel_time)
+                        next_start - travel_time
                     )
                 else:
-                    travel_time = calculate_travel_time(
-                        distance_matrix[i][i + 1] / 1000,
-                        transport_mode
-                    )
+                    travel_time = _leg_travel_time(route, i, distance_matrix, time_matrix, transport_mode)
                     transit_start = current_time
                 
                 transit_event = {
                     'id': f"day{day_index}-transit{i}",
                     'type': 'transit',
-                    'startTime': transit_start.strftime('%I:%M %p'),
-                    'endTime': (transit_start + timedelta(minutes=travel_time)).strftime('%I:%M %p'),
+                    'startTime': format_minutes(transit_start),
+                    'endTime': format_minutes(transit_start + travel_time),
                     'duration': travel_time,
                     'mode': transport_mode,
                     'day': day_index
                 }
                 schedule.append(transit_event)
-                current_time = datetime.strptime(
-                    transit_event['endTime'],
-                    '%I:%M %p'
-                )
+                # 与显示的结束时间保持一致，截断到整分钟
+                current_time = math.floor(transit_start + travel_time)
         
         return schedule
         
@@ -1,9 +1,16 @@
 # services/schedule_service.py
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 import logging
-from .clustering import PlaceConstraints, preprocess_places, hierarchical_clustering
+from .clustering import (
+    preprocess_places,
+    hierarchical_clustering,
+    get_constraint_profile,
+    VisitDurationModel
+)
+from .reasonability import check_schedule_reasonability
 from .routing import optimize_day_route, generate_day_schedule
+from .timing import create_timer
 from .utils import (
     calculate_distance_matrix,
     validate_schedule,
@@ -22,9 +29,43 @@ class ScheduleService:
         places: List[Dict],
         start_date: str,
         end_date: str,
-        transport_mode: str = 'driving'
+        transport_mode: str = 'driving',
+        constraint_profile: Optional[str] = None,
+        duration_model: Optional[VisitDurationModel] = None,
+        debug: bool = False
+    ) -> Dict:
+        """
+        生成行程安排，constraint_profile为约束配置id（默认使用PlaceConstraints），
+        duration_model为访问时长模型（默认seed为0，相同输入得到相同行程）。
+        debug为True时在结果中返回各阶段耗时（timings），否则耗时记录到进程级直方图。
+        """
+        timer = create_timer(True if debug else None)
+        result = await self._generate_schedule(
+            timer,
+            places,
+            start_date,
+            end_date,
+            transport_mode,
+            constraint_profile,
+            duration_model
+        )
+        if debug:
+            result['timings'] = timer.as_dict()
+        else:
+            timer.publish()
+        return result
+
+    async def _generate_schedule(
+        self,
+        timer,
+        places: List[Dict],
+        start_date: str,
+        end_date: str,
+        transport_mode: str,
+        constraint_profile: Optional[str],
+        duration_model: Optional[VisitDurationModel]
     ) -> Dict:
-        """生成行程安排"""
+        """生成行程安排的具体流程，timer记录各阶段耗时"""
         try:
             # 1. 基本验证
             if not places:
@@ -43,8 +84,9 @@ class ScheduleService:
                 }
     
             # 2. 预处理地点数据
-            # 2. 预处理地点数据
-            processed_places, hotel = preprocess_places(places)
+            with timer.stage('preprocess'):
+                constraints = get_constraint_profile(constraint_profile)
+                processed_places, hotel = preprocess_places(places, constraints, duration_model)
             if not processed_places or not hotel:
                 return {
                     'success': False,
@@ -88,18 +130,21 @@ class ScheduleService:
             # 获取距离矩阵
             # 获取包含酒店的距离矩阵
             all_places = [hotel] + processed_places + [hotel]
-            distance_matrix, time_matrix = calculate_distance_matrix(
-                all_places,
-                transport_mode,
-                use_api=False
-            )
+            with timer.stage('distance_matrix'):
+                distance_matrix, time_matrix = calculate_distance_matrix(
+                    all_places,
+                    transport_mode,
+                    use_api=False
+                )
             
             # 执行聚类
-            clusters = hierarchical_clustering(
-                processed_places,
-                num_days,
-                transport_mode
-            )
+            with timer.stage('clustering'):
+                clusters = hierarchical_clustering(
+                    processed_places,
+                    num_days,
+                    transport_mode,
+                    constraints
+                )
             logger.info(f"Created {len(clusters)} clusters")
             for i, cluster in enumerate(clusters):
                 logger.info(f"Cluster {i} has {len(cluster)} places")
@@ -126,22 +171,26 @@ class ScheduleService:
                 logger.debug(f"Filtered out {len(cluster) - len(filtered_cluster)} used restaurants")
                 
                 # 获取当天的距离矩阵
-                day_distance_matrix, day_time_matrix = calculate_distance_matrix(
-                    filtered_cluster,
-                    transport_mode,
-                    use_api=False
-                )
+                with timer.stage('distance_matrix'):
+                    day_distance_matrix, day_time_matrix = calculate_distance_matrix(
+                        filtered_cluster,
+                        transport_mode,
+                        use_api=False
+                    )
                 logger.info(f"Day {day_index} distance matrix shape: {day_distance_matrix.shape}")
                 
                 # 优化当天路线
                 logger.info(f"Optimizing route for day {day_index}")
                 try:
-                    optimized_route, score = optimize_day_route(
-                        filtered_cluster,
-                        hotel,
-                        day_distance_matrix,
-                        transport_mode
-                    )
+                    with timer.stage('routing'):
+                        optimized_route, score = optimize_day_route(
+                            filtered_cluster,
+                            hotel,
+                            day_distance_matrix,
+                            transport_mode,
+                            constraints,
+                            time_matrix=day_time_matrix
+                        )
                     logger.info(f"Day {day_index} route optimized with score {score}")
                     
                     # 记录这一天使用的餐厅
@@ -154,20 +203,23 @@ class ScheduleService:
                     
                     # 为优化后的路线重新计算距离矩阵
                     optimized_places = [event['place'] for event in optimized_route]
-                    optimized_distance_matrix, optimized_time_matrix = calculate_distance_matrix(
-                        optimized_places,
-                        transport_mode,
-                        use_api=False
-                    )
+                    with timer.stage('distance_matrix'):
+                        optimized_distance_matrix, optimized_time_matrix = calculate_distance_matrix(
+                            optimized_places,
+                            transport_mode,
+                            use_api=False
+                        )
                     
                     # 生成当天的详细行程
-                    day_schedule = generate_day_schedule(
-                        optimized_route,
-                        optimized_distance_matrix,  # 使用新的距离矩阵
-                        optimized_time_matrix,      # 使用新的时间矩阵
-                        transport_mode,
-                        day_index
-                    )
+                    with timer.stage('day_schedule'):
+                        day_schedule = generate_day_schedule(
+                            optimized_route,
+                            optimized_distance_matrix,  # 使用新的距离矩阵
+                            optimized_time_matrix,      # 使用新的时间矩阵
+                            transport_mode,
+                            day_index,
+                            constraints
+                        )
                     logger.info(f"Generated schedule for day {day_index} with {len(day_schedule)} events")
                     all_schedules.append(day_schedule)
                 except Exception as e:
@@ -175,19 +227,22 @@ class ScheduleService:
                     raise
             
             # 6. 合并所有日程
-            combined_schedule = combine_schedules(all_schedules)
-            logger.info(f"Combined schedule has {len(combined_schedule)} total events")
-            
-            # 7. 计算统计指标
-            metrics = calculate_schedule_metrics(combined_schedule)
-            logger.info("Schedule metrics calculated")
+            with timer.stage('combine'):
+                combined_schedule = combine_schedules(all_schedules)
+                logger.info(f"Combined schedule has {len(combined_schedule)} total events")
+                
+                # 7. 计算统计指标
+                metrics = calculate_schedule_metrics(combined_schedule)
+                logger.info("Schedule metrics calculated")
             
             # 在返回结果前添加合理性检查
-            schedule_status = self.check_schedule_reasonability(
-                processed_places,
-                clusters,
-                combined_schedule
-            )
+            with timer.stage('reasonability'):
+                schedule_status = self.check_schedule_reasonability(
+                    processed_places,
+                    clusters,
+                    combined_schedule,
+                    constraints
+                )
     
             return {
                 'success': True,
@@ -218,86 +273,17 @@ class ScheduleService:
         self,
         processed_places: List[Dict],
         clusters: List[List[Dict]],
-        combined_schedule: List[Dict]
+        combined_schedule: List[Dict],
+        constraints=None
     ) -> Dict:
-        """检查行程安排的合理性并生成警告信息"""
+        """检查行程安排的合理性并生成警告信息（规则见services/reasonability.py）"""
         try:
-            schedule_status = {
-                'is_reasonable': True,
-                'warnings': [],
-                'severity': 'normal'  # normal/warning/severe
-            }
-
-            # 过滤掉酒店事件再进行检查
-            non_hotel_events = [event for event in combined_schedule if event.get('type') == 'place' and not event.get('place', {}).get('is_hotel', False)]
-    
-            # 1. 检查空天数（只有虚拟餐厅的天数）
-            empty_days = sum(1 for cluster in clusters if all(place.get('is_empty', False) for place in cluster))
-        
-            # 统计时过滤掉酒店
-            scheduled_place_ids = set()
-            for event in non_hotel_events:
-                if not event.get('place', {}).get('is_empty', False):
-                    place_id = event.get('place', {}).get('place_id')
-                    if place_id:
-                        scheduled_place_ids.add(place_id)
-
-            if empty_days > 0:
-                schedule_status['warnings'].append({
-                    'type': 'empty_days',
-                    'message': f'Found {empty_days} days with only virtual restaurants. Your schedule might be too sparse.',
-                    'suggestion': 'Consider reducing the number of days or adding more places to visit.'
-                })
-                schedule_status['severity'] = 'warning'
-    
-            # 2. 检查未被安排的地点
-            scheduled_place_ids = set()
-            for event in combined_schedule:
-                if event.get('type') == 'place' and not event.get('place', {}).get('is_empty', False):
-                    place_id = event.get('place', {}).get('place_id')
-                    if place_id:
-                        scheduled_place_ids.add(place_id)
-    
-            original_place_ids = set(
-                place['place_id'] for place in processed_places 
-                if not place.get('is_empty', False)
+            return check_schedule_reasonability(
+                processed_places,
+                clusters,
+                combined_schedule,
+                constraints
             )
-            
-            unscheduled_count = len(original_place_ids - scheduled_place_ids)
-            if unscheduled_count > 0:
-                schedule_status['warnings'].append({
-                    'type': 'unscheduled_places',
-                    'message': f'{unscheduled_count} places could not be scheduled. Your schedule might be too packed.',
-                    'suggestion': 'Consider increasing the number of days or reducing the number of places.'
-                })
-                schedule_status['severity'] = 'severe'
-    
-            # 3. 检查每天的时间安排是否过满
-            days_over_time = 0
-            for day_events in clusters:
-                last_event = next(
-                    (event for event in reversed(combined_schedule) 
-                    if event.get('type') == 'place' and 
-                    not event.get('place', {}).get('is_hotel', False) and  # 排除酒店
-                    event.get('endTime') and  # 确保有结束时间
-                    event.get('day') == clusters.index(day_events)),
-                    None
-                )
-                
-                if last_event and last_event['endTime']:  # 确保有结束时间
-                    end_time = datetime.strptime(last_event['endTime'], '%I:%M %p').time()
-                    if end_time > PlaceConstraints.DAY_CONSTRAINTS['end']:
-                        days_over_time += 1
-    
-            if days_over_time > 0:
-                schedule_status['warnings'].append({
-                    'type': 'overtime_days',
-                    'message': f'{days_over_time} days exceed the recommended end time of {PlaceConstraints.DAY_CONSTRAINTS["end"].strftime("%I:%M %p")}.',
-                    'suggestion': 'Consider extending your trip duration or reducing the number of places per day.'
-                })
-                schedule_status['severity'] = 'severe'
-    
-            return schedule_status
 
         except Exception as e:
             logger.error(f"Error in check_schedule_reasonability: {str(e)}")
@@ -0,0 +1,14 @@
+# services/spatial.py
+import numpy as np
+
+EARTH_RADIUS = 6371000  # 米，与haversine_distance一致
+
+def project_to_cartesian(lat, lng) -> np.ndarray:
+    """
+    将经纬度投影为以地心为原点的三维坐标（米）。
+    两点间的直线（弦）距离不大于球面距离，可直接用于KD树的最近邻查询（如道路图节点吸附）。
+    """
+    lat = np.radians(np.atleast_1d(np.asarray(lat, dtype=float)))
+    lng = np.radians(np.atleast_1d(np.asarray(lng, dtype=float)))
+    cos_lat = np.cos(lat)
+    return EARTH_RADIUS * np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
@@ -0,0 +1,113 @@
+# services/timing.py
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Iterable, Optional
+import bisect
+import threading
+import time
+
+# 阶段耗时直方图的桶上界（毫秒）
+STAGE_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+class Histogram:
+    """线程安全的累计直方图，记录观测次数、总和及各桶计数"""
+
+    def __init__(self, buckets: Iterable[float] = STAGE_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> Dict:
+        """返回当前状态的副本，buckets中的计数为累计值（<= 上界）"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = []
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            running += bucket_count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': total, 'count': count}
+
+_stage_histograms: Dict[str, Histogram] = {}
+_stage_lock = threading.Lock()
+
+def observe_stage(stage: str, milliseconds: float) -> None:
+    """将一次阶段耗时记录到进程级直方图"""
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        with _stage_lock:
+            histogram = _stage_histograms.setdefault(stage, Histogram())
+    histogram.observe(milliseconds)
+
+def stage_histograms() -> Dict[str, Dict]:
+    """返回所有阶段直方图的快照"""
+    with _stage_lock:
+        histograms = dict(_stage_histograms)
+    return {stage: histogram.snapshot() for stage, histogram in histograms.items()}
+
+def reset_stage_histograms() -> None:
+    with _stage_lock:
+        _stage_histograms.clear()
+
+class StageTimer:
+    """
+    记录一次请求中各阶段的耗时（毫秒，基于单调时钟）。
+    同名阶段多次出现时（如每天的路线优化）累加。
+    """
+
+    def __init__(self):
+        self.timings: Dict[str, float] = {}
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+
+    def as_dict(self) -> Dict[str, float]:
+        """返回各阶段耗时及总耗时（毫秒）"""
+        result = {name: round(ms, 3) for name, ms in self.timings.items()}
+        result['total'] = round((time.perf_counter() - self._start) * 1000, 3)
+        return result
+
+    def publish(self) -> None:
+        """将各阶段耗时及总耗时记录到进程级直方图"""
+        for name, ms in self.as_dict().items():
+            observe_stage(name, ms)
+
+class NullTimer:
+    """关闭计时时使用，所有操作均为空操作"""
+
+    timings: Dict[str, float] = {}
+    _context = nullcontext()
+
+    def stage(self, name: str):
+        return self._context
+
+    def as_dict(self) -> Dict[str, float]:
+        return {}
+
+    def publish(self) -> None:
+        pass
+
+NULL_TIMER = NullTimer()
+
+def create_timer(enabled: Optional[bool] = None):
+    """创建阶段计时器；enabled为None时读取SCHEDULE_STAGE_TIMING设置（默认开启）"""
+    if enabled is None:
+        from django.conf import settings
+        enabled = getattr(settings, 'SCHEDULE_STAGE_TIMING', True)
+    return StageTimer() if enabled else NULL_TIMER
@@ -0,0 +1,340 @@
+# services/travel_time.py
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import threading
+import numpy as np
+
+from .metrics import record_cache
+from .spatial import project_to_cartesian
+from .utils import (
+    MAX_TRAVEL_TIME,
+    TRANSPORT_SPEEDS,
+    calculate_travel_time,
+    calculate_travel_times,
+    haversine_distance
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRAVEL_TIME_PROVIDER = 'haversine'
+
+# 批量最短路径查询时每批结果的最大元素数（源节点数 × 图节点数），限制内存占用
+MAX_BATCH_ELEMENTS = 4 * 1024 * 1024
+
+# 每个道路图缓存的节点对最短距离数量。行程先计算所有地点的矩阵，之后每天的矩阵都是其子集
+PAIR_CACHE_SIZE = 200000
+
+class TravelTimeProvider(ABC):
+    """出行距离和时间的来源：matrix()返回地点两两之间的(距离矩阵(米), 时间矩阵(分钟))"""
+
+    @abstractmethod
+    def matrix(self, places: List[Dict], transport_mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        """子类必须实现，未实现时在实例化时即报错"""
+
+    def warm_up(self) -> None:
+        """预热时调用，例如提前加载道路图"""
+
+class HaversineProvider(TravelTimeProvider):
+    """用直线距离乘以交通方式的路程系数估算（默认）"""
+
+    def matrix(self, places: List[Dict], transport_mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        n = len(places)
+        distance_matrix = np.zeros((n, n))
+        time_matrix = np.zeros((n, n))
+        for i in range(n):
+            for j in range(n):
+                if i != j:
+                    dist = haversine_distance(
+                        places[i]['location']['lat'],
+                        places[i]['location']['lng'],
+                        places[j]['location']['lat'],
+                        places[j]['location']['lng']
+                    )
+                    distance_matrix[i][j] = dist
+                    time_matrix[i][j] = calculate_travel_time(dist / 1000, transport_mode)
+        return distance_matrix, time_matrix
+
+def max_leg_distance(transport_mode: str) -> float:
+    """交通时间达到MAX_TRAVEL_TIME时的道路距离（米），更长的路段时间相同，不必搜索最短路径"""
+    return TRANSPORT_SPEEDS[transport_mode]['speed'] * MAX_TRAVEL_TIME / 60 * 1000
+
+class RoadGraph:
+    """
+    道路图：节点坐标（纬度, 经度）和CSR格式的有向边（长度，米），保存为一个目录下的.npy文件。
+    加载时使用内存映射，同一台机器上的worker共享页缓存。
+    边的长度不应短于两端点间的直线距离（按距离筛选餐厅时依赖这一点）。
+    """
+
+    ARRAYS = ('nodes', 'indptr', 'indices', 'lengths')
+
+    def __init__(self, nodes, indptr, indices, lengths, name: Optional[str] = None):
+        self.name = name
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.lengths = lengths
+        self._tree = None
+        self._csgraph = None
+        self._pair_cache: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    @property
+    def bounds(self) -> Tuple[float, float, float, float]:
+        """(最小纬度, 最小经度, 最大纬度, 最大经度)"""
+        return (
+            float(self.nodes[:, 0].min()), float(self.nodes[:, 1].min()),
+            float(self.nodes[:, 0].max()), float(self.nodes[:, 1].max())
+        )
+
+    @classmethod
+    def from_edges(
+        cls,
+        nodes: Sequence[Tuple[float, float]],
+        sources: Sequence[int],
+        targets: Sequence[int],
+        lengths: Optional[Sequence[float]] = None,
+        bidirectional: bool = True,
+        name: Optional[str] = None
+    ) -> 'RoadGraph':
+        """由边列表构建道路图（例如从OSM导出的路网），未给出长度时使用端点间的直线距离"""
+        nodes = np.asarray(nodes, dtype=np.float64).reshape(-1, 2)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        if lengths is None:
+            lengths = haversine_distance(
+                nodes[sources, 0], nodes[sources, 1], nodes[targets, 0], nodes[targets, 1]
+            )
+        lengths = np.asarray(lengths, dtype=np.float64)
+        if bidirectional:
+            sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+            lengths = np.concatenate([lengths, lengths])
+
+        order = np.lexsort((targets, sources))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int32)
+        np.cumsum(np.bincount(sources, minlength=len(nodes)), out=indptr[1:])
+        return cls(
+            nodes,
+            indptr,
+            targets[order].astype(np.int32),
+            lengths[order],
+            name=name
+        )
+
+    def save(self, path) -> None:
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        for array in self.ARRAYS:
+            np.save(path / f'{array}.npy', np.ascontiguousarray(getattr(self, array)))
+        with open(path / 'meta.json', 'w') as f:
+            json.dump({'name': self.name or path.name, 'bounds': self.bounds}, f)
+
+    @classmethod
+    def load(cls, path, mmap: bool = True) -> 'RoadGraph':
+        path = Path(path)
+        mmap_mode = 'r' if mmap else None
+        arrays = {
+            array: np.load(path / f'{array}.npy', mmap_mode=mmap_mode)
+            for array in cls.ARRAYS
+        }
+        return cls(name=path.name, **arrays)
+
+    def _ensure_indexes(self):
+        # KD树和稀疏矩阵在第一次查询时构建，之后复用
+        if self._csgraph is not None:
+            return
+        with self._lock:
+            if self._csgraph is None:
+                from scipy.sparse import csr_matrix
+                from scipy.spatial import cKDTree
+
+                self._tree = cKDTree(project_to_cartesian(self.nodes[:, 0], self.nodes[:, 1]))
+                n = len(self.nodes)
+                self._csgraph = csr_matrix((self.lengths, self.indices, self.indptr), shape=(n, n))
+
+    def snap(self, lat: Sequence[float], lng: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """将坐标吸附到最近的节点，返回(节点编号, 到节点的球面距离(米))"""
+        self._ensure_indexes()
+        lat = np.asarray(lat, dtype=np.float64)
+        lng = np.asarray(lng, dtype=np.float64)
+        _, node_ids = self._tree.query(project_to_cartesian(lat, lng))
+        node_ids = np.atleast_1d(node_ids)
+        snapped = self.nodes[node_ids]
+        return node_ids, haversine_distance(lat, lng, snapped[:, 0], snapped[:, 1])
+
+    def _cached_distance(self, pair: Tuple[int, int], limit: float) -> Optional[float]:
+        # 缓存值为(距离, 查询时的limit)：有限距离对任意limit都有效；inf只说明在其limit内不可达
+        entry = self._pair_cache.get(pair)
+        if entry is None:
+            return None
+        distance, searched_limit = entry
+        if np.isfinite(distance):
+            return distance if distance <= limit else np.inf
+        return np.inf if searched_limit >= limit else None
+
+    def shortest_paths(
+        self,
+        sources: Sequence[int],
+        targets: Sequence[int],
+        limit: float = np.inf
+    ) -> np.ndarray:
+        """
+        多源最短路径（米），形状为(len(sources), len(targets))，不可达或超过limit为inf。
+        已缓存的节点对直接返回；其余相同的源节点只计算一次，源节点按批查询以限制内存占用。
+        limit让Dijkstra在该距离处停止搜索，大图上可显著减少每个源节点的计算量。
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        self._ensure_indexes()
+        sources = np.asarray(sources)
+        targets = [int(target) for target in np.asarray(targets)]
+        unique_sources, inverse = np.unique(sources, return_inverse=True)
+
+        distances = np.empty((len(unique_sources), len(targets)))
+        missing = []
+        with self._lock:
+            for row, source in enumerate(unique_sources):
+                cached = [self._cached_distance((int(source), target), limit) for target in targets]
+                if any(distance is None for distance in cached):
+                    missing.append(row)
+                    continue
+                distances[row] = cached
+                for target in targets:
+                    self._pair_cache.move_to_end((int(source), target))
+        for _ in range(len(unique_sources) - len(missing)):
+            record_cache('road_graph', True)
+        for _ in missing:
+            record_cache('road_graph', False)
+
+        batch_size = max(1, MAX_BATCH_ELEMENTS // max(1, len(self.nodes)))
+        for start in range(0, len(missing), batch_size):
+            rows = missing[start:start + batch_size]
+            result = dijkstra(self._csgraph, directed=True, indices=unique_sources[rows], limit=limit)
+            distances[rows] = np.atleast_2d(result)[:, targets]
+            with self._lock:
+                for row in rows:
+                    source = int(unique_sources[row])
+                    for target, distance in zip(targets, distances[row]):
+                        self._pair_cache[(source, target)] = (float(distance), limit)
+                while len(self._pair_cache) > PAIR_CACHE_SIZE:
+                    self._pair_cache.popitem(last=False)
+        return distances[inverse]
+
+    def clear_cache(self) -> None:
+        with self._lock:
+            self._pair_cache.clear()
+
+class RoadGraphProvider(TravelTimeProvider):
+    """
+    使用本地道路图计算距离和时间。graph_dir下每个子目录是一个城市的道路图（见RoadGraph.save），
+    按地点所在范围选择道路图；没有覆盖所有地点的道路图时使用直线距离估算。
+    """
+
+    def __init__(self, graph_dir, fallback: Optional[TravelTimeProvider] = None):
+        self.graph_dir = Path(graph_dir)
+        self.fallback = fallback or HaversineProvider()
+        self._catalog = None
+        self._graphs: Dict[str, RoadGraph] = {}
+        self._lock = threading.Lock()
+
+    def catalog(self) -> Dict[str, Tuple[float, float, float, float]]:
+        """道路图名称到范围的映射，只读取meta.json，不加载道路图"""
+        if self._catalog is None:
+            catalog = {}
+            if self.graph_dir.is_dir():
+                for meta_path in sorted(self.graph_dir.glob('*/meta.json')):
+                    with open(meta_path) as f:
+                        catalog[meta_path.parent.name] = tuple(json.load(f)['bounds'])
+            self._catalog = catalog
+        return self._catalog
+
+    def graph(self, name: str) -> RoadGraph:
+        with self._lock:
+            if name not in self._graphs:
+                self._graphs[name] = RoadGraph.load(self.graph_dir / name)
+            return self._graphs[name]
+
+    def find_graph(self, places: List[Dict]) -> Optional[RoadGraph]:
+        lats = [p['location']['lat'] for p in places]
+        lngs = [p['location']['lng'] for p in places]
+        for name, (min_lat, min_lng, max_lat, max_lng) in self.catalog().items():
+            if (min_lat <= min(lats) and max(lats) <= max_lat
+                    and min_lng <= min(lngs) and max(lngs) <= max_lng):
+                return self.graph(name)
+        return None
+
+    def warm_up(self) -> None:
+        for name in self.catalog():
+            self.graph(name)._ensure_indexes()
+
+    def matrix(self, places: List[Dict], transport_mode: str) -> Tuple[np.ndarray, np.ndarray]:
+        graph = self.find_graph(places) if places else None
+        if graph is None:
+            return self.fallback.matrix(places, transport_mode)
+
+        lat = np.array([p['location']['lat'] for p in places], dtype=np.float64)
+        lng = np.array([p['location']['lng'] for p in places], dtype=np.float64)
+        node_ids, snap_distances = graph.snap(lat, lng)
+
+        # 地点到节点的距离 + 节点间的最短路径 + 节点到地点的距离
+        distance_matrix = (
+            snap_distances[:, None]
+            + graph.shortest_paths(node_ids, node_ids, limit=max_leg_distance(transport_mode))
+            + snap_distances[None, :]
+        )
+        np.fill_diagonal(distance_matrix, 0)
+
+        # 道路距离已是实际路程，不再乘以路程系数
+        time_matrix = calculate_travel_times(distance_matrix / 1000, transport_mode, factor=1.0)
+
+        # 不可达（道路图不连通）或超过最长路段的地点对按直线距离估算
+        unreachable = ~np.isfinite(distance_matrix)
+        if unreachable.any():
+            rows, cols = np.nonzero(unreachable)
+            straight = haversine_distance(lat[rows], lng[rows], lat[cols], lng[cols])
+            distance_matrix[rows, cols] = straight * TRANSPORT_SPEEDS[transport_mode]['factor']
+            time_matrix[rows, cols] = calculate_travel_times(straight / 1000, transport_mode)
+        np.fill_diagonal(time_matrix, 0)
+        return distance_matrix, time_matrix
+
+def _create_road_graph_provider() -> RoadGraphProvider:
+    from django.conf import settings
+    return RoadGraphProvider(getattr(settings, 'ROAD_GRAPH_DIR', 'road_graphs'))
+
+TRAVEL_TIME_PROVIDERS: Dict[str, Callable[[], TravelTimeProvider]] = {
+    'haversine': HaversineProvider,
+    'road_graph': _create_road_graph_provider
+}
+
+_providers: Dict[str, TravelTimeProvider] = {}
+_providers_lock = threading.Lock()
+
+def register_travel_time_provider(name: str, factory: Callable[[], TravelTimeProvider]) -> None:
+    """注册（或替换）出行时间提供者，factory在第一次使用时调用"""
+    with _providers_lock:
+        TRAVEL_TIME_PROVIDERS[name] = factory
+        _providers.pop(name, None)
+
+def get_travel_time_provider(name: Optional[str] = None) -> TravelTimeProvider:
+    """按名称获取出行时间提供者，未指定时使用TRAVEL_TIME_PROVIDER配置"""
+    if name is None:
+        from django.conf import settings
+        name = getattr(settings, 'TRAVEL_TIME_PROVIDER', DEFAULT_TRAVEL_TIME_PROVIDER)
+
+    provider = _providers.get(name)
+    if provider is not None:
+        return provider
+    if name not in TRAVEL_TIME_PROVIDERS:
+        raise ValueError(f"Unknown travel time provider: {name}")
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            provider = TRAVEL_TIME_PROVIDERS[name]()
+            _providers[name] = provider
+    return provider
@@ -1,8 +1,8 @@
 # services/utils.py
 from typing import List, Dict, Optional, Tuple
+import math
 import numpy as np
 from datetime import datetime, time, timedelta
-import requests
 from django.conf import settings
 import logging
 
@@ -30,6 +30,27 @@ TRANSPORT_SPEEDS = {
     }
 }
 
+MINUTES_PER_DAY = 24 * 60
+
+def time_to_minutes(t: time) -> int:
+    """将time转换为从午夜开始的分钟数"""
+    return t.hour * 60 + t.minute
+
+def format_minutes(minutes: float) -> str:
+    """将分钟数格式化为'%I:%M %p'（截断到整分钟，与strftime一致）"""
+    hour, minute = divmod(math.floor(minutes) % MINUTES_PER_DAY, 60)
+    period = 'AM' if hour < 12 else 'PM'
+    return f"{(hour % 12) or 12:02d}:{minute:02d} {period}"
+
+def parse_time_minutes(value: str) -> int:
+    """将'%I:%M %p'格式的时间字符串解析为分钟数"""
+    clock, period = value.split()
+    hour, minute = clock.split(':')
+    hour = int(hour) % 12
+    if period.upper() == 'PM':
+        hour += 12
+    return hour * 60 + int(minute)
+
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """计算两点间的球面距离（米）"""
     R = 6371000  # 地球半径（米）
@@ -45,48 +66,54 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     
     return R * c
 
-def calculate_travel_time(distance_km: float, mode: str) -> float:
-    """计算实际交通时间（分钟）"""
+MAX_TRAVEL_TIME = 120  # 单段交通时间上限（分钟），最大2小时
+
+def calculate_travel_time(distance_km: float, mode: str, factor: Optional[float] = None) -> float:
+    """计算实际交通时间（分钟），distance_km为道路距离时factor传1.0"""
     params = TRANSPORT_SPEEDS[mode]
     
     # 应用路程系数
-    actual_distance = distance_km * params['factor']
+    actual_distance = distance_km * (params['factor'] if factor is None else factor)
     
     # 基础时间计算（分钟）
     base_minutes = (actual_distance / params['speed']) * 60
     
     # 应用限制
-    MAX_TRAVEL_TIME = 120  # 最大2小时
     MIN_TRAVEL_TIME = params['min_time']
     
     return min(max(base_minutes, MIN_TRAVEL_TIME), MAX_TRAVEL_TIME)
 
+def calculate_travel_times(distance_km: np.ndarray, mode: str, factor: Optional[float] = None) -> np.ndarray:
+    """calculate_travel_time的数组版本，逐元素计算交通时间（分钟）"""
+    params = TRANSPORT_SPEEDS[mode]
+    actual_distance = np.asarray(distance_km, dtype=float) * (params['factor'] if factor is None else factor)
+    return np.clip((actual_distance / params['speed']) * 60, params['min_time'], MAX_TRAVEL_TIME)
+
 def calculate_distance_matrix(
     places: List[Dict],
     transport_mode: str,
     use_api: bool = False,
-    cache: Optional[Dict] = None
+    cache: Optional[Dict] = None,
+    provider=None
 ) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    计算地点两两之间的距离矩阵（米）和时间矩阵（分钟）。
+    距离和时间由出行时间提供者计算（默认为TRAVEL_TIME_PROVIDER配置，见travel_time.py），
+    use_api为旧参数，未使用。
+    """
+    from .travel_time import get_travel_time_provider
+
     try:
-        n = len(places)
-        distance_matrix = np.zeros((n, n))
-        time_matrix = np.zeros((n, n))
+        provider = provider or get_travel_time_provider()
+        distance_matrix, time_matrix = provider.matrix(places, transport_mode)
         
-        for i in range(n):
-            for j in range(n):
-                if i != j:
-                    # 如果涉及酒店点位，不计算时间
-                    if places[i].get('is_hotel', False) or places[j].get('is_hotel', False):
-                        time_matrix[i][j] = 0
-                    else:
-                        dist = haversine_distance(
-                            places[i]['location']['lat'],
-                            places[i]['location']['lng'],
-                            places[j]['location']['lat'],
-                            places[j]['location']['lng']
-                        )
-                        distance_matrix[i][j] = dist
-                        time_matrix[i][j] = calculate_travel_time(dist / 1000, transport_mode)
+        # 如果涉及酒店点位，不计算距离和时间
+        hotel_mask = np.array([p.get('is_hotel', False) for p in places], dtype=bool)
+        if hotel_mask.any():
+            distance_matrix[hotel_mask, :] = 0
+            distance_matrix[:, hotel_mask] = 0
+            time_matrix[hotel_mask, :] = 0
+            time_matrix[:, hotel_mask] = 0
                         
         return distance_matrix, time_matrix
         
@@ -105,23 +132,21 @@ def validate_schedule(events: List[Dict]) -> bool:
         
         for day, day_events in events_by_day.items():
             # 过滤掉酒店事件(空时间)再排序
-            time_events = [e for e in day_events if e['startTime'] and e['endTime']]
-            sorted_events = sorted(
-                time_events,
-                key=lambda x: datetime.strptime(x['startTime'], '%I:%M %p')
-            )
+            time_events = [
+                (parse_time_minutes(e['startTime']), parse_time_minutes(e['endTime']))
+                for e in day_events if e['startTime'] and e['endTime']
+            ]
+            sorted_events = sorted(time_events, key=lambda x: x[0])
             
             for i in range(len(sorted_events) - 1):
-                curr_end = datetime.strptime(sorted_events[i]['endTime'], '%I:%M %p')
-                next_start = datetime.strptime(sorted_events[i+1]['startTime'], '%I:%M %p')
-                if curr_end > next_start:
+                if sorted_events[i][1] > sorted_events[i+1][0]:
                     return False
             
             if sorted_events:  # 只检查有时间的事件
-                first_start = datetime.strptime(sorted_events[0]['startTime'], '%I:%M %p').time()
-                last_end = datetime.strptime(sorted_events[-1]['endTime'], '%I:%M %p').time()
+                first_start = sorted_events[0][0]
+                last_end = sorted_events[-1][1]
                 
-                if first_start < time(9, 0) or last_end > time(21, 0):
+                if first_start < time_to_minutes(time(9, 0)) or last_end > time_to_minutes(time(21, 0)):
                     return False
         
         return True
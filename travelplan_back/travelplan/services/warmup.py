@@ -0,0 +1,153 @@
+# services/warmup.py
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Tuple
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_MODES = ('off', 'sync', 'background')
+
+class WarmupState:
+    """记录worker预热状态，供就绪检查使用"""
+
+    def __init__(self):
+        self.status = 'cold'  # cold / warming / ready / failed / disabled
+        self.duration_ms = None
+        self.error = None
+        self.timings: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def update(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    @property
+    def is_ready(self) -> bool:
+        """预热完成、失败（worker仍可服务，只是较慢）或关闭时均视为就绪"""
+        return self.status in ('ready', 'failed', 'disabled')
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                'status': self.status,
+                'ready': self.is_ready,
+                'duration_ms': self.duration_ms,
+                'error': self.error,
+                'timings': dict(self.timings)
+            }
+
+state = WarmupState()
+
+_warmup_tasks: List[Tuple[str, Callable[[], None]]] = []
+
+def register_warmup_task(name: str, task: Callable[[], None]) -> None:
+    """注册预热任务，例如从磁盘加载持久化的缓存"""
+    _warmup_tasks.append((name, task))
+
+def _preload_constraint_profiles():
+    from .clustering import CONSTRAINT_PROFILES, get_constraint_profile
+
+    for profile_id in list(CONSTRAINT_PROFILES):
+        get_constraint_profile(profile_id)
+
+def _import_lazy_modules():
+    # 与clustering、assignment中的延迟导入相同，提前加载
+    import scipy.cluster.hierarchy  # noqa: F401
+    import scipy.optimize  # noqa: F401
+    import scipy.spatial.distance  # noqa: F401
+
+def _load_travel_time_provider():
+    """加载配置的出行时间提供者（如内存映射道路图并构建索引）"""
+    from .travel_time import get_travel_time_provider
+
+    get_travel_time_provider().warm_up()
+
+def _run_synthetic_schedule():
+    """用TestDataGenerator生成的小型行程跑一遍完整流程，预热numpy/scipy的代码路径"""
+    from evaluation.test_data import TestDataGenerator
+    from . import schedule_service
+
+    # 使用独立的随机数生成器，不改动其他代码（如设置了种子的评估脚本）依赖的全局random
+    places = TestDataGenerator(random.Random(0)).generate_test_scenario('Paris', 3, 2)
+
+    # debug=True时耗时只返回给调用方，不计入进程级直方图。
+    # ASGI服务器在事件循环中导入asgi.py（sync模式），因此在单独线程的私有事件循环中运行
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix='travelplan-warmup-loop') as executor:
+        result = executor.submit(asyncio.run, schedule_service.generate_schedule(
+            places, '2024-01-01', '2024-01-02', 'walking', debug=True
+        )).result()
+    if not result['success']:
+        raise RuntimeError(f"Synthetic schedule failed: {result.get('error')}")
+
+register_warmup_task('imports', _import_lazy_modules)
+register_warmup_task('constraint_profiles', _preload_constraint_profiles)
+register_warmup_task('travel_time_provider', _load_travel_time_provider)
+register_warmup_task('synthetic_schedule', _run_synthetic_schedule)
+
+def warm_up() -> bool:
+    """依次运行所有预热任务，返回是否全部成功"""
+    state.update(status='warming', error=None)
+    start = time.perf_counter()
+    timings = {}
+    try:
+        for name, task in _warmup_tasks:
+            task_start = time.perf_counter()
+            task()
+            timings[name] = round((time.perf_counter() - task_start) * 1000, 3)
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}")
+        state.update(status='failed', error=str(e), timings=timings,
+                     duration_ms=round((time.perf_counter() - start) * 1000, 3))
+        return False
+
+    duration_ms = round((time.perf_counter() - start) * 1000, 3)
+    state.update(status='ready', timings=timings, duration_ms=duration_ms)
+    logger.info(f"Worker warm-up finished in {duration_ms:.1f} ms")
+    return True
+
+def start_warmup(mode: str) -> None:
+    """按配置的模式启动预热：off不预热，sync阻塞至完成，background在后台线程中运行"""
+    if mode not in WARMUP_MODES:
+        raise ValueError(f"Unknown warm-up mode: {mode}")
+
+    if mode == 'off':
+        state.update(status='disabled')
+    elif mode == 'sync':
+        warm_up()
+    else:
+        _start_background_warmup()
+
+_fork_hook_registered = False
+
+def _start_background_warmup() -> None:
+    global _fork_hook_registered
+    if not _fork_hook_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+        _fork_hook_registered = True
+    state.update(status='warming', error=None)
+    threading.Thread(target=warm_up, name='travelplan-warmup', daemon=True).start()
+
+def _restart_after_fork() -> None:
+    """
+    预加载应用后再fork worker时（如gunicorn --preload），后台预热线程不会复制到子进程。
+    fork时预热尚未完成的子进程重新预热；已完成的子进程继承父进程预热好的内存，无需重新运行。
+    """
+    # fork时锁可能正被父进程的预热线程持有，子进程中重新创建
+    state._lock = threading.Lock()
+    if state.status == 'warming':
+        threading.Thread(target=warm_up, name='travelplan-warmup', daemon=True).start()
+
+def start_server_warmup() -> None:
+    """
+    由服务器入口（wsgi.py、asgi.py，runserver也经过wsgi.py）调用，按WARMUP_MODE预热。
+    manage.py命令、测试和评估脚本只调用django.setup()，不会启动预热线程。
+    """
+    from django.conf import settings
+
+    start_warmup(getattr(settings, 'WARMUP_MODE', 'off'))
@@ -129,6 +129,422 @@ class TravelPlanTestCase(TestCase):
         self.assertEqual(response['Content-Type'], 'text/calendar')
         self.assertIn('attachment; filename=trip-schedule.ics', response['Content-Disposition'])
 
+    def test_export_calendar_multiple_trips(self):
+        from icalendar import Calendar
+
+        def event(event_id, day, title, start, end):
+            return {
+                'id': event_id, 'type': 'place', 'day': day, 'title': title,
+                'startTime': start, 'endTime': end,
+                'place': {'vicinity': 'Rue de Rivoli; Paris', 'rating': 4.7}
+            }
+
+        trips = [
+            {
+                'name': 'Paris',
+                'startDate': '2024-05-01',
+                'events': [
+                    {'id': 'day0-event0', 'type': 'place', 'day': 0, 'title': 'Hotel',
+                     'startTime': '', 'endTime': ''},
+                    event('day0-event1', 0, 'Louvre, Musée du Louvre ' * 4, '09:00 AM', '11:30 AM'),
+                    {'id': 'day0-transit1', 'type': 'transit', 'day': 0,
+                     'startTime': '11:30 AM', 'endTime': '11:45 AM'},
+                    event('day1-event1', 1, 'Orsay', '01:15 PM', '03:00 PM')
+                ]
+            },
+            {
+                'name': 'Lyon',
+                'startDate': '2024-06-10',
+                'events': [event('day0-event1', 0, 'Fourvière', '10:00 AM', '11:00 AM')]
+            }
+        ]
+
+        response = self.client.post(
+            '/api/export-calendar/',
+            data=json.dumps({'trips': trips}),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(all(len(line) <= 75 for line in content.split(b'\r\n')))
+
+        vevents = Calendar.from_ical(content).walk('VEVENT')
+        self.assertEqual(len(vevents), 3)
+        self.assertEqual(str(vevents[0]['SUMMARY']), 'Louvre, Musée du Louvre ' * 4)
+        self.assertEqual(str(vevents[0]['LOCATION']), 'Rue de Rivoli; Paris')
+        self.assertEqual(vevents[0].decoded('DTSTART'), datetime(2024, 5, 1, 9, 0))
+        self.assertEqual(vevents[1].decoded('DTEND'), datetime(2024, 5, 2, 15, 0))
+        self.assertEqual(vevents[2].decoded('DTSTART'), datetime(2024, 6, 10, 10, 0))
+        self.assertEqual(len({str(vevent['UID']) for vevent in vevents}), 3)
+
+    def test_export_calendar_cache(self):
+        import tempfile
+        from django.test import override_settings
+        from .services.calendar_export import CalendarCache, calendar_cache
+
+        request_data = json.dumps({
+            'startDate': '2024-05-01',
+            'events': [{
+                'id': 'day0-event1', 'type': 'place', 'day': 0, 'title': 'Louvre',
+                'startTime': '09:00 AM', 'endTime': '11:30 AM',
+                'place': {'vicinity': 'Paris', 'rating': 4.7, 'photos': ['a']}
+            }]
+        })
+        export = lambda **headers: self.client.post(
+            '/api/export-calendar/', data=request_data,
+            content_type='application/json', headers=headers
+        )
+        file_cache = {
+            'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+            'calendar': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache'}
+        }
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache['calendar']['LOCATION'] = directory
+            with override_settings(CACHES=file_cache, CALENDAR_CACHE_ALIAS='calendar'):
+                calendar_cache.clear()
+
+                # 首次导出流式输出并写入缓存
+                first = export()
+                self.assertTrue(first.streaming)
+                content = b''.join(first.streaming_content)
+                etag = first['ETag']
+
+                second = export()
+                self.assertFalse(second.streaming)
+                self.assertEqual(second.content, content)
+                self.assertEqual(second['ETag'], etag)
+
+                # POST的条件请求不返回304
+                self.assertEqual(export(If_None_Match=etag).status_code, 412)
+
+                # 通过哈希地址获取分享的日历
+                shared = self.client.get(first['Content-Location'])
+                self.assertEqual(shared.status_code, 200)
+                self.assertEqual(shared.content, content)
+                self.assertIn('immutable', shared['Cache-Control'])
+                self.assertEqual(
+                    self.client.get(first['Content-Location'], headers={'If-None-Match': etag}).status_code,
+                    304
+                )
+                self.assertEqual(self.client.get('/api/calendar/0123abcd.ics').status_code, 404)
+
+                # 其他worker（进程内缓存为空）也能读取分享的日历
+                self.assertEqual(CalendarCache().get(etag.strip('"')), content)
+                calendar_cache.clear()
+
+        # 只有进程内缓存时不提供只在当前worker有效的分享地址
+        with override_settings(CALENDAR_CACHE_ALIAS='default'):
+            calendar_cache.clear()
+            self.assertFalse(export().has_header('Content-Location'))
+        with override_settings(CALENDAR_CACHE_ALIAS=None):
+            calendar_cache.clear()
+            response = export()
+            self.assertFalse(response.has_header('Content-Location'))
+            self.assertEqual(b''.join(response.streaming_content), content)
+            self.assertEqual(calendar_cache.get(etag.strip('"')), content)
+
+    @patch('requests.get')
+    def test_metrics_endpoint(self, mock_get):
+        from .services.metrics import REQUESTS_TOTAL, UPSTREAM_FAILURES
+
+        mock_get.return_value = MagicMock(status_code=503, text='unavailable')
+        requests_before = REQUESTS_TOTAL.value('search_city', 'POST', '503')
+        failures_before = UPSTREAM_FAILURES.value('geodb_places')
+
+        self.client.post(
+            '/api/search-city/',
+            data=json.dumps({"searchText": "Paris"}),
+            content_type='application/json'
+        )
+        response = self.client.get('/api/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertEqual(REQUESTS_TOTAL.value('search_city', 'POST', '503'), requests_before + 1)
+        self.assertEqual(UPSTREAM_FAILURES.value('geodb_places'), failures_before + 1)
+
+        body = response.content.decode()
+        self.assertIn('# TYPE travelplan_http_request_duration_seconds histogram', body)
+        self.assertIn(
+            'travelplan_http_request_duration_seconds_bucket{endpoint="search_city",le="+Inf"}',
+            body
+        )
+        self.assertIn('travelplan_upstream_request_duration_seconds_count{api="geodb_places"}', body)
+        self.assertIn('# TYPE travelplan_schedule_stage_duration_seconds histogram', body)
+
+    def test_instrument_view_failures(self):
+        from django.http import HttpResponse
+        from django.test import RequestFactory
+        from .services.metrics import REQUESTS_TOTAL, instrument_view
+
+        @instrument_view('test_failing')
+        def failing(request):
+            raise ValueError('view failed')
+
+        @instrument_view('test_failing')
+        def no_response(request):
+            return None
+
+        @instrument_view('test_failing')
+        def ok(request):
+            return HttpResponse('ok')
+
+        factory = RequestFactory()
+        # 视图本身的异常原样抛出，并记为500
+        with self.assertRaisesMessage(ValueError, 'view failed'):
+            failing(factory.get('/'))
+        self.assertIsNone(no_response(factory.post('/')))
+        self.assertEqual(REQUESTS_TOTAL.value('test_failing', 'GET', '500'), 1)
+        self.assertEqual(REQUESTS_TOTAL.value('test_failing', 'POST', '500'), 1)
+
+        # 非标准方法统一记为other
+        ok(factory.generic('FOO', '/'))
+        ok(factory.generic('BAR', '/'))
+        self.assertEqual(REQUESTS_TOTAL.value('test_failing', 'other', '200'), 2)
+        self.assertEqual(REQUESTS_TOTAL.value('test_failing', 'FOO', '200'), 0)
+
+    @patch('requests.get')
+    def test_profiling_middleware(self, mock_get):
+        import tempfile
+        from pathlib import Path
+        from django.test import override_settings
+
+        mock_get.return_value = MagicMock(status_code=200)
+        mock_get.return_value.json.return_value = {"data": []}
+        request_data = json.dumps({"searchText": "Paris"})
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            PROFILING_ENABLED=True,
+            PROFILING_DIR=directory,
+            PROFILING_TOKEN='secret',
+            PROFILING_MIN_INTERVAL=60
+        ):
+            client = Client()
+            post = lambda **headers: client.post(
+                '/api/search-city/', data=request_data,
+                content_type='application/json', headers=headers
+            )
+
+            # 没有请求头或令牌错误时不分析
+            self.assertNotIn('X-Profile-Id', post())
+            self.assertNotIn('X-Profile-Id', post(X_Travelplan_Profile='wrong'))
+
+            response = post(X_Travelplan_Profile='secret')
+            self.assertEqual(response.status_code, 200)
+            profile_id = response['X-Profile-Id']
+
+            payload = json.loads((Path(directory) / f"{profile_id}.json").read_text())
+            self.assertEqual(payload['path'], '/api/search-city/')
+            self.assertEqual(json.loads(payload['body']), {"searchText": "Paris"})
+            self.assertTrue((Path(directory) / f"{profile_id}.collapsed").exists())
+
+            # 间隔内的第二次请求被限流
+            self.assertNotIn('X-Profile-Id', post(X_Travelplan_Profile='secret'))
+
+    def test_profiling_streaming_response(self):
+        import asyncio
+        import tempfile
+        from pathlib import Path
+        from django.http import StreamingHttpResponse
+        from django.test import RequestFactory, override_settings
+        from .middleware import ProfilingMiddleware
+        from .services.calendar_export import calendar_cache
+
+        calendar_cache.clear()
+        request_data = json.dumps({'events': [{
+            'id': 'day0-event1', 'type': 'place', 'day': 0, 'title': 'Louvre',
+            'startTime': '09:00 AM', 'endTime': '11:30 AM', 'place': {'vicinity': 'Paris'}
+        }]})
+
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            PROFILING_ENABLED=True, PROFILING_DIR=directory, PROFILING_MIN_INTERVAL=0
+        ):
+            # 流式的ICS导出在响应体读取完后才保存分析结果
+            response = Client().post(
+                '/api/export-calendar/', data=request_data,
+                content_type='application/json', headers={'X-Travelplan-Profile': '1'}
+            )
+            self.assertTrue(response.streaming)
+            profile_path = Path(directory) / f"{response['X-Profile-Id']}.json"
+            self.assertFalse(profile_path.exists())
+            self.assertIn(b'BEGIN:VCALENDAR', b''.join(response.streaming_content))
+            self.assertEqual(json.loads(profile_path.read_text())['status'], 200)
+
+            # 异步中间件链和异步迭代的响应体
+            async def chunks():
+                yield b'a'
+                yield b'b'
+
+            async def get_response(request):
+                return StreamingHttpResponse(chunks())
+
+            async def consume():
+                middleware = ProfilingMiddleware(get_response)
+                request = RequestFactory().get('/api/ready', HTTP_X_TRAVELPLAN_PROFILE='1')
+                response = await middleware(request)
+                self.assertFalse((Path(directory) / f"{response['X-Profile-Id']}.json").exists())
+                return response, b''.join([chunk async for chunk in response])
+
+            response, content = asyncio.run(consume())
+            self.assertEqual(content, b'ab')
+            self.assertTrue((Path(directory) / f"{response['X-Profile-Id']}.json").exists())
+
+    def test_readiness_endpoint(self):
+        import random
+        import threading
+        from .services.warmup import state, warm_up
+
+        # 测试进程不经过服务器入口，不应有后台预热线程与测试竞争
+        self.assertNotIn('travelplan-warmup', [thread.name for thread in threading.enumerate()])
+
+        state.update(status='warming')
+        response = self.client.get('/api/ready')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(json.loads(response.content)['ready'])
+
+        # 同步预热，且不改变全局random的状态
+        random.seed(42)
+        expected = random.random()
+        random.seed(42)
+        self.assertTrue(warm_up())
+        self.assertEqual(random.random(), expected)
+        response = self.client.get('/api/ready')
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content)
+        self.assertEqual(data['status'], 'ready')
+        self.assertEqual(
+            set(data['timings']),
+            {'imports', 'constraint_profiles', 'travel_time_provider', 'synthetic_schedule'}
+        )
+
+    def test_warmup_in_event_loop_and_after_fork(self):
+        import asyncio
+        import threading
+        from .services import warmup
+
+        # ASGI服务器在运行中的事件循环里导入asgi.py时，sync模式的预热仍能完成
+        async def start_in_loop():
+            warmup.start_warmup('sync')
+
+        asyncio.run(start_in_loop())
+        self.assertEqual(warmup.state.status, 'ready')
+
+        # fork时仍在预热的子进程重新启动预热线程
+        warmup.state.update(status='warming')
+        warmup._restart_after_fork()
+        for thread in threading.enumerate():
+            if thread.name == 'travelplan-warmup':
+                thread.join()
+        self.assertEqual(warmup.state.status, 'ready')
+
+    def test_cluster_places_compact_request(self):
+        from .services.places import place_cache, to_compact_place
+
+        def place(place_id, lat, lng, types):
+            return {
+                'place_id': place_id,
+                'name': place_id.title(),
+                'geometry': {'location': {'lat': lat, 'lng': lng}},
+                'types': types,
+                'rating': 4.5,
+                'photos': [{'photo_reference': 'x' * 200}]
+            }
+
+        places = [
+            place('hotel', 48.8566, 2.3522, ['lodging']),
+            place('museum', 48.8606, 2.3376, ['museum', 'tourist_attraction']),
+            place('park', 48.8462, 2.3372, ['park', 'tourist_attraction']),
+            place('bistro', 48.8530, 2.3499, ['restaurant', 'food'])
+        ]
+        place_cache.clear()
+        place_cache.store_many(places[:3])
+        compact = [to_compact_place(p) for p in places]
+        compact[1]['duration'] = 100
+
+        response = self.client.post(
+            '/api/cluster-places/',
+            data=json.dumps({
+                'places': compact,
+                'startDate': '2024-01-01',
+                'endDate': '2024-01-01',
+                'transportMode': 'walking'
+            }),
+            content_type='application/json'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        events = {
+            event['place']['place_id']: event
+            for event in json.loads(response.content)['events']
+            if event.get('place', {}).get('place_id')
+        }
+        # 缓存中的地点还原为完整数据，未缓存的地点还原为兼容的最小数据
+        self.assertEqual(events['museum']['place'], places[1])
+        self.assertEqual(events['hotel']['place'], places[0])
+        self.assertEqual(
+            events['bistro']['place']['geometry'],
+            {'location': {'lat': 48.8530, 'lng': 2.3499}}
+        )
+        self.assertNotIn('photos', events['bistro']['place'])
+        self.assertEqual(events['museum']['startTime'], '09:00 AM')
+        self.assertEqual(events['museum']['endTime'], '10:40 AM')
+
+    def test_client_places_do_not_change_cached_places(self):
+        from .services.places import place_cache, to_compact_place
+
+        def place(place_id, name, lat, lng, types):
+            return {
+                'place_id': place_id,
+                'name': name,
+                'geometry': {'location': {'lat': lat, 'lng': lng}},
+                'types': types,
+                'rating': 4.5
+            }
+
+        upstream = [
+            place('hotel', 'Hotel', 48.8566, 2.3522, ['lodging']),
+            place('museum', 'Museum', 48.8606, 2.3376, ['museum', 'tourist_attraction'])
+        ]
+        park = place('park', 'Park', 48.8462, 2.3372, ['park', 'tourist_attraction'])
+        bistro = place('bistro', 'Bistro', 48.8530, 2.3499, ['restaurant', 'food'])
+        place_cache.clear()
+        place_cache.store_many(upstream)  # get_city_places的上游响应
+
+        def cluster(places):
+            response = self.client.post(
+                '/api/cluster-places/',
+                data=json.dumps({
+                    'places': places,
+                    'startDate': '2024-01-01',
+                    'endDate': '2024-01-01',
+                    'transportMode': 'walking'
+                }),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+            return {
+                event['place']['place_id']: event['place']
+                for event in json.loads(response.content)['events']
+                if event.get('place', {}).get('place_id')
+            }
+
+        # 一个客户端用完整格式提交篡改过的地点数据
+        tampered = [
+            dict(p, name='Tampered', photos=[{'photo_reference': 'evil'}])
+            for p in upstream + [park, bistro]
+        ]
+        cluster(tampered)
+
+        # 另一个客户端的精简格式请求仍得到上游数据或由自己的精简字段还原的数据
+        places = cluster([to_compact_place(p) for p in upstream + [park, bistro]])
+        self.assertEqual(places['museum'], upstream[1])
+        self.assertEqual(places['hotel'], upstream[0])
+        self.assertEqual(places['park']['name'], 'Park')
+        self.assertNotIn('photos', places['park'])
+
 class TravelPlanAsyncTest(TransactionTestCase):
     async def asyncSetUp(self):
         from django.test import AsyncClient
@@ -327,6 +743,109 @@ class ClusteringTestCase(TestCase):
         tourist_duration = PlaceConstraints.PLACE_DURATION['tourist_attraction']
         self.assertTrue(tourist_duration['min'] <= tourist_duration['default'] <= tourist_duration['max'])
 
+    def test_place_constraints_lookup_tables(self):
+        """测试按分钟预计算的用餐窗口查找表"""
+        from .services.clustering import PlaceConstraints, calculate_time_score
+        from datetime import time
+
+        # 查找表应与逐次计算的结果一致
+        lunch_window = PlaceConstraints.DINING_WINDOWS['lunch']
+        for minute in range(0, 24 * 60, 7):
+            t = time(minute // 60, minute % 60)
+            self.assertEqual(
+                PlaceConstraints.IS_LUNCH[minute],
+                lunch_window['start'] <= t <= lunch_window['end']
+            )
+            self.assertEqual(PlaceConstraints.LUNCH_SCORE[minute], calculate_time_score(t, lunch_window))
+        self.assertTrue(PlaceConstraints.IS_DINNER[18 * 60 + 30])
+        self.assertEqual(PlaceConstraints.DINNER_SCORE[18 * 60 + 30], 1.0)
+        self.assertEqual(PlaceConstraints.DAY_START, 9 * 60)
+        self.assertEqual(PlaceConstraints.DAY_END, 21 * 60)
+
+        # 修改用餐窗口后查找表应重建
+        original_windows = PlaceConstraints.DINING_WINDOWS
+        try:
+            PlaceConstraints.update(dining_windows={
+                'dinner': {'start': time(20, 0), 'end': time(23, 0), 'optimal': time(21, 30)}
+            })
+            self.assertFalse(PlaceConstraints.IS_DINNER[18 * 60 + 30])
+            self.assertTrue(PlaceConstraints.IS_DINNER[22 * 60])
+            self.assertEqual(PlaceConstraints.WINDOW_MINUTES['dinner']['optimal'], 21 * 60 + 30)
+            # 未修改的窗口保持不变
+            self.assertEqual(PlaceConstraints.DINING_WINDOWS['lunch'], original_windows['lunch'])
+        finally:
+            PlaceConstraints.DINING_WINDOWS = original_windows
+            PlaceConstraints.rebuild_tables()
+
+    def test_constraint_profiles(self):
+        """测试按id获取的约束配置"""
+        from .services.clustering import get_constraint_profile
+
+        # 默认配置就是PlaceConstraints
+        self.assertIs(get_constraint_profile(), PlaceConstraints)
+        self.assertIs(get_constraint_profile('default'), PlaceConstraints)
+
+        profile = get_constraint_profile('late_riser')
+        self.assertIs(get_constraint_profile('late_riser'), profile)
+        self.assertEqual(profile.DAY_START, 10 * 60 + 30)
+        self.assertTrue(profile.IS_LUNCH[14 * 60 + 30])
+        self.assertFalse(PlaceConstraints.IS_LUNCH[14 * 60 + 30])
+        # 未覆盖的配置取自PlaceConstraints
+        self.assertEqual(profile.PLACE_DURATION['museum']['default'], 180)
+
+        # 配置不可修改
+        with self.assertRaises(AttributeError):
+            profile.DAY_START = 0
+        with self.assertRaises(TypeError):
+            profile.DAY_CONSTRAINTS['start'] = time(8, 0)
+
+        with self.assertRaises(ValueError):
+            get_constraint_profile('no_such_profile')
+
+    def test_visit_duration_model(self):
+        """测试访问时长模型的确定性和取值范围"""
+        from .services.clustering import VisitDurationModel
+
+        place_ids = [f'place{i}' for i in range(50)]
+        place_types = ['museum', 'park', 'restaurant', 'default', 'unknown'] * 10
+
+        model = VisitDurationModel(seed=1)
+        durations = model.durations(place_ids, place_types)
+        # 相同的(place_id, seed)总是得到相同的时长
+        np.testing.assert_array_equal(durations, VisitDurationModel(seed=1).durations(place_ids, place_types))
+        self.assertEqual(model.duration('place0', 'museum'), durations[0])
+        self.assertFalse(np.array_equal(durations, VisitDurationModel(seed=2).durations(place_ids, place_types)))
+
+        for duration, place_type in zip(durations, place_types):
+            config = PlaceConstraints.PLACE_DURATION.get(place_type, PlaceConstraints.PLACE_DURATION['default'])
+            self.assertTrue(config['min'] <= duration <= config['max'])
+
+        # 有历史数据的类型从历史时长中取值（并限制在配置范围内）
+        history_model = VisitDurationModel(seed=1, history={'museum': [130, 150, 500]})
+        museum_durations = history_model.durations(place_ids[:10], ['museum'] * 10)
+        self.assertTrue(set(museum_durations.tolist()) <= {130, 150, 240})
+
+    def test_preprocess_places_is_deterministic(self):
+        """测试相同输入的预处理结果相同"""
+        from .services.clustering import preprocess_places
+
+        places = [
+            {
+                'place_id': f'attr{i}',
+                'name': f'Attraction {i}',
+                'geometry': {'location': {'lat': 40.71 + i * 0.01, 'lng': -74.0}},
+                'types': ['museum' if i % 2 else 'park']
+            }
+            for i in range(6)
+        ]
+
+        first, _ = preprocess_places(places)
+        second, _ = preprocess_places(places)
+        self.assertEqual(
+            [p['visit_duration'] for p in first],
+            [p['visit_duration'] for p in second]
+        )
+
     def test_create_empty_restaurant(self):
         """测试虚拟餐厅创建"""
         from .services.clustering import create_empty_restaurant
@@ -1113,13 +1632,12 @@ class RoutingTestCase(TestCase):
             'rest1': 1
         }
 
-        # 测试在最佳用餐时间的评分
-        optimal_time = datetime.strptime('12:30', '%H:%M').time()
-        optimal_datetime = datetime.combine(datetime.today(), optimal_time)
+        # 测试在最佳用餐时间的评分（从午夜开始的分钟数）
+        optimal_minutes = 12 * 60 + 30
         
         optimal_score = calculate_place_score(
             test_place,
-            optimal_datetime,
+            optimal_minutes,
             prev_place,
             None,
             distance_matrix,
@@ -1127,12 +1645,11 @@ class RoutingTestCase(TestCase):
         )
         
         # 测试在非用餐时间的评分
-        bad_time = datetime.strptime('15:00', '%H:%M').time()
-        bad_datetime = datetime.combine(datetime.today(), bad_time)
+        bad_minutes = 15 * 60
         
         bad_score = calculate_place_score(
             test_place,
-            bad_datetime,
+            bad_minutes,
             prev_place,
             None,
             distance_matrix,
@@ -1204,10 +1721,10 @@ class RoutingTestCase(TestCase):
             self.assertIn('start_time', place)
             self.assertIn('end_time', place)
 
-        # 验证时间顺序
+        # 验证时间顺序（时间为从午夜开始的分钟数）
         for i in range(len(arranged_places) - 1):
-            curr_end = datetime.strptime(arranged_places[i]['end_time'].strftime('%H:%M'), '%H:%M')
-            next_start = datetime.strptime(arranged_places[i+1]['start_time'].strftime('%H:%M'), '%H:%M')
+            curr_end = int(arranged_places[i]['end_time'])
+            next_start = int(arranged_places[i+1]['start_time'])
             self.assertLessEqual(curr_end, next_start)
 
         # 验证评分是个正数
@@ -1231,8 +1748,8 @@ class RoutingTestCase(TestCase):
                         'vicinity': 'Test Location'
                     }
                 },
-                'start_time': time(9, 0),
-                'end_time': time(9, 0)
+                'start_time': 9 * 60,
+                'end_time': 9 * 60
             },
             {
                 'place': {
@@ -1245,8 +1762,8 @@ class RoutingTestCase(TestCase):
                         'vicinity': 'Test Location'
                     }
                 },
-                'start_time': time(10, 0),
-                'end_time': time(12, 0)
+                'start_time': 10 * 60,
+                'end_time': 12 * 60
             }
         ]
 
@@ -1336,10 +1853,9 @@ class RoutingTestCase(TestCase):
         """计算总交通时间（分钟）"""
         total_time = 0
         for i in range(len(arranged_places) - 1):
-            curr_end = datetime.strptime(arranged_places[i]['end_time'].strftime('%H:%M'), '%H:%M')
-            next_start = datetime.strptime(arranged_places[i+1]['start_time'].strftime('%H:%M'), '%H:%M')
-            transit_time = (next_start - curr_end).total_seconds() / 60
-            total_time += transit_time
+            curr_end = int(arranged_places[i]['end_time'])
+            next_start = int(arranged_places[i+1]['start_time'])
+            total_time += next_start - curr_end
         return total_time
 
     def test_route_with_dining_windows(self):
@@ -1397,7 +1913,8 @@ class RoutingTestCase(TestCase):
         # 验证餐厅的访问时间是否在合适的时间窗口内
         for place in arranged_places:
             if place.get('place', {}).get('is_restaurant'):
-                start_time = datetime.strptime(place['start_time'].strftime('%H:%M'), '%H:%M').time()
+                start_minutes = int(place['start_time'])
+                start_time = time(start_minutes // 60, start_minutes % 60)
                 # 检查是否在午餐或晚餐时间窗口内
                 in_lunch = (PlaceConstraints.DINING_WINDOWS['lunch']['start'] <= start_time <= 
                           PlaceConstraints.DINING_WINDOWS['lunch']['end'])
@@ -1503,7 +2020,146 @@ class RoutingTestCase(TestCase):
         # 验证最小数据集的结果
         self.assertGreaterEqual(len(min_result), 2)  # 至少包含起点和终点
 
-    
+    def test_optimize_day_route_keeps_place_references(self):
+        """测试路线优化不复制地点数据且不重复安排餐厅"""
+        from .services.routing import optimize_day_route
+        from .services.utils import calculate_distance_matrix
+
+        hotel = {
+            'id': 'hotel1',
+            'place_id': 'hotel1',
+            'name': 'Test Hotel',
+            'location': {'lat': 40.7128, 'lng': -74.0060},
+            'type': 'hotel',
+            'is_hotel': True,
+            'visit_duration': 0
+        }
+
+        test_places = [
+            {
+                'id': f'attr{i}',
+                'place_id': f'attr{i}',
+                'name': f'Attraction {i}',
+                'location': {'lat': 40.7130 + i * 0.001, 'lng': -74.0062},
+                'type': 'tourist_attraction',
+                'is_restaurant': False,
+                'rating': 4.0,
+                'visit_duration': 60
+            }
+            for i in range(4)
+        ] + [
+            {
+                'id': f'rest{i}',
+                'place_id': f'rest{i}',
+                'name': f'Restaurant {i}',
+                'location': {'lat': 40.7129, 'lng': -74.0061 + i * 0.001},
+                'type': 'restaurant',
+                'is_restaurant': True,
+                'rating': 4.5,
+                'visit_duration': 75
+            }
+            for i in range(3)
+        ]
+
+        distance_matrix, _ = calculate_distance_matrix(test_places, 'walking')
+        arranged_places, _ = optimize_day_route(
+            test_places,
+            hotel,
+            distance_matrix,
+            'walking'
+        )
+
+        arranged = [e['place'] for e in arranged_places if not e['place'].get('is_hotel')]
+        # 安排的地点应该是原始对象本身
+        for place in arranged:
+            self.assertTrue(any(place is p for p in test_places))
+
+        # 每个地点最多被安排一次
+        arranged_ids = [p['place_id'] for p in arranged]
+        self.assertEqual(len(arranged_ids), len(set(arranged_ids)))
+
+    def test_optimize_day_route_with_constraint_profile(self):
+        """测试路线优化使用传入的约束配置"""
+        from .services.routing import optimize_day_route
+        from .services.clustering import get_constraint_profile
+        from .services.utils import calculate_distance_matrix
+
+        hotel = {
+            'id': 'hotel1',
+            'place_id': 'hotel1',
+            'name': 'Test Hotel',
+            'location': {'lat': 40.7128, 'lng': -74.0060},
+            'is_hotel': True,
+            'visit_duration': 0
+        }
+        test_places = [
+            {
+                'id': f'attr{i}',
+                'place_id': f'attr{i}',
+                'name': f'Attraction {i}',
+                'location': {'lat': 40.7130 + i * 0.001, 'lng': -74.0062},
+                'is_restaurant': False,
+                'rating': 4.0,
+                'visit_duration': 60
+            }
+            for i in range(3)
+        ]
+
+        profile = get_constraint_profile('late_riser')
+        distance_matrix, _ = calculate_distance_matrix(test_places, 'walking')
+        arranged_places, _ = optimize_day_route(
+            test_places,
+            hotel,
+            distance_matrix,
+            'walking',
+            profile
+        )
+
+        timed = [e for e in arranged_places if not e['place'].get('is_hotel')]
+        self.assertTrue(timed)
+        # 行程从配置的开始时间（10:30）之后开始
+        self.assertGreaterEqual(min(e['start_time'] for e in timed), profile.DAY_START)
+        self.assertGreaterEqual(profile.DAY_START, PlaceConstraints.DAY_START + 90)
+
+    def test_optimize_day_route_uses_time_matrix(self):
+        """测试路线在相邻地点之间留出时间矩阵中的交通时间"""
+        from .services.routing import optimize_day_route
+        from .services.utils import calculate_distance_matrix
+
+        hotel = {
+            'id': 'hotel1',
+            'place_id': 'hotel1',
+            'name': 'Test Hotel',
+            'location': {'lat': 48.8566, 'lng': 2.3522},
+            'is_hotel': True,
+            'visit_duration': 0
+        }
+        test_places = [
+            {
+                'id': f'attr{i}',
+                'place_id': f'attr{i}',
+                'name': f'Attraction {i}',
+                'location': {'lat': 48.8566 + i * 0.002, 'lng': 2.3522},
+                'is_restaurant': False,
+                'rating': 4.0,
+                'visit_duration': 30
+            }
+            for i in range(3)
+        ]
+
+        distance_matrix, time_matrix = calculate_distance_matrix(test_places, 'walking')
+        # 模拟道路图提供者：时间与直线距离的估算不同
+        time_matrix = time_matrix * 2
+        arranged_places, _ = optimize_day_route(
+            test_places, hotel, distance_matrix, 'walking', time_matrix=time_matrix
+        )
+
+        indices = {p['place_id']: i for i, p in enumerate(test_places)}
+        timed = [e for e in arranged_places if not e['place'].get('is_hotel')]
+        self.assertEqual(len(timed), 3)
+        for prev, current in zip(timed, timed[1:]):
+            leg = time_matrix[indices[prev['place']['place_id']]][indices[current['place']['place_id']]]
+            self.assertAlmostEqual(current['start_time'] - prev['end_time'], leg)
 
     def test_clustering_with_only_restaurants(self):
         """测试只有餐厅的情况"""
@@ -1639,6 +2295,48 @@ class RoutingTestCase(TestCase):
             ])
         self.assertEqual(len(set(all_used_restaurants)), len(test_places))
 
+    def test_restaurant_assignment_by_proximity(self):
+        """测试餐厅按每天景点的位置分配"""
+        from .services.assignment import assign_restaurants
+        from .services.clustering import hierarchical_clustering
+
+        def place(place_id, lat, lng, is_restaurant):
+            return {
+                'id': place_id,
+                'place_id': place_id,
+                'name': place_id,
+                'location': {'lat': lat, 'lng': lng},
+                'is_restaurant': is_restaurant,
+                'rating': 4.0,
+                'visit_duration': 75 if is_restaurant else 90
+            }
+
+        # 两组相距较远的景点，每组附近各有两家餐厅；餐厅按交替顺序排列
+        attractions = [place(f'north{i}', 48.90 + i * 0.002, 2.35, False) for i in range(2)]
+        attractions += [place(f'south{i}', 48.80 + i * 0.002, 2.35, False) for i in range(2)]
+        restaurants = [
+            place('rest_north0', 48.901, 2.351, True),
+            place('rest_south0', 48.801, 2.351, True),
+            place('rest_north1', 48.902, 2.349, True),
+            place('rest_south1', 48.802, 2.349, True)
+        ]
+
+        clusters = hierarchical_clustering(attractions + restaurants, 2, 'walking')
+        for cluster in clusters:
+            areas = {p['place_id'].split('_')[-1].rstrip('01') for p in cluster}
+            self.assertEqual(len(areas), 1, f"Day mixes areas: {[p['place_id'] for p in cluster]}")
+            self.assertEqual(len([p for p in cluster if p.get('is_restaurant')]), 2)
+
+        # 餐厅多于名额时每天名额均衡，且所有餐厅都被分配
+        place_clusters = [attractions[:2], attractions[2:]]
+        more_restaurants = restaurants + [place('rest_north2', 48.903, 2.35, True)]
+        assigned = assign_restaurants(more_restaurants, place_clusters, 2)
+        self.assertEqual(sorted(len(day) for day in assigned), [2, 3])
+        self.assertEqual(sum(len(day) for day in assigned), len(more_restaurants))
+
+        with self.assertRaises(ValueError):
+            assign_restaurants(restaurants, place_clusters, 2, 'unknown')
+
     def test_preprocess_places(self):
         """测试地点数据预处理"""
         from .services.clustering import preprocess_places
@@ -1859,4 +2557,288 @@ class RoutingTestCase(TestCase):
         self.assertEqual(metrics['total_places'], 2)
         self.assertEqual(metrics['total_travel_time'], 50)
         self.assertEqual(metrics['restaurants'], 1)
-        self.assertEqual(metrics['attractions'], 1)
\ No newline at end of file
+        self.assertEqual(metrics['attractions'], 1)
+
+class TimingTestCase(TestCase):
+    def test_stage_timer_accumulates(self):
+        """测试同名阶段的耗时累加"""
+        from .services.timing import StageTimer
+
+        timer = StageTimer()
+        with timer.stage('routing'):
+            pass
+        first = timer.timings['routing']
+        with timer.stage('routing'):
+            pass
+
+        timings = timer.as_dict()
+        self.assertGreaterEqual(timer.timings['routing'], first)
+        self.assertEqual(set(timings), {'routing', 'total'})
+        self.assertGreaterEqual(timings['total'], timings['routing'])
+
+    def test_histogram_snapshot(self):
+        """测试直方图的累计桶计数"""
+        from .services.timing import Histogram
+
+        histogram = Histogram(buckets=(1, 10))
+        for value in (0.5, 1, 5, 50):
+            histogram.observe(value)
+
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot['buckets'], [(1, 2), (10, 3), (float('inf'), 4)])
+        self.assertEqual(snapshot['count'], 4)
+        self.assertAlmostEqual(snapshot['sum'], 56.5)
+
+    def test_generate_schedule_timings(self):
+        """测试debug模式返回各阶段耗时，否则记录到直方图"""
+        import asyncio
+        from .services.timing import reset_stage_histograms, stage_histograms
+
+        def place(place_id, lat, lng, types):
+            return {
+                'place_id': place_id,
+                'name': place_id,
+                'geometry': {'location': {'lat': lat, 'lng': lng}},
+                'types': types,
+                'rating': 4.5
+            }
+
+        places = [
+            place('hotel', 48.8566, 2.3522, ['lodging']),
+            place('museum', 48.8606, 2.3376, ['museum', 'tourist_attraction']),
+            place('park', 48.8462, 2.3372, ['park', 'tourist_attraction']),
+            place('bistro', 48.8530, 2.3499, ['restaurant', 'food'])
+        ]
+        service = ScheduleService()
+
+        result = asyncio.run(service.generate_schedule(
+            places, '2024-01-01', '2024-01-01', 'walking', debug=True
+        ))
+        self.assertTrue(result['success'])
+        for stage in ('preprocess', 'distance_matrix', 'clustering', 'routing',
+                      'day_schedule', 'combine', 'reasonability', 'total'):
+            self.assertIn(stage, result['timings'])
+            self.assertGreaterEqual(result['timings'][stage], 0)
+
+        reset_stage_histograms()
+        result = asyncio.run(service.generate_schedule(
+            places, '2024-01-01', '2024-01-01', 'walking'
+        ))
+        self.assertNotIn('timings', result)
+        histograms = stage_histograms()
+        self.assertEqual(histograms['total']['count'], 1)
+        self.assertEqual(histograms['routing']['count'], 1)
+
+
+class ResponsesTestCase(TestCase):
+    def setUp(self):
+        hotel = {'place_id': 'hotel', 'name': 'Hotel', 'vicinity': 'Center'}
+        lunch = {'name': 'Lunch Break', 'types': ['restaurant'], 'rating': 0}
+        self.events = [
+            {'id': 'day0-event0', 'type': 'place', 'day': 0, 'place': hotel},
+            {'id': 'day0-transit0', 'type': 'transit', 'day': 0, 'duration': 5},
+            {'id': 'day0-event1', 'type': 'place', 'day': 0, 'place': lunch},
+            {'id': 'day0-event2', 'type': 'place', 'day': 0, 'place': hotel},
+            {'id': 'day1-event0', 'type': 'place', 'day': 1, 'place': dict(hotel)},
+            {'id': 'day1-event1', 'type': 'place', 'day': 1, 'place': dict(lunch)}
+        ]
+
+    def test_dedupe_places_round_trip(self):
+        """测试地点去重到地点表及还原"""
+        from .responses import dedupe_places, inline_places
+
+        events, places = dedupe_places(self.events)
+
+        # 有place_id的地点按id去重，虚拟餐厅按对象去重
+        self.assertEqual(len(places), 3)
+        self.assertEqual(events[0]['placeId'], 'hotel')
+        self.assertEqual(events[3]['placeId'], 'hotel')
+        self.assertNotEqual(events[2]['placeId'], events[5]['placeId'])
+        self.assertNotIn('placeId', events[1])
+        self.assertTrue(all('place' not in event for event in events))
+        self.assertIn('place', self.events[0])
+
+        self.assertEqual(inline_places(events, places), self.events)
+
+    def test_negotiate_encoding(self):
+        """测试Accept-Encoding协商"""
+        from .responses import negotiate_encoding
+
+        self.assertEqual(negotiate_encoding('gzip, deflate'), 'gzip')
+        self.assertEqual(negotiate_encoding('*'), 'gzip')
+        self.assertIsNone(negotiate_encoding(''))
+        self.assertIsNone(negotiate_encoding('gzip;q=0, identity'))
+
+    def test_schedule_response(self):
+        """测试压缩的地点表格式响应"""
+        import gzip
+        from django.test import RequestFactory
+        from .responses import inline_places, schedule_response
+
+        result = {'success': True, 'events': self.events * 20, 'metrics': {'total_places': 100}}
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+
+        response = schedule_response(request, result, 'table')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data['metrics'], result['metrics'])
+        self.assertEqual(inline_places(data['events'], data['places']), result['events'])
+
+        response = schedule_response(RequestFactory().get('/'), result)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(json.loads(response.content), result)
+
+
+class ReasonabilityTestCase(TestCase):
+    def setUp(self):
+        self.processed_places = [{'place_id': 'museum'}, {'place_id': 'park'}]
+        self.clusters = [
+            [{'place_id': 'museum'}],
+            [{'place_id': 'park'}],
+            [{'is_empty': True}]
+        ]
+        self.schedule = [
+            {'type': 'place', 'day': 0, 'startTime': '', 'endTime': '', 'place': {'place_id': 'hotel'}},
+            {'type': 'place', 'day': 0, 'startTime': '07:00 PM', 'endTime': '10:30 PM',
+             'place': {'place_id': 'museum'}},
+            {'type': 'transit', 'day': 0, 'startTime': '10:30 PM', 'endTime': '10:45 PM'},
+            {'type': 'place', 'day': 1, 'startTime': '09:00 AM', 'endTime': '11:00 AM',
+             'place': {'name': 'Lunch Break'}}
+        ]
+
+    def test_builtin_rules(self):
+        """测试空天数、未安排地点和超时天数的检查"""
+        from .services.reasonability import check_schedule_reasonability
+
+        status = check_schedule_reasonability(self.processed_places, self.clusters, self.schedule)
+
+        self.assertEqual(
+            [warning['type'] for warning in status['warnings']],
+            ['empty_days', 'unscheduled_places', 'overtime_days']
+        )
+        self.assertEqual(status['severity'], 'severe')
+        self.assertIn('1 places could not be scheduled', status['warnings'][1]['message'])
+        self.assertIn('1 days exceed', status['warnings'][2]['message'])
+
+    def test_register_rule(self):
+        """测试注册的规则在同一次遍历中收集统计"""
+        from .services import reasonability
+
+        def visit(event, facts):
+            if event.get('type') == 'transit':
+                facts.data['transits'] = facts.data.get('transits', 0) + 1
+
+        def evaluate(facts):
+            if facts.data.get('transits', 0) < 2:
+                return {'type': 'few_transits', 'message': 'Few transits', 'suggestion': ''}
+            return None
+
+        rules = list(reasonability.REASONABILITY_RULES)
+        try:
+            reasonability.register_reasonability_rule('few_transits', 'warning', evaluate, visit)
+            status = reasonability.check_schedule_reasonability(
+                self.processed_places, self.clusters[:2], self.schedule[:3]
+            )
+        finally:
+            reasonability.REASONABILITY_RULES[:] = rules
+
+        self.assertEqual(
+            [warning['type'] for warning in status['warnings']],
+            ['unscheduled_places', 'overtime_days', 'few_transits']
+        )
+        self.assertEqual(status['severity'], 'severe')
+
+class TravelTimeTestCase(TestCase):
+    def setUp(self):
+        import tempfile
+        from .services.travel_time import RoadGraph
+
+        # 0-1-2-3组成U形道路：0和3直线距离很近，但道路需要绕行；节点4不连通
+        self.nodes = [
+            (48.8500, 2.3500), (48.8600, 2.3500), (48.8600, 2.3520), (48.8500, 2.3520),
+            (48.8550, 2.3600)
+        ]
+        self.graph_dir = tempfile.TemporaryDirectory()
+        RoadGraph.from_edges(self.nodes, [0, 1, 2], [1, 2, 3]).save(f'{self.graph_dir.name}/test')
+
+    def tearDown(self):
+        self.graph_dir.cleanup()
+
+    def make_place(self, index, **fields):
+        lat, lng = self.nodes[index]
+        return {'place_id': f'node{index}', 'location': {'lat': lat, 'lng': lng}, **fields}
+
+    def test_road_graph_provider(self):
+        """测试道路图的内存映射加载、批量最短路径和不可达时的回退"""
+        from .services.travel_time import RoadGraphProvider
+        from .services.utils import TRANSPORT_SPEEDS, calculate_travel_time, haversine_distance
+
+        provider = RoadGraphProvider(self.graph_dir.name)
+        places = [self.make_place(i) for i in (0, 3, 4)]
+        distance_matrix, time_matrix = provider.matrix(places, 'walking')
+        self.assertIsInstance(provider.graph('test').lengths, np.memmap)
+
+        def straight(i, j):
+            return haversine_distance(*self.nodes[i], *self.nodes[j])
+
+        road = straight(0, 1) + straight(1, 2) + straight(2, 3)
+        self.assertAlmostEqual(distance_matrix[0][1], road, places=3)
+        self.assertAlmostEqual(distance_matrix[1][0], road, places=3)
+        self.assertGreater(distance_matrix[0][1], 5 * straight(0, 3))
+        self.assertEqual(time_matrix[0][1], calculate_travel_time(road / 1000, 'walking', factor=1.0))
+
+        # 不可达的节点按直线距离乘以路程系数估算
+        self.assertAlmostEqual(
+            distance_matrix[0][2], straight(0, 4) * TRANSPORT_SPEEDS['walking']['factor'], places=3
+        )
+        self.assertEqual(time_matrix[0][2], calculate_travel_time(straight(0, 4) / 1000, 'walking'))
+
+        # limit内找不到路径时为inf；该结果不影响之后limit更大的查询
+        graph = provider.graph('test')
+        graph.clear_cache()
+        self.assertEqual(graph.shortest_paths([0], [3], limit=road / 2)[0][0], np.inf)
+        self.assertAlmostEqual(graph.shortest_paths([0], [3])[0][0], road, places=3)
+        self.assertEqual(graph.shortest_paths([0], [3], limit=road / 2)[0][0], np.inf)
+        graph.clear_cache()
+        provider.matrix(places, 'walking')
+
+        # 再次查询命中节点对缓存，结果相同
+        cached_matrix, _ = provider.matrix(places[:2], 'walking')
+        np.testing.assert_array_equal(cached_matrix, distance_matrix[:2, :2])
+
+        # 不在道路图范围内的地点使用直线距离
+        far_away = [self.make_place(0), {'place_id': 'far', 'location': {'lat': 40.0, 'lng': -74.0}}]
+        self.assertIsNone(provider.find_graph(far_away))
+        fallback_matrix, _ = provider.matrix(far_away, 'walking')
+        self.assertEqual(fallback_matrix[0][1], haversine_distance(48.85, 2.35, 40.0, -74.0))
+
+    def test_calculate_distance_matrix_provider(self):
+        """测试距离矩阵使用配置的出行时间提供者，且酒店相关的路段为0"""
+        from .services import travel_time
+        from .services.utils import calculate_distance_matrix
+
+        places = [self.make_place(0, is_hotel=True), self.make_place(1), self.make_place(3)]
+        provider = travel_time.RoadGraphProvider(self.graph_dir.name)
+        distance_matrix, time_matrix = calculate_distance_matrix(places, 'walking', provider=provider)
+        self.assertTrue((distance_matrix[0] == 0).all() and (time_matrix[:, 0] == 0).all())
+        self.assertGreater(distance_matrix[1][2], 0)
+
+        with self.settings(TRAVEL_TIME_PROVIDER='test_road_graph'):
+            travel_time.register_travel_time_provider('test_road_graph', lambda: provider)
+            try:
+                configured_matrix, _ = calculate_distance_matrix(places, 'walking')
+            finally:
+                travel_time.TRAVEL_TIME_PROVIDERS.pop('test_road_graph')
+                travel_time._providers.pop('test_road_graph', None)
+        np.testing.assert_array_equal(configured_matrix, distance_matrix)
+
+        with self.assertRaises(ValueError):
+            travel_time.get_travel_time_provider('unknown')
+
+        # 未实现matrix()的提供者在实例化时即报错
+        class IncompleteProvider(travel_time.TravelTimeProvider):
+            pass
+
+        with self.assertRaises(TypeError):
+            IncompleteProvider()
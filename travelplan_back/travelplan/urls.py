@@ -8,4 +8,7 @@ urlpatterns = [
     path('cluster-places/', views.cluster_places, name='cluster_places'),
     path('update-schedule/', views.update_schedule, name='update_schedule'),
     path('export-calendar/', views.export_calendar, name='export_calendar'),
+    path('calendar/<str:digest>.ics', views.calendar_by_hash, name='calendar_by_hash'),
+    path('metrics', views.metrics, name='metrics'),
+    path('ready', views.ready, name='ready'),
 ]
\ No newline at end of file
@@ -5,12 +5,11 @@ from django.views.decorators.csrf import csrf_exempt
 import requests
 import json
 import logging
+import time
 from django.conf import settings
-from sklearn.cluster import KMeans
-import numpy as np
-from datetime import datetime, timedelta
-from icalendar import Calendar, Event
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_etags
 
 
 logger = logging.getLogger(__name__)
@@ -21,11 +20,30 @@ GOOGLE_MAPS_HOST = "google-map-places.p.rapidapi.com"
 TRUEWAY_MATRIX_HOST = "trueway-matrix.p.rapidapi.com"
 
 
+from .responses import PLACES_FORMATS, inline_places, schedule_response
 from .services import schedule_service  # 从 __init__.py 导入实例
+from .services.calendar_export import calendar_cache, calendar_hash, iter_calendar, normalize_trips
+from .services.clustering import get_constraint_profile
+from .services.metrics import CONTENT_TYPE, REGISTRY, instrument_view, record_upstream
+from .services.places import place_cache, rehydrate_events
+from .services.warmup import state as warmup_state
+
+
+def _rapidapi_get(api: str, url: str, **kwargs):
+    """调用RapidAPI并记录耗时和失败次数"""
+    start = time.perf_counter()
+    try:
+        response = requests.get(url, **kwargs)
+    except Exception:
+        record_upstream(api, time.perf_counter() - start)
+        raise
+    record_upstream(api, time.perf_counter() - start, response.status_code)
+    return response
 
 
 
 @csrf_exempt
+@instrument_view('search_city')
 def search_city(request):
     if request.method == 'POST':
         try:
@@ -41,7 +59,8 @@ def search_city(request):
             }
 
             # 查看API文档，我发现可以使用不同的端点来搜索地理位置
-            response = requests.get(
+            response = _rapidapi_get(
+                'geodb_places',
                 f'https://{GEODB_HOST}/v1/geo/places',  # 使用 places 端点而不是 cities
                 headers=headers,
                 params={
@@ -98,6 +117,7 @@ def search_city(request):
             return JsonResponse({'error': str(e)}, status=500)
 
 @csrf_exempt
+@instrument_view('get_city_places')
 def get_city_places(request):
     if request.method == 'POST':
         try:
@@ -128,7 +148,8 @@ def get_city_places(request):
                 "language": "en"
             }
             
-            geocode_response = requests.get(
+            geocode_response = _rapidapi_get(
+                'google_maps_geocode',
                 geocode_url,
                 headers=headers,
                 params=geocode_params
@@ -164,7 +185,8 @@ def get_city_places(request):
                     "keyword": "restaurant",
                     "language": "en"
                 }
-                restaurants_response = requests.get(
+                restaurants_response = _rapidapi_get(
+                    'google_maps_nearbysearch',
                     nearby_url,
                     headers=headers,
                     params=restaurants_params
@@ -191,7 +213,8 @@ def get_city_places(request):
                     "type": "tourist_attraction",
                     "language": "en"
                 }
-                attractions_response = requests.get(
+                attractions_response = _rapidapi_get(
+                    'google_maps_nearbysearch',
                     nearby_url,
                     headers=headers,
                     params=attractions_params
@@ -217,7 +240,8 @@ def get_city_places(request):
                     "type": "lodging",
                     "language": "en"
                 }
-                hotels_response = requests.get(
+                hotels_response = _rapidapi_get(
+                    'google_maps_nearbysearch',
                     nearby_url,
                     headers=headers,
                     params=hotels_params
@@ -235,6 +259,10 @@ def get_city_places(request):
             except Exception as e:
                 logger.error(f"Error fetching hotels: {str(e)}")
 
+            # 缓存完整的地点数据，之后的精简格式请求可以据此还原响应
+            for items in places_data.values():
+                place_cache.store_many(items)
+
             # 检查是否获取到任何数据
             if not any(places_data.values()):
                 logger.error("No data found in any category")
@@ -297,6 +325,7 @@ async def _fetch_places(places_data, lat, lng, place_type, category, headers):
 
 
 @csrf_exempt
+@instrument_view('cluster_places')
 async def cluster_places(request):
     """生成行程endpoint"""
     if request.method == 'POST':
@@ -306,24 +335,43 @@ async def cluster_places(request):
             start_date = data.get('startDate')
             end_date = data.get('endDate')
             transport_mode = data.get('transportMode', 'driving')
+            constraint_profile = data.get('constraintProfile')
+            debug = bool(data.get('debug'))
+            places_format = data.get('placesFormat', 'inline')
             
             if not all([places, start_date, end_date]):
                 return JsonResponse({
                     'error': 'Missing required parameters'
                 }, status=400)
 
+            try:
+                get_constraint_profile(constraint_profile)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            if places_format not in PLACES_FORMATS:
+                return JsonResponse({'error': f'Unknown places format: {places_format}'}, status=400)
+
+            # 精简格式（id、lat、lng、types等）的地点由服务端还原。缓存只由get_city_places
+            # 的上游响应填充，客户端提交的完整格式地点不写入缓存，以免影响其他请求
+
             # 使用schedule_service生成行程
             result = await schedule_service.generate_schedule(
                 places=places,
                 start_date=start_date,
                 end_date=end_date,
-                transport_mode=transport_mode
+                transport_mode=transport_mode,
+                constraint_profile=constraint_profile,
+                debug=debug
             )
-
             if result['success']:
-                return JsonResponse(result)
-            else:
-                return JsonResponse(result, status=500)
+                rehydrate_events(result['events'])
+
+            return schedule_response(
+                request,
+                result,
+                places_format,
+                status=200 if result['success'] else 500
+            )
 
         except Exception as e:
             logger.error(f"Error in cluster_places: {str(e)}")
@@ -335,6 +383,7 @@ async def cluster_places(request):
     return JsonResponse({'error': 'Invalid request method'}, status=405)
 
 @csrf_exempt
+@instrument_view('update_schedule')
 async def update_schedule(request):
     """更新行程endpoint（用于手动模式）"""
     if request.method == 'POST':
@@ -342,6 +391,13 @@ async def update_schedule(request):
             data = json.loads(request.body)
             events = data.get('events', [])
             transport_mode = data.get('transportMode', 'driving')
+            places_format = data.get('placesFormat', 'inline')
+
+            if places_format not in PLACES_FORMATS:
+                return JsonResponse({'error': f'Unknown places format: {places_format}'}, status=400)
+            # 使用地点表格式的客户端回传的事件通过placeId引用地点
+            if 'places' in data:
+                events = inline_places(events, data['places'])
 
             if not events:
                 return JsonResponse({
@@ -354,10 +410,12 @@ async def update_schedule(request):
                 transport_mode=transport_mode
             )
 
-            if result['success']:
-                return JsonResponse(result)
-            else:
-                return JsonResponse(result, status=500)
+            return schedule_response(
+                request,
+                result,
+                places_format,
+                status=200 if result['success'] else 500
+            )
 
         except Exception as e:
             logger.error(f"Error in update_schedule: {str(e)}")
@@ -370,25 +428,44 @@ async def update_schedule(request):
 
 
 @csrf_exempt
+@instrument_view('optimize_route')
 async def optimize_route(request):
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
             events = data.get('events', [])
+            if 'places' in data:
+                events = inline_places(events, data['places'])
             transport_mode = data.get('transportMode', 'driving')
+            constraint_profile = data.get('constraintProfile')
+            debug = bool(data.get('debug'))
+            places_format = data.get('placesFormat', 'inline')
+
+            try:
+                get_constraint_profile(constraint_profile)
+            except ValueError as e:
+                return JsonResponse({'error': str(e)}, status=400)
+            if places_format not in PLACES_FORMATS:
+                return JsonResponse({'error': f'Unknown places format: {places_format}'}, status=400)
 
             # 使用与cluster_places相同的逻辑重新生成最优日程
             result = await schedule_service.generate_schedule(
                 places=[event['place'] for event in events if event.get('type') == 'place'],
                 start_date=data.get('startDate'),  # 需要从前端传入
                 end_date=data.get('endDate'),      # 需要从前端传入
-                transport_mode=transport_mode
+                transport_mode=transport_mode,
+                constraint_profile=constraint_profile,
+                debug=debug
             )
-
             if result['success']:
-                return JsonResponse(result)
-            else:
-                return JsonResponse(result, status=500)
+                rehydrate_events(result['events'])
+
+            return schedule_response(
+                request,
+                result,
+                places_format,
+                status=200 if result['success'] else 500
+            )
 
         except Exception as e:
             logger.error(f"Error in optimize_route: {str(e)}")
@@ -404,55 +481,79 @@ async def optimize_route(request):
 
 
 @csrf_exempt
+@instrument_view('export_calendar')
 def export_calendar(request):
+    """
+    导出ICS日历（流式输出）。请求可以是单个行程 {'events', 'startDate'}，
+    也可以是多个行程 {'trips': [{'events', 'startDate', 'name'}]}；
+    事件日期为startDate加上事件的day，未提供startDate时从今天开始。
+    渲染结果按内容哈希缓存，ETag为该哈希。日历缓存在worker间共享时（CALENDAR_CACHE_ALIAS），
+    Content-Location为可分享的GET地址。POST带有匹配的If-None-Match时返回412。
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            events = data.get('events', [])
-            
-            cal = Calendar()
-            cal.add('prodid', '-//Trip Planner//TripSchedule//EN')
-            cal.add('version', '2.0')
-            
-            # 使用传入的日期作为基准
-            for event in events:
-                if event.get('type') != 'place':  # 只处理地点事件
-                    continue
-                    
-                cal_event = Event()
-                cal_event.add('summary', event['title'])
-                
-                # 使用事件的day属性和时间来构建完整的日期时间
-                day_number = int(event['day'])
-                if event.get('startTime') and event.get('endTime'):
-                    start_time = datetime.strptime(event['startTime'], '%I:%M %p')
-                    end_time = datetime.strptime(event['endTime'], '%I:%M %p')
-                    
-                    base_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                    event_date = base_date + timedelta(days=day_number)
-                    
-                    start_datetime = event_date.replace(
-                        hour=start_time.hour,
-                        minute=start_time.minute
-                    )
-                    end_datetime = event_date.replace(
-                        hour=end_time.hour,
-                        minute=end_time.minute
-                    )
-                    
-                    cal_event.add('dtstart', start_datetime)
-                    cal_event.add('dtend', end_datetime)
-                
-                    if event.get('place'):
-                        cal_event.add('location', event['place'].get('vicinity', ''))
-                        cal_event.add('description', f"Rating: {event['place'].get('rating', 'N/A')}")
-                    
-                    cal.add_component(cal_event)
-            
-            response = HttpResponse(cal.to_ical(), content_type='text/calendar')
-            response['Content-Disposition'] = 'attachment; filename=trip-schedule.ics'
-            return response
-            
+            trips = normalize_trips(data)
+            digest = calendar_hash(trips)
         except Exception as e:
             logger.error(f"Error exporting calendar: {str(e)}")
-            return JsonResponse({'error': str(e)}, status=500)
\ No newline at end of file
+            return JsonResponse({'error': str(e)}, status=500)
+
+        if _etag_matches(request, digest):
+            # 304只用于GET/HEAD，其他方法的条件不满足时返回412（RFC 9110）
+            response = HttpResponse(status=412)
+        else:
+            content = calendar_cache.get(digest)
+            if content is not None:
+                response = HttpResponse(content, content_type='text/calendar')
+            else:
+                response = StreamingHttpResponse(
+                    calendar_cache.stream_and_store(digest, iter_calendar(trips)),
+                    content_type='text/calendar'
+                )
+            response['Content-Disposition'] = 'attachment; filename=trip-schedule.ics'
+        response['ETag'] = f'"{digest}"'
+        # 只有其他worker也能读取缓存时才提供分享地址
+        if calendar_cache.shared:
+            response['Content-Location'] = reverse('calendar_by_hash', args=[digest])
+        return response
+
+    return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+@instrument_view('calendar_by_hash')
+def calendar_by_hash(request, digest):
+    """按内容哈希获取已导出的日历（用于分享链接），缓存淘汰后返回404"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+
+    if _etag_matches(request, digest):
+        response = HttpResponseNotModified()
+    else:
+        content = calendar_cache.get(digest)
+        if content is None:
+            return JsonResponse({'error': 'Calendar not found, please export it again'}, status=404)
+        response = HttpResponse(content, content_type='text/calendar')
+        response['Content-Disposition'] = 'attachment; filename=trip-schedule.ics'
+    # 内容由哈希决定，同一地址的内容不会改变
+    response['ETag'] = f'"{digest}"'
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
+def _etag_matches(request, digest: str) -> bool:
+    etags = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    etags = [etag.removeprefix('W/') for etag in etags]
+    return '*' in etags or f'"{digest}"' in etags
+
+def metrics(request):
+    """Prometheus文本格式的指标endpoint"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    return HttpResponse(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+def ready(request):
+    """就绪检查endpoint，worker预热期间返回503"""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid request method'}, status=405)
+    status = warmup_state.as_dict()
+    return JsonResponse(status, status=200 if status['ready'] else 503)
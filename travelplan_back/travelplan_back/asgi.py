@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "travelplan_back.settings")
 
 application = get_asgi_application()
+
+# 只在服务器进程中预热worker
+from travelplan.services.warmup import start_server_warmup  # noqa: E402
+
+start_server_warmup()
@@ -54,6 +54,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "travelplan.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "travelplan_back.urls"
@@ -185,3 +186,44 @@ LOGGING = {
 
 # RapidAPI Key
 RAPIDAPI_KEY = "00de1500cemshe2bb85aa624a176p180547jsn4bb749af8f51"
+
+# 行程生成各阶段计时（关闭后不记录直方图；请求中debug为true时仍返回timings）
+SCHEDULE_STAGE_TIMING = True
+
+# 请求分析：带X-Travelplan-Profile请求头的api/请求会被采样分析，结果保存到PROFILING_DIR
+PROFILING_ENABLED = os.environ.get('TRAVELPLAN_PROFILING', '') == '1'
+PROFILING_TOKEN = os.environ.get('TRAVELPLAN_PROFILING_TOKEN')  # 设置后请求头的值必须与之相同
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MIN_INTERVAL = 60  # 两次分析之间的最小间隔（秒）
+PROFILING_SAMPLE_INTERVAL = 0.001  # 采样间隔（秒）
+PROFILING_KEEP = 100  # 最多保留的分析结果份数
+
+# worker预热模式：off（不预热）、sync（启动时阻塞至完成）、background（后台线程预热）。
+# 只在WSGI/ASGI服务器入口生效，manage.py命令、测试和评估脚本不预热
+WARMUP_MODE = os.environ.get('TRAVELPLAN_WARMUP', 'background')
+
+# 服务端地点缓存（按place_id保存完整的Google地点数据）的最大条目数
+PLACE_CACHE_SIZE = 10000
+
+# 按内容哈希缓存的日历导出（ICS）：进程内缓存的总字节数上限，单个日历最多占四分之一
+CALENDAR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 日历分享链接使用的Django缓存，需要所有worker都能读取；设为None时不提供分享链接
+CALENDAR_CACHE_ALIAS = 'calendar'
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # 同一台机器上的worker共享文件缓存；多台机器部署时改为Redis或Memcached等共享后端
+    'calendar': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('TRAVELPLAN_CALENDAR_CACHE_DIR', str(BASE_DIR / 'calendar_cache')),
+        'TIMEOUT': 30 * 24 * 60 * 60,  # 分享链接保留30天
+        'OPTIONS': {'MAX_ENTRIES': 5000}
+    }
+}
+
+# 出行距离和时间的来源：haversine（直线距离乘以路程系数）或road_graph（本地道路图，见services/travel_time.py）
+TRAVEL_TIME_PROVIDER = os.environ.get('TRAVELPLAN_TRAVEL_TIME_PROVIDER', 'haversine')
+ROAD_GRAPH_DIR = Path(os.environ.get('TRAVELPLAN_ROAD_GRAPH_DIR', BASE_DIR / 'road_graphs'))